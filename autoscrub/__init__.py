@@ -40,6 +40,16 @@ else:
 import math
 from functools import reduce
 import signal
+import threading
+import multiprocessing
+import tempfile
+import shutil
+import hashlib
+import json
+import bisect
+import codecs
+from array import array
+from collections import namedtuple
 
 
 NUL = os.devnull
@@ -48,32 +58,397 @@ class AutoscrubException(Exception):
     pass
 
     
-# setup signal handling to terminate subprocesses when
-# this process is terminated
-_previous_sigint = signal.getsignal(signal.SIGINT)
-_previous_sigterm = signal.getsignal(signal.SIGTERM)
-# _previous_sigkill = signal.getsignal(signal.SIGKILL)
-_process_list = []
-def _kill_autoscrub_processes(signum, frame):
-    for p in _process_list:
+class ProcessExecutor(object):
+    """Launches and tracks the ffmpeg and ffprobe processes run by autoscrub.
+    
+    The executor limits the number of processes that run at once (further 
+    processes wait for a running process to finish), terminates processes 
+    that run for longer than a timeout, and can lower the CPU and IO 
+    scheduling priority of the processes and restrict them to a set of CPUs.
+    
+    The first time a process is launched from the main thread, the executor
+    installs SIGINT and SIGTERM handlers that terminate the process group of
+    every running process before passing the signal on to the previously 
+    installed handler. If there was no previous handler, SIGINT raises 
+    :code:`KeyboardInterrupt` and SIGTERM raises :code:`SystemExit`, so 
+    :code:`finally` blocks and other cleanup code still run.
+    
+    Use :func:`autoscrub.set_executor` to change the executor used by 
+    autoscrub.
+    
+    Keyword Arguments:
+        max_concurrency: The maximum number of processes to run at once. 
+                         Defaults to :code:`None` (no limit). Note that 
+                         consuming a generator such as 
+                         :func:`autoscrub.iterSilences` holds a process slot
+                         until the generator finishes.
+                         
+        timeout: The maximum time (in seconds) each process may run for before
+                 it is terminated. Defaults to :code:`None` (no limit).
+                 
+        nice: The increment added to the niceness of each process (POSIX 
+              only). Defaults to :code:`None` (unchanged).
+              
+        ionice: The IO scheduling class of each process, as accepted by the
+                :code:`ionice -c` command (1: realtime, 2: best-effort, 
+                3: idle), or a :code:`(class, level)` tuple. Only applied if
+                the :code:`ionice` command is available. Defaults to 
+                :code:`None` (unchanged).
+                
+        cpu_affinity: A list of the CPUs the processes may run on (Linux 
+                      only). Defaults to :code:`None` (any CPU).
+                      
+        jobs: The number of autoscrub jobs expected to share the machine, used
+              by :func:`autoscrub.threadAllocation` to divide the CPU cores 
+              between them. Defaults to :code:`None` (one more than the 
+              number of processes running when each command is prepared, as
+              :code:`max_concurrency` is only an upper limit).
+    """
+    def __init__(self, max_concurrency=None, timeout=None, nice=None, ionice=None, cpu_affinity=None, jobs=None):
+        self.max_concurrency = max_concurrency
+        self.jobs = jobs
+        self.timeout = timeout
+        self.nice = nice
+        self.ionice = ionice
+        self.cpu_affinity = cpu_affinity
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        # reentrant, as the signal handler (which runs in the main thread, 
+        # possibly while it holds the lock) takes it in terminate_all
+        self._lock = threading.RLock()
+        self._processes = []
+        self._timers = {}
+        self._previous_handlers = None
+        
+    @property
+    def active_count(self):
+        """The number of processes currently running"""
+        with self._lock:
+            return len(self._processes)
+            
+    def _preexec(self):
+        # Runs in the child process before the command is executed
+        if self.nice:
+            os.nice(self.nice)
+        if self.cpu_affinity is not None and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, self.cpu_affinity)
+        
+    def popen(self, args, timeout=None, **kwargs):
+        """Launches a process (waiting for a free slot if 
+        :code:`max_concurrency` processes are already running). Arguments 
+        are passed to :code:`subprocess.Popen`. The process must be passed to
+        :meth:`autoscrub.ProcessExecutor.release` once it has finished.
+        
+        Keyword Arguments:
+            timeout: Overrides the timeout of the executor for this process.
+        """
+        self.install_signal_handlers()
+        
+        command = args
+        posix = not sys.platform.startswith('win')
+        if self.ionice is not None and posix and not isinstance(args, six.string_types):
+            ionice_path = shutil.which('ionice') if hasattr(shutil, 'which') else None
+            if ionice_path:
+                ionice = self.ionice if isinstance(self.ionice, (tuple, list)) else (self.ionice,)
+                command = [ionice_path, '-c', str(ionice[0])] + (['-n', str(ionice[1])] if len(ionice) > 1 else []) + list(args)
+        if posix and (self.nice or self.cpu_affinity is not None):
+            kwargs['preexec_fn'] = self._preexec
+            
+        if self._slots is not None:
+            self._slots.acquire()
         try:
-            p.terminate()
+            p = Popen(command, **kwargs)
         except Exception:
+            if self._slots is not None:
+                self._slots.release()
+            raise
+        p.autoscrub_executor = self
+        p.autoscrub_timed_out = False
+        with self._lock:
+            self._processes.append(p)
+            
+        if timeout is None:
+            timeout = self.timeout
+        if timeout:
+            timer = threading.Timer(timeout, self._timed_out, (p,))
+            timer.daemon = True
+            with self._lock:
+                self._timers[p] = timer
+            timer.start()
+        return p
+        
+    def release(self, p):
+        """Stops tracking a process that has finished and frees its slot"""
+        with self._lock:
+            if p not in self._processes:
+                return
+            self._processes.remove(p)
+            timer = self._timers.pop(p, None)
+        if timer is not None:
+            timer.cancel()
+        if self._slots is not None:
+            self._slots.release()
+            
+    def terminate(self, p):
+        """Terminates a process (and, on POSIX, its process group)"""
+        try:
+            if not sys.platform.startswith('win') and os.getpgid(p.pid) == p.pid:
+                os.killpg(p.pid, signal.SIGTERM)
+            else:
+                p.terminate()
+        except (OSError, ValueError):
+            # the process has already exited
             pass
+            
+    def terminate_all(self):
+        """Terminates all running processes"""
+        with self._lock:
+            processes = list(self._processes)
+        for p in processes:
+            self.terminate(p)
+            
+    def _timed_out(self, p):
+        p.autoscrub_timed_out = True
+        self.terminate(p)
+        
+    def install_signal_handlers(self):
+        """Installs the SIGINT and SIGTERM handlers (if not already installed).
+        This does nothing unless called from the main thread."""
+        if self._previous_handlers is not None or threading.current_thread().name != 'MainThread':
+            return
+        self._previous_handlers = {}
+        for signum in [signal.SIGINT, signal.SIGTERM]:
+            self._previous_handlers[signum] = signal.getsignal(signum)
+            signal.signal(signum, self._handle_signal)
+        
+    def _handle_signal(self, signum, frame):
+        self.terminate_all()
+        previous = self._previous_handlers.get(signum)
+        if callable(previous):
+            previous(signum, frame)
+        elif previous == signal.SIG_IGN:
+            return
+        elif signum == signal.SIGINT:
+            raise KeyboardInterrupt()
+        else:
+            raise SystemExit(128 + signum)
+            
+            
+_executor = ProcessExecutor()
+def get_executor():
+    """Returns the :class:`autoscrub.ProcessExecutor` used to launch ffmpeg 
+    and ffprobe."""
+    return _executor
+    
+def set_executor(executor):
+    """Sets the :class:`autoscrub.ProcessExecutor` used to launch ffmpeg and 
+    ffprobe.
+    
+    Arguments:
+        executor: The :class:`autoscrub.ProcessExecutor` to use.
+    """
+    global _executor
+    _executor = executor
+    
+    
+class SubprocessBackend(object):
+    """Runs the ffmpeg and ffprobe commands built by autoscrub as 
+    subprocesses (this is the default backend).
+    
+    A backend maps the program name at the start of each command 
+    (:code:`ffmpeg` or :code:`ffprobe`) to the executable that is run, and 
+    can add environment variables for the processes it launches. The 
+    processes are launched with the current 
+    :class:`autoscrub.ProcessExecutor`. Use :func:`autoscrub.set_backend` to
+    change the backend used by autoscrub (for example, to the stand-in 
+    executables of :class:`autoscrub.fakeffmpeg.FakeFFmpegBackend`).
+    
+    Keyword Arguments:
+        executables: A dictionary mapping program names to the executable to
+                     run instead, as a path or a list of arguments (for 
+                     example :code:`{'ffmpeg': '/opt/ffmpeg/bin/ffmpeg'}`).
+                     Programs that are not in the dictionary are run as 
+                     named. Defaults to :code:`None`.
+                     
+        env: A dictionary of environment variables to set for each process 
+             (in addition to the environment of this process). Defaults to
+             :code:`None`.
+    """
+    def __init__(self, executables=None, env=None):
+        self.executables = {}
+        for program, executable in (executables or {}).items():
+            self.executables[program] = [executable] if isinstance(executable, six.string_types) else list(executable)
+        self.env = dict(env) if env else None
+        
+    def command(self, command):
+        """Returns :code:`command` (a list of arguments or a string) with the
+        program replaced by its executable"""
+        if isinstance(command, six.string_types):
+            program, sep, rest = command.partition(' ')
+            if program in self.executables:
+                return list2cmdline(self.executables[program]) + sep + rest
+            return command
+        if command and command[0] in self.executables:
+            return self.executables[command[0]] + list(command[1:])
+        return command
+        
+    def popen(self, executor, command, *args, **kwargs):
+        """Launches :code:`command` with :code:`executor` (see 
+        :meth:`autoscrub.ProcessExecutor.popen`) and returns the process"""
+        if self.env:
+            env = dict(os.environ if kwargs.get('env') is None else kwargs['env'])
+            env.update(self.env)
+            kwargs['env'] = env
+        return executor.popen(self.command(command), *args, **kwargs)
+        
+        
+_backend = SubprocessBackend()
+def get_backend():
+    """Returns the backend (such as :class:`autoscrub.SubprocessBackend`) 
+    that runs ffmpeg and ffprobe commands."""
+    return _backend
+    
+def set_backend(backend):
+    """Sets the backend that runs ffmpeg and ffprobe commands.
+    
+    Arguments:
+        backend: The backend to use. Defaults to a 
+                 :class:`autoscrub.SubprocessBackend` with default settings
+                 if :code:`None`.
+    """
+    global _backend
+    _backend = SubprocessBackend() if backend is None else backend
+    
 
-    if signum == signal.SIGINT and _previous_sigint not in [None, signal.SIG_IGN, signal.SIG_DFL]:
-        _previous_sigint(signum, frame)
-    if signum == signal.SIGTERM and _previous_sigterm not in [None, signal.SIG_IGN, signal.SIG_DFL]:
-        _previous_sigterm(signum, frame)
-    # if signum == signal.SIGKILL and _previous_sigkill not in [None, signal.SIG_IGN, signal.SIG_DFL]:
-        # _previous_sigkill(signum, frame)
+def threadAllocation(jobs=None, cpu_count=None):
+    """Divides the CPU cores between concurrent ffmpeg jobs.
+    
+    By default, each ffmpeg decoder, filtergraph and libx264 encoder starts a
+    thread for every core, so running several jobs at once oversubscribes 
+    the CPU. This function calculates the threads each part of a job should
+    use so that the jobs share the cores instead.
+    
+    Keyword Arguments:
+        jobs: The number of concurrent jobs. Defaults to :code:`None` (the 
+              :code:`jobs` setting of the :class:`autoscrub.ProcessExecutor`,
+              or one more than the number of processes it is currently 
+              running). Jobs in other processes (such as other autoscrub
+              commands) are not counted, so pass :code:`jobs` (or set it
+              on the executor) when several run at once.
+              
+        cpu_count: The number of available cores. Defaults to :code:`None` 
+                   (the cores in the :code:`cpu_affinity` of the executor, or
+                   the cores this process may run on).
+                   
+    Returns:
+        A dictionary containing the number of cores assigned to each job 
+        (:code:`cores`) and the thread counts to use for decoding 
+        (:code:`decode_threads`), filtering (:code:`filter_threads`), encoding
+        (:code:`encode_threads`) and the x264 lookahead 
+        (:code:`lookahead_threads`).
+    """
+    if jobs is None:
+        jobs = _executor.jobs or (_executor.active_count + 1)
+    if cpu_count is None:
+        if _executor.cpu_affinity:
+            cpu_count = len(_executor.cpu_affinity)
+        elif hasattr(os, 'sched_getaffinity'):
+            cpu_count = len(os.sched_getaffinity(0))
+        else:
+            cpu_count = multiprocessing.cpu_count()
+    cores = max(1, int(cpu_count) // max(1, int(jobs)))
+    # Encoding dominates the work, so the encoder gets every core of the job
+    # while decoding and filtering share half of them.
+    return {'cores': cores,
+            'decode_threads': max(1, cores // 2),
+            'filter_threads': max(1, cores // 2),
+            'encode_threads': cores,
+            'lookahead_threads': max(1, cores // 6),
+            }
+            
+def _thread_args(threads, stage='encode', codec='libx264'):
+    """Returns the (input, output) ffmpeg arguments for a thread allocation. 
+    
+    threads is a dictionary returned by threadAllocation, None (calculate a
+    new allocation) or False (no arguments). stage is 'encode' for a command
+    that runs a filter_complex and encodes the result, 'transcode' for a 
+    command that encodes without filtering or 'analyse' for a command that 
+    runs audio filters and discards the result. codec is the video encoder."""
+    if threads is False:
+        return [], []
+    if threads is None:
+        threads = threadAllocation()
+    if stage == 'analyse':
+        return ['-filter_threads', '1', '-threads', str(threads['decode_threads'])], []
+    output_args = ['-threads', str(threads['encode_threads'])]
+    if stage == 'encode':
+        output_args += ['-filter_complex_threads', str(threads['filter_threads'])]
+    if codec == 'libx264':
+        output_args += ['-x264-params', 'lookahead-threads=%d' % threads['lookahead_threads']]
+    return ['-threads', str(threads['decode_threads'])], output_args
+    
+_library_index = None
+def set_library_index(index):
+    """Sets the library index that :func:`autoscrub.getDuration`, 
+    :func:`autoscrub.getSampleRate`, :func:`autoscrub.getLoudness` and 
+    :func:`autoscrub.getSilences` read their results from (if the file has
+    been indexed) instead of running ffprobe or ffmpeg.
+    
+    Arguments:
+        index: A :class:`autoscrub.index.LibraryIndex`, or :code:`None` to 
+               stop using an index.
+    """
+    global _library_index
+    _library_index = index
+    
+def get_library_index():
+    """Returns the library index set with 
+    :func:`autoscrub.set_library_index`, or :code:`None`"""
+    return _library_index
+    
+def _indexed_media(filename):
+    """Returns the indexed media dictionary of filename, or None"""
+    if _library_index is None:
+        return None
+    try:
+        return _library_index.media(filename)
+    except Exception:
+        return None
         
-    # force terminate
-    os._exit(1) 
+_libav = None
+def use_libav(enable=True):
+    """Sets whether probing, silence detection, keyframe listing and stream 
+    copy trimming use the libav libraries in this process (through PyAV, see
+    :mod:`autoscrub.avbackend`) instead of running ffprobe or ffmpeg. 
+    
+    If an operation fails with libav (for example, because PyAV can't open 
+    the file), ffprobe or ffmpeg is run instead.
+    
+    Keyword Arguments:
+        enable: Whether to use libav (default True).
         
-signal.signal(signal.SIGINT, _kill_autoscrub_processes)
-signal.signal(signal.SIGTERM, _kill_autoscrub_processes)
-# signal.signal(signal.SIGKILL, _kill_autoscrub_processes)
+    Raises:
+        AutoscrubException: If :code:`enable` is :code:`True` and PyAV or 
+                            numpy is not installed.
+    """
+    global _libav
+    if not enable:
+        _libav = None
+        return
+    from autoscrub import avbackend
+    if not avbackend.available():
+        raise AutoscrubException('[autoscrub:error] The libav backend requires PyAV and numpy. Install them with: pip install autoscrub[libav]')
+    _libav = avbackend
+    
+def _libav_call(name, *args, **kwargs):
+    """Calls the function name of :mod:`autoscrub.avbackend` if libav is 
+    enabled. Returns a tuple of whether it succeeded and its result."""
+    if _libav is None:
+        return False, None
+    try:
+        return True, getattr(_libav, name)(*args, **kwargs)
+    except Exception as e:
+        print('[autoscrub:warning] libav failed ({}), falling back to ffmpeg'.format(e))
+        return False, None
     
 __terminal_encoding = 'utf-8'
 def set_terminal_encoding(encoding):
@@ -105,6 +480,12 @@ def suppress_ffmpeg_output(suppress):
     __suppress_output = bool(suppress)
     
 def _agnostic_Popen(*args, **kwargs):
+    # get the command passed to Popen
+    if len(args) > 0:
+        command = args[0]
+    else:
+        command = kwargs.pop('args')
+    
     # sensible defaults for kwargs
     if 'shell' not in kwargs:
         kwargs['shell'] = False
@@ -127,24 +508,25 @@ def _agnostic_Popen(*args, **kwargs):
         if 'start_new_session' not in kwargs:
             kwargs['start_new_session'] = True
             
-    p = Popen(*args, **kwargs)
-    
-    # add the process to a list incase we get a SIGTERM or SIGINT
-    _process_list.append(p)
-    
-    # get the command passed to Popen
-    if len(args) > 0:
-        command = args[0]
-    else:
-        command = kwargs['args']
+    # launch the process with the backend and executor (which terminates it
+    # if we get a SIGTERM or SIGINT)
+    p = _backend.popen(_executor, command, *args[1:], **kwargs)
         
     # store the command for use in exception handling later
     p.autoscrub_command = command
         
     return p
 
-def _agnostic_communicate(p, write_to_terminal = None, new_line_callback=None):
-    """We only read from stderr because ffmpeg only prints to stderr
+def _agnostic_readlines(p, write_to_terminal = None):
+    """A generator that reads the stderr of the process :code:`p` and yields 
+    the text read in blocks of complete lines (terminated by \\r or \\n) as
+    soon as they are available. Any text remaining when the process exits is
+    yielded last.
+    
+    If the generator is closed before the process exits, the process is 
+    terminated.
+    
+    We only read from stderr because ffmpeg only prints to stderr
     Things get much more complicated if we need to read from both!
     """    
     
@@ -152,53 +534,70 @@ def _agnostic_communicate(p, write_to_terminal = None, new_line_callback=None):
     if write_to_terminal is None:
         write_to_terminal = not __suppress_output
     
-    stderr = ''
+    # decode incrementally so multi-byte characters split across reads are 
+    # handled correctly
+    decoder = codecs.getincrementaldecoder(__terminal_encoding)(errors='replace') if six.PY3 else None
     local_buffer = ''
-    while True:
-        out = p.stderr.read(100)
-        
-        # decode if it's a bytes string due to Python 3
-        if six.PY3:
-            out = out.decode(__terminal_encoding)
-        stderr += out
-        
-        # fancy code for nicely printing to the terminal
-        # find last occurance of \r or \n
-        pos1 = out.rfind("\r")
-        pos2 = out.rfind("\n")
-        pos = max(pos1, pos2)
-        
-        # if no new line character was printed, then add to the buffer
-        if pos == -1:
-            local_buffer += out
-        # print everything in the buffer and the text before the character
-        # save everything after the last \r|\n character in the local_buffer until we have the rest of the line
-        else:
-            local_buffer += out[:pos+1]
+    # read whatever is available (up to 100 bytes) rather than waiting for 
+    # 100 bytes so that lines are processed as soon as ffmpeg prints them
+    read = p.stderr.read1 if hasattr(p.stderr, 'read1') else p.stderr.read
+    try:
+        while True:
+            raw = read(100)
             
-            # print to terminal if requested
-            if write_to_terminal:
-                sys.stderr.write(local_buffer)
-                sys.stderr.flush()
-            # send to callback is present
-            if new_line_callback:
-                new_line_callback(local_buffer)
-            local_buffer = out[pos+1:]
-                        
-        # if we hit end of file and the process has a return code, then break
-        if len(out) < 100 and p.poll() != None:
-            p.poll()
-        
-            # print anything left over in the local buffer
-            if write_to_terminal:
-                sys.stderr.write(local_buffer)
-                sys.stderr.flush()
-            break
+            # decode if it's a bytes string due to Python 3
+            out = decoder.decode(raw) if six.PY3 else raw
+            
+            # fancy code for nicely printing to the terminal
+            # find last occurance of \r or \n
+            pos1 = out.rfind("\r")
+            pos2 = out.rfind("\n")
+            pos = max(pos1, pos2)
+            
+            # if no new line character was printed, then add to the buffer
+            if pos == -1:
+                local_buffer += out
+            # print everything in the buffer and the text before the character
+            # save everything after the last \r|\n character in the local_buffer until we have the rest of the line
+            else:
+                local_buffer += out[:pos+1]
                 
-    # we don't need to keep hold of the process anymore (for passing along SIGTERM and SIGINT)
-    # since the process is done
-    _process_list.remove(p)
+                # print to terminal if requested
+                if write_to_terminal:
+                    sys.stderr.write(local_buffer)
+                    sys.stderr.flush()
+                yield local_buffer
+                local_buffer = out[pos+1:]
+                            
+            # if we hit end of file, wait for the process to exit and then break
+            if not raw:
+                p.wait()
+            
+                # print anything left over in the local buffer
+                if write_to_terminal:
+                    sys.stderr.write(local_buffer)
+                    sys.stderr.flush()
+                if local_buffer:
+                    yield local_buffer
+                break
+    finally:
+        # stop the process if we were closed early
+        if p.poll() is None:
+            p.autoscrub_executor.terminate(p)
+            p.wait()
+            
+        # we don't need to keep hold of the process anymore (for passing along SIGTERM and SIGINT)
+        # since the process is done
+        p.autoscrub_executor.release(p)
+    
+    _check_returncode(p)
     
+    
+def _check_returncode(p):
+    if p.autoscrub_timed_out:
+        raise AutoscrubException('[autoscrub:error] The command "{}" did not finish within the time limit and was terminated'.format(
+                                 p.autoscrub_command if isinstance(p.autoscrub_command, six.string_types) else list2cmdline(p.autoscrub_command)))
+        
     # if autoscrub did not return correctly
     if p.returncode != 0:    
         # format the command
@@ -210,7 +609,37 @@ def _agnostic_communicate(p, write_to_terminal = None, new_line_callback=None):
         # raise Exception
         raise AutoscrubException('[autoscrub:error] The command "{}" failed to execute and exited with return code {}'.format(command, p.returncode))
             
-    return '', stderr
+
+def _agnostic_communicate(p, write_to_terminal = None, new_line_callback=None):
+    """We only read from stderr because ffmpeg only prints to stderr
+    Things get much more complicated if we need to read from both!
+    """    
+    stderr = []
+    for lines in _agnostic_readlines(p, write_to_terminal):
+        stderr.append(lines)
+        # send to callback is present
+        if new_line_callback:
+            new_line_callback(lines)
+    return '', ''.join(stderr)
+
+    
+def _agnostic_check_output(command):
+    """Runs :code:`command` and returns its stdout as a string. The command 
+    should not print much to stderr (for example, run ffprobe with 
+    :code:`-v error`) as stderr is only read once the command has finished.
+    """
+    p = _agnostic_Popen(command, stdout=PIPE, stderr=PIPE)
+    try:
+        stdout, stderr = p.communicate()
+    finally:
+        if p.poll() is None:
+            p.autoscrub_executor.terminate(p)
+            p.wait()
+        p.autoscrub_executor.release(p)
+    if six.PY3:
+        stdout = stdout.decode(__terminal_encoding, 'replace')
+    _check_returncode(p)
+    return stdout
 
     
 def hhmmssd_to_seconds(s):
@@ -258,6 +687,34 @@ def seconds_to_hhmmssd(t, decimal=True):
         s+=':{:06.3f}'.format(seconds)
     return s
 
+def fileFingerprint(filename, sample_size=1048576):
+    """Computes a fingerprint that identifies the contents of a media file.
+    
+    The fingerprint is a hash of the file size and of the first and last 
+    :code:`sample_size` bytes of the file, so it is cheap to compute even for 
+    very large recordings, but changes if the file is modified or replaced.
+    
+    Arguments:
+        filename: The filepath of the media file.
+        
+    Keyword Arguments:
+        sample_size: The number of bytes to read from each end of the file
+                     (default 1 MiB).
+                     
+    Returns:
+        The fingerprint as a hexadecimal string.
+    """
+    size = os.path.getsize(filename)
+    h = hashlib.sha1()
+    h.update(str(size).encode('ascii'))
+    with open(filename, 'rb') as f:
+        h.update(f.read(sample_size))
+        if size > sample_size:
+            f.seek(max(size - sample_size, sample_size))
+            h.update(f.read(sample_size))
+    return h.hexdigest()
+    
+    
 class _NewLineCallback(object):
     def __init__(self, duration=None, update_every_n_seconds=3, prefix=""):
         self.time_since_last_print = time.time()
@@ -370,6 +827,200 @@ def ffmpeg(filename, args=[], output_path=None, output_type=None, overwrite=None
     return output_path
 
 
+DurationEvent = namedtuple('DurationEvent', ['duration'])
+DurationEvent.__doc__ = """Reported by :class:`autoscrub.FFmpegLogParser` when ffmpeg prints the duration (in seconds) of the input"""
+
+ProgressEvent = namedtuple('ProgressEvent', ['time'])
+ProgressEvent.__doc__ = """Reported by :class:`autoscrub.FFmpegLogParser` when ffmpeg prints its progress (the output timestamp in seconds)"""
+
+SilenceStartEvent = namedtuple('SilenceStartEvent', ['start'])
+SilenceStartEvent.__doc__ = """Reported by :class:`autoscrub.FFmpegLogParser` when the silencedetect filter detects the start of a silence"""
+
+SilenceEvent = namedtuple('SilenceEvent', ['start', 'end', 'duration'])
+SilenceEvent.__doc__ = """Reported by :class:`autoscrub.FFmpegLogParser` when the silencedetect filter detects the end of a silence. A silence that has not ended when the log finishes is reported with :code:`end` and :code:`duration` set to :code:`None`"""
+
+LoudnessFrameEvent = namedtuple('LoudnessFrameEvent', ['time', 'momentary', 'short_term', 'integrated', 'lra'])
+LoudnessFrameEvent.__doc__ = """Reported by :class:`autoscrub.FFmpegLogParser` for each measurement printed by the ebur128 filter"""
+
+LoudnessSummaryEvent = namedtuple('LoudnessSummaryEvent', ['summary'])
+LoudnessSummaryEvent.__doc__ = """Reported by :class:`autoscrub.FFmpegLogParser` when the log finishes, containing the loudness dictionary printed by the ebur128 filter (see :func:`autoscrub.findLoudness`)"""
+
+
+class FFmpegLogParser(object):
+    """An incremental parser for the log output of ffmpeg.
+    
+    Text is passed to :meth:`autoscrub.FFmpegLogParser.feed` as it is read 
+    from ffmpeg (it does not need to be split on line boundaries), which 
+    returns a list of the events found in the complete lines received so 
+    far. Once the log has finished, :meth:`autoscrub.FFmpegLogParser.close` 
+    returns any remaining events.
+    
+    The events are :class:`autoscrub.DurationEvent`, 
+    :class:`autoscrub.ProgressEvent`, :class:`autoscrub.SilenceStartEvent`,
+    :class:`autoscrub.SilenceEvent`, :class:`autoscrub.LoudnessFrameEvent`
+    and :class:`autoscrub.LoudnessSummaryEvent`.
+    """
+    _line_re = re.compile(r'[\r\n]')
+    _duration_re = re.compile(r'Duration: +([\d\:\.]+)')
+    _progress_re = re.compile(r'time= *([\d\:\.]+)')
+    _silence_re = re.compile(r'(silence_[a-z]+): ([\-\d\.]+)')
+    _loudness_frame_re = re.compile(r't: *([\-\d\.]+).*M: *([\-\d\.]+) +S: *([\-\d\.]+) +I: *([\-\d\.]+) LUFS +LRA: *([\-\d\.]+)')
+    _loudness_summary_re = re.compile(r'([A-Z][A-Za-z ]*): +([\-\d\.]+)')
+    
+    def __init__(self):
+        self._buffer = ''
+        self._silence_start = None
+        # the (key, value) pairs printed after the last line from the ebur128 filter
+        self._loudness_summary = None
+        
+    def feed(self, text):
+        """Parses :code:`text` and returns a list of events"""
+        lines = self._line_re.split(self._buffer + text)
+        self._buffer = lines.pop()
+        events = []
+        for line in lines:
+            if line:
+                self._parse_line(line, events)
+        return events
+        
+    def close(self):
+        """Parses any remaining text and returns a list of events, including
+        any silence that has not ended and the loudness summary."""
+        events = []
+        if self._buffer:
+            self._parse_line(self._buffer, events)
+            self._buffer = ''
+        if self._silence_start is not None:
+            events.append(SilenceEvent(self._silence_start, None, None))
+            self._silence_start = None
+        if self._loudness_summary:
+            events.append(LoudnessSummaryEvent(dict(self._loudness_summary)))
+        self._loudness_summary = None
+        return events
+            
+    def _parse_line(self, line, events):
+        if 'silence_' in line:
+            values = dict((k, float(v)) for k, v in self._silence_re.findall(line))
+            if 'silence_start' in values:
+                self._silence_start = values['silence_start']
+                events.append(SilenceStartEvent(self._silence_start))
+            if 'silence_end' in values:
+                end = values['silence_end']
+                duration = values.get('silence_duration')
+                start = self._silence_start
+                if start is None and duration is not None:
+                    start = end - duration
+                if duration is None and start is not None:
+                    duration = end - start
+                if start is not None:
+                    events.append(SilenceEvent(start, end, duration))
+                self._silence_start = None
+        elif 'Parsed_ebur128' in line:
+            self._loudness_summary = []
+            match = self._loudness_frame_re.search(line)
+            if match:
+                events.append(LoudnessFrameEvent(*[float(v) for v in match.groups()]))
+        elif self._loudness_summary is not None:
+            self._loudness_summary.extend((k, float(v)) for k, v in self._loudness_summary_re.findall(line))
+        if 'time=' in line:
+            match = self._progress_re.search(line)
+            if match:
+                events.append(ProgressEvent(hhmmssd_to_seconds(match.group(1))))
+        elif 'Duration:' in line:
+            match = self._duration_re.search(line)
+            if match:
+                events.append(DurationEvent(hhmmssd_to_seconds(match.group(1))))
+                
+
+def iterLogEvents(command, new_line_callback=None, write_to_terminal=None):
+    """Runs an ffmpeg (or ffprobe) command and yields the events found by 
+    :class:`autoscrub.FFmpegLogParser` as soon as ffmpeg prints them.
+    
+    If the generator is closed early (for example, by breaking out of a 
+    :code:`for` loop), the ffmpeg process is terminated.
+    
+    Arguments:
+        command: The command to run, as a list.
+        
+    Keyword Arguments:
+        new_line_callback: A reference to a python function to be called when
+                           new lines are printed to stderr by ffmpeg. 
+                           
+        write_to_terminal: Whether to print the ffmpeg output to the terminal.
+                           Defaults to the setting of 
+                           :func:`autoscrub.suppress_ffmpeg_output`.
+    
+    Returns:
+        A generator of events.
+    """
+    p = _agnostic_Popen(command, stdout=PIPE, stderr=PIPE)
+    parser = FFmpegLogParser()
+    for lines in _agnostic_readlines(p, write_to_terminal):
+        if new_line_callback:
+            new_line_callback(lines)
+        for event in parser.feed(lines):
+            yield event
+    for event in parser.close():
+        yield event
+        
+        
+def _silence_event_to_dict(event):
+    if event.end is None:
+        return {'silence_start': event.start}
+    return {'silence_start': event.start, 'silence_end': event.end, 'silence_duration': event.duration}
+    
+    
+def iterSilences(filename, input_threshold_dB=-18.0, silence_duration=2.0, new_line_callback=None):
+    """Runs the ffmpeg filter silencedetect with the specified settings and 
+    yields each silence as soon as ffmpeg reports it.
+
+    Arguments:
+        filename: the path to the video file to examine
+    
+    Keyword Arguments:
+        input_threshold: instantaneous level (in dB) to detect silences with 
+                         (default -18).
+                         
+        silence_duration: seconds for which level mustn't exceed threshold to 
+                          declare silence (default 2).
+                          
+        new_line_callback: A reference to a python function to be called when
+                           new lines are printed to stderr by ffmpeg.
+        
+    Returns:
+        A generator of silence dictionaries, with keys::
+
+        silence_start: the timestamp of the detected silent interval in seconds
+        silence_end:   the timestamp of the detected silent interval in seconds
+        silence_duration:  duration of the silent interval in seconds
+        
+        A silence that continues until the end of the file is yielded last, 
+        with only the :code:`silence_start` key.
+    """
+    command = ['ffmpeg'] + _thread_args(None, 'analyse')[0] + ['-i', '%s'%filename, '-vn', '-af', 'silencedetect=n=%.1fdB:d=%s'%(input_threshold_dB,silence_duration), '-f', 'null', '%s'%NUL]
+    for event in iterLogEvents(command, new_line_callback):
+        if isinstance(event, SilenceEvent):
+            yield _silence_event_to_dict(event)
+            
+            
+def iterLoudness(filename):
+    """Runs the ffmpeg ebur128 filter on filename and yields each loudness 
+    measurement as soon as ffmpeg reports it.
+
+    Arguments:
+        filename: the path to the video file to examine.
+    
+    Returns:
+        A generator of :class:`autoscrub.LoudnessFrameEvent` (reported every
+        100ms of audio) followed by a single 
+        :class:`autoscrub.LoudnessSummaryEvent`.
+    """
+    command = ['ffmpeg'] + _thread_args(None, 'analyse')[0] + ['-i', '%s'%filename, '-vn', '-af', 'ebur128', '-f', 'null', '%s'%NUL]
+    for event in iterLogEvents(command):
+        if isinstance(event, (LoudnessFrameEvent, LoudnessSummaryEvent)):
+            yield event
+    
+    
 def findDuration(log_output):
     """Finds the duration in seconds from ffprobe log_output.
     
@@ -397,6 +1048,12 @@ def getDuration(filename):
     Returns:
         A float containing duration in seconds or None if the duration could not be determined.
     """
+    media = _indexed_media(filename)
+    if media is not None and media['duration'] is not None:
+        return media['duration']
+    ok, probe = _libav_call('probe', filename)
+    if ok and probe['duration'] is not None:
+        return probe['duration']
     ffprobe_log = ffprobe(filename)
     return findDuration(ffprobe_log)
 
@@ -426,6 +1083,12 @@ def getSampleRate(filename):
     Returns:
         A float containing audio sample rate in Hz or None if the sample rate could not be determined.
     """
+    media = _indexed_media(filename)
+    if media is not None and media['sample_rate'] is not None:
+        return media['sample_rate']
+    ok, probe = _libav_call('probe', filename)
+    if ok and probe['sample_rate'] is not None:
+        return probe['sample_rate']
     ffprobe_log = ffprobe(filename)
     return findSampleRate(ffprobe_log)
 
@@ -443,12 +1106,9 @@ def findSilences(log_output):
         silence_end:   the timestamp of the detected silent interval in seconds
         silence_duration:  duration of the silent interval in seconds
     """
-    matches = re.findall(r"(silence_[a-z]+): ([\-\d\.]+)", log_output)
-    matches = [(k, float(v)) for (k, v) in matches]
-    if matches:
-        return [dict(matches[i:i + 3]) for i in six.moves.xrange(0, len(matches), 3)]
-    else:
-        return []
+    parser = FFmpegLogParser()
+    events = parser.feed(log_output) + parser.close()
+    return [_silence_event_to_dict(event) for event in events if isinstance(event, SilenceEvent)]
 
 
 def getSilences(filename, input_threshold_dB=-18.0, silence_duration=2.0, save_silences=True):
@@ -466,6 +1126,12 @@ def getSilences(filename, input_threshold_dB=-18.0, silence_duration=2.0, save_s
         
         save_silences: print the above timestamps to CSV file (default = True).
         
+    If a library index has been set with :func:`autoscrub.set_library_index`
+    and contains silences of the file detected with the same settings, 
+    these are returned without running ffmpeg. Otherwise, if libav has been
+    enabled with :func:`autoscrub.use_libav`, the silences are detected in 
+    this process.
+        
     Returns:
         a list of silence dictionaries, with keys::
 
@@ -473,20 +1139,31 @@ def getSilences(filename, input_threshold_dB=-18.0, silence_duration=2.0, save_s
         silence_end:   the timestamp of the detected silent interval in seconds
         silence_duration:  duration of the silent interval in seconds
     """
-    command = ['ffmpeg', '-i', '%s'%filename, '-af', 'silencedetect=n=%.1fdB:d=%s'%(input_threshold_dB,silence_duration), '-f', 'null', '%s'%NUL]
-    p = _agnostic_Popen(command, stdout=PIPE, stderr=PIPE)
-    # Print a percentage complete message to the terminal if output is suppressed
-    if __suppress_output:
-        nlc = _NewLineCallback(update_every_n_seconds=2, prefix="[ffmpeg:silencedetect]")
-        callback = nlc.new_line_callback
+    silences = None
+    if _library_index is not None:
+        try:
+            silences = _library_index.silences(filename, input_threshold_dB, silence_duration)
+        except Exception:
+            pass
+    if silences is not None:
+        print("[ffmpeg:silencedetect] Read silences from the library index")
     else:
-        callback = None
-    stdout, stderr = _agnostic_communicate(p, new_line_callback=callback)
-    start_time = callback.__self__.start_time if six.PY3 else callback.im_self.start_time
-    seconds_taken = time.time() - start_time
-    time_taken = seconds_to_hhmmssd(seconds_taken, decimal=False)
-    print("[ffmpeg:silencedetect] Completed in {}                   ".format(time_taken))
-    silences = findSilences(stderr)
+        start_time = time.time()
+        ok, silences = _libav_call('getSilences', filename, input_threshold_dB, silence_duration)
+        if ok:
+            time_taken = seconds_to_hhmmssd(time.time() - start_time, decimal=False)
+            print("[libav:silencedetect] Completed in {}".format(time_taken))
+    if silences is None:
+        # Print a percentage complete message to the terminal if output is suppressed
+        nlc = _NewLineCallback(update_every_n_seconds=2, prefix="[ffmpeg:silencedetect]")
+        if __suppress_output:
+            callback = nlc.new_line_callback
+        else:
+            callback = None
+        silences = list(iterSilences(filename, input_threshold_dB, silence_duration, new_line_callback=callback))
+        seconds_taken = time.time() - nlc.start_time
+        time_taken = seconds_to_hhmmssd(seconds_taken, decimal=False)
+        print("[ffmpeg:silencedetect] Completed in {}                   ".format(time_taken))
     if save_silences:
         filename_prefix, file_extension = os.path.splitext(filename)
         silence_path = '%s_silences.csv' % filename_prefix
@@ -514,12 +1191,10 @@ def findLoudness(log_output):
         LRA low:
         Threshold: 
     """
-    log_split = re.split(r"Parsed_ebur128.+", log_output)
-    if len(log_split) > 1:
-        summary = log_split[-1]
-        matches = re.findall(r"([A-Z][A-Za-z ]*): +([\-\d\.]+)", summary)
-        if matches:
-            return dict([(k, float(v)) for (k, v) in matches])
+    parser = FFmpegLogParser()
+    for event in parser.feed(log_output) + parser.close():
+        if isinstance(event, LoudnessSummaryEvent):
+            return event.summary
     return None
 
 
@@ -538,7 +1213,10 @@ def getLoudness(filename):
         LRA low:
         Threshold:        
     """
-    command = ['ffmpeg', '-i', '%s'%filename, '-c:v', 'copy', '-af', 'ebur128', '-f', 'null', '%s'%NUL]
+    media = _indexed_media(filename)
+    if media is not None and media['loudness']:
+        return media['loudness']
+    command = ['ffmpeg'] + _thread_args(None, 'analyse')[0] + ['-i', '%s'%filename, '-c:v', 'copy', '-af', 'ebur128', '-f', 'null', '%s'%NUL]
     p = _agnostic_Popen(command, stdout=PIPE, stderr=PIPE)
     stdout, stderr = _agnostic_communicate(p)
     return findLoudness(stderr)
@@ -581,9 +1259,298 @@ def matchLoudness(filename, target_lufs=-18, output_path=None, overwrite=None):
     return output_path
 
 
-def trim(input_path, tstart=0, tstop=None, output_path=None, overwrite=None, codec='copy', output_type=None):
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise AutoscrubException('[autoscrub:error] numpy is required to compute level envelopes. Install it with: pip install autoscrub[tune]')
+    return numpy
+
+
+def computeLevelEnvelope(filename, frame_duration=0.01, use_cache=True):
+    """Computes the short-term level envelope of the audio of 
+    :code:`filename`, along with its loudness.
+    
+    The envelope is the peak sample level (in dB, of any channel) of each 
+    frame of :code:`frame_duration` seconds. silencedetect declares silence 
+    when every sample is below the threshold, so a span of frames whose 
+    levels are all below a threshold is a silence at that threshold (to 
+    within a frame). This lets :func:`autoscrub.sweepSilences` evaluate many
+    silence detection settings without decoding the file again.
+    
+    The envelope is cached in a :code:`.levels.npy` file alongside 
+    :code:`filename` (described by a :code:`.levels.json` file) and is reused
+    until the contents of :code:`filename` change. Requires numpy.
+    
+    Arguments:
+        filename: The filepath of the media file.
+        
+    Keyword Arguments:
+        frame_duration: The duration (in seconds) of each frame of the 
+                        envelope (default 0.01).
+                        
+        use_cache: Whether to read and write the cache files (default True).
+        
+    Returns:
+        A tuple of the envelope (a numpy float32 array, memory-mapped from 
+        the cache file if it was cached), the frame duration and the loudness
+        dictionary (see :func:`autoscrub.getLoudness`).
+    """
+    np = _import_numpy()
+    cache_path = filename + '.levels.npy'
+    info_path = filename + '.levels.json'
+    fingerprint = fileFingerprint(filename)
+    if use_cache and os.path.exists(cache_path) and os.path.exists(info_path):
+        try:
+            with open(info_path, 'r') as f:
+                info = json.load(f)
+            if info['fingerprint'] == fingerprint and info['frame_duration'] == frame_duration:
+                return np.load(cache_path, mmap_mode='r'), frame_duration, info['loudness']
+        except Exception:
+            pass
+            
+    command = ['ffprobe', '-v', 'error', '-select_streams', 'a:0', '-show_entries', 'stream=channels,sample_rate', '-of', 'json', '%s' % filename]
+    streams = json.loads(_agnostic_check_output(command)).get('streams', [])
+    if not streams:
+        raise AutoscrubException('[autoscrub:error] {} does not contain an audio stream'.format(filename))
+    channels = int(streams[0]['channels'])
+    frame_samples = max(1, int(round(float(streams[0]['sample_rate'])*frame_duration)))
+    
+    # Decode the audio to raw samples on stdout, measuring the loudness with
+    # ebur128 (which passes the audio through unchanged) on the way
+    command = ['ffmpeg'] + _thread_args(None, 'analyse')[0] + ['-i', '%s' % filename, '-vn', '-af', 'ebur128', 
+                                                               '-f', 'f32le', '-c:a', 'pcm_f32le', 'pipe:1']
+    p = _agnostic_Popen(command, stdout=PIPE, stderr=PIPE)
+    stderr_chunks = []
+    stderr_thread = threading.Thread(target=lambda: stderr_chunks.append(p.stderr.read()))
+    stderr_thread.daemon = True
+    stderr_thread.start()
+    
+    frame_bytes = frame_samples*channels*4
+    levels = []
+    remainder = b''
+    try:
+        while True:
+            data = p.stdout.read(frame_bytes*1000)
+            if not data:
+                break
+            data = remainder + data
+            n_frames = len(data)//frame_bytes
+            remainder = data[n_frames*frame_bytes:]
+            if n_frames:
+                samples = np.frombuffer(data[:n_frames*frame_bytes], dtype='<f4').reshape(n_frames, frame_samples*channels)
+                levels.append(np.abs(samples).max(axis=1))
+        if remainder:
+            levels.append(np.abs(np.frombuffer(remainder[:len(remainder)//4*4], dtype='<f4')).max(keepdims=True))
+        p.wait()
+        stderr_thread.join()
+    finally:
+        if p.poll() is None:
+            p.autoscrub_executor.terminate(p)
+            p.wait()
+        p.autoscrub_executor.release(p)
+    _check_returncode(p)
+    
+    peaks = np.concatenate(levels) if levels else np.zeros(0, dtype='float32')
+    envelope = (20*np.log10(np.maximum(peaks, 1e-10))).astype('float32')
+    stderr = b''.join(stderr_chunks)
+    loudness = findLoudness(stderr.decode(__terminal_encoding, 'replace') if six.PY3 else stderr)
+    
+    if use_cache:
+        try:
+            np.save(cache_path, envelope)
+            with open(info_path, 'w') as f:
+                json.dump({'fingerprint': fingerprint, 'frame_duration': frame_duration, 'loudness': loudness}, f)
+        except (IOError, OSError):
+            # The folder may not be writeable, in which case we just don't cache
+            pass
+    return envelope, frame_duration, loudness
+    
+    
+def sweepSilences(envelope, thresholds, silence_durations, frame_duration=0.01, factor=8, delay=0.25):
+    """Predicts the result of silence detection and processing for each 
+    combination of threshold and minimum silence duration, using a level 
+    envelope from :func:`autoscrub.computeLevelEnvelope`. Requires numpy.
+    
+    Arguments:
+        envelope: The level envelope (in dB).
+        
+        thresholds: A list of silence thresholds (in dB, as passed to 
+                    :func:`autoscrub.getSilences`).
+                    
+        silence_durations: A list of minimum silence durations (in seconds).
+        
+    Keyword Arguments:
+        frame_duration: The duration (in seconds) of each frame of the 
+                        envelope (default 0.01).
+                        
+        factor: The speed up factor used to predict the output duration 
+                (default 8).
+                
+        delay: The delay used to predict the output duration (default 0.25).
+        
+    Returns:
+        A list of dictionaries (one per combination) with keys::
+        
+        threshold:        the threshold in dB
+        silence_duration: the minimum silence duration in seconds
+        silences:         the number of silences found
+        silent_time:      the total duration of the silences in seconds
+        output_duration:  the predicted duration of the processed recording
+    """
+    np = _import_numpy()
+    envelope = np.asarray(envelope)
+    duration = len(envelope)*frame_duration
+    results = []
+    for threshold in thresholds:
+        # find the runs of frames below the threshold
+        silent = np.concatenate(([0], (envelope < threshold).view(np.int8), [0]))
+        edges = np.diff(silent)
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        # silences that run to the end of the file are not reported by 
+        # silencedetect
+        closed = ends < len(envelope)
+        frames = np.sort((ends - starts)[closed])
+        lengths = frames*frame_duration
+        # cumulative sums (from the longest run) give the totals for every 
+        # minimum duration with a binary search
+        removable = np.maximum(lengths - 2*delay, 0)
+        total_lengths = np.concatenate((np.cumsum(lengths[::-1])[::-1], [0]))
+        total_removable = np.concatenate((np.cumsum(removable[::-1])[::-1], [0]))
+        for silence_duration in silence_durations:
+            # (compare whole frames to avoid rounding errors)
+            i = np.searchsorted(frames, int(math.ceil(round(silence_duration/frame_duration, 6))), side='left')
+            results.append({'threshold': threshold, 
+                            'silence_duration': silence_duration, 
+                            'silences': int(len(lengths) - i),
+                            'silent_time': float(total_lengths[i]),
+                            'output_duration': float(duration - total_removable[i]*(1 - 1.0/factor)),
+                            })
+    return results
+    
+    
+def _container_start_time(filename):
+    """Returns the start time of the container of filename in seconds (0 if 
+    it is unknown), which ffmpeg subtracts from every timestamp"""
+    command = ['ffprobe', '-v', 'error', '-show_entries', 'format=start_time', '-of', 'json', '%s' % filename]
+    start_time = json.loads(_agnostic_check_output(command)).get('format', {}).get('start_time')
+    try:
+        return float(start_time)
+    except (TypeError, ValueError):
+        return 0.0
+        
+        
+def getKeyframes(filename, use_cache=True):
+    """Finds the timestamps of the keyframes in the first video stream of 
+    :code:`filename`.
+    
+    The keyframes are found from the packet flags reported by ffprobe (which
+    only requires the file to be demuxed, not decoded). The timestamps are 
+    relative to the start time of the container (which is not zero for 
+    formats such as MPEG-TS), as ffmpeg counts the times of :code:`-ss`,
+    :code:`-t` and filters. The result is cached
+    in a :code:`.keyframes.json` file alongside :code:`filename` and is reused
+    until the contents of :code:`filename` change.
+    
+    Arguments:
+        filename: The filepath of the media file.
+        
+    Keyword Arguments:
+        use_cache: Whether to read and write the cache file (default True).
+        
+    Returns:
+        A sorted list of keyframe timestamps in seconds.
+    """
+    cache_path = filename + '.keyframes.json'
+    fingerprint = fileFingerprint(filename)
+    if use_cache and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r') as f:
+                cache = json.load(f)
+            # older caches stored the absolute timestamps
+            if cache['fingerprint'] == fingerprint and cache.get('relative'):
+                return cache['keyframes']
+        except Exception:
+            pass
+    
+    ok, keyframes = _libav_call('getKeyframes', filename)
+    if not ok:
+        command = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time,flags', 
+                   '-of', 'csv=print_section=0', '%s' % filename]
+        keyframes = []
+        for line in _agnostic_check_output(command).splitlines():
+            pts_time, _, flags = line.strip().partition(',')
+            if 'K' in flags and pts_time not in ['', 'N/A']:
+                keyframes.append(float(pts_time))
+        keyframes.sort()
+        start_time = _container_start_time(filename)
+        keyframes = [t - start_time for t in keyframes]
+    
+    if use_cache:
+        try:
+            with open(cache_path, 'w') as f:
+                json.dump({'fingerprint': fingerprint, 'keyframes': keyframes, 'relative': True}, f)
+        except (IOError, OSError):
+            # The folder may not be writeable, in which case we just don't cache
+            pass
+    return keyframes
+    
+
+def findCutPoints(input_path, tstart=0, tstop=None, codec='copy', keyframes=None):
+    """Determines the cut points that :func:`autoscrub.trim` can achieve.
+    
+    When the streams are copied (:code:`codec='copy'`), the output must begin
+    on a keyframe, so the start is moved back to the nearest preceding 
+    keyframe. Inputs without keyframes (such as audio only inputs, which have
+    no video stream) are cut at the requested start. When re-encoding, the 
+    requested cut points are achieved exactly.
+    
+    Arguments:
+        input_path: The path to the media file to process
+    
+    Keyword Arguments:
+        tstart: A integer/float in seconds, or a '[hh:]mm:ss[.d]' string    
+                (default 0)
+        
+        tstop: A integer/float in seconds, or a '[hh:]mm:ss[.d]' string 
+               (default None)
+               
+        codec: The codec argument passed to :func:`autoscrub.trim` (default: 
+               copy).
+               
+        keyframes: The keyframe timestamps of :code:`input_path`. Defaults to 
+                   :code:`None` (determined with 
+                   :func:`autoscrub.getKeyframes`).
+               
+    Returns:
+        A tuple of :code:`(tstart, tstop)` in seconds. :code:`tstop` is 
+        :code:`None` if no :code:`tstop` was specified.
+    """
+    if isinstance(tstart, six.string_types):
+        tstart = hhmmssd_to_seconds(tstart)
+    if isinstance(tstop, six.string_types):
+        tstop = hhmmssd_to_seconds(tstop)
+    tstart = float(tstart)
+    tstop = None if tstop is None else float(tstop)
+    if codec == 'copy' and tstart > 0:
+        if keyframes is None:
+            keyframes = getKeyframes(input_path)
+        # without video, every audio packet can start the output
+        if keyframes:
+            i = bisect.bisect_right(keyframes, tstart)
+            tstart = keyframes[i-1] if i > 0 else 0.0
+    return tstart, tstop
+    
+    
+def trim(input_path, tstart=0, tstop=None, output_path=None, overwrite=None, codec='copy', output_type=None, keyframes=None, threads=None):
     """Extract contents of input_path between tstart and tstop.
     
+    The input is seeked before it is read (so content before :code:`tstart` 
+    is not demuxed). When the streams are copied, the output begins at the 
+    keyframe preceding :code:`tstart` (see :func:`autoscrub.findCutPoints`), 
+    and the achievable cut points are printed before ffmpeg is run.
+    
     Arguments:
         input_path: The path to the media file to process
     
@@ -603,29 +1570,53 @@ def trim(input_path, tstart=0, tstop=None, output_path=None, overwrite=None, cod
                    have suppressed terminal output with 
                    :func:`autoscrub.suppress_ffmpeg_output`
         
-        codec: Specify the codec to use in the encoding of the output file (default: copy).
+        codec: Specify the codec to use in the encoding of the output file 
+               (default: copy). Either the name of a video encoder (such as 
+               :code:`'libx264'`) or a list of ffmpeg output arguments (such
+               as :code:`['-c:v', 'libx264', '-c:a', 'copy']`).
         
         output_type: Determines the output file type. Specify as a string 
                      containing the required file extension. This is ignored if
                      :code:`output_path` is specified.
                      
+        keyframes: The keyframe timestamps of :code:`input_path`. Defaults to 
+                   :code:`None` (determined with 
+                   :func:`autoscrub.getKeyframes` when needed).
+                   
+        threads: The thread allocation (from 
+                 :func:`autoscrub.threadAllocation`) used when re-encoding. 
+                 Defaults to :code:`None` (calculated when the command is 
+                 prepared). If :code:`False`, ffmpeg chooses the number of 
+                 threads.
+                     
     Returns:
         The :code:`output_path` where the output of ffmpeg was written.
     """
     folder, filename = os.path.split(input_path)
-    if not isinstance(tstart, six.string_types):
-        tstart = '%.4f' % float(tstart)
-    if tstop and not isinstance(tstop, six.string_types):
-        tstop = '%.4f' % float(tstop)
-    command = ['ffmpeg', '-i', '%s'%input_path]
-    if hhmmssd_to_seconds(tstart) > 0:
-        command += ['-ss', tstart]
+    if codec != 'copy' and isinstance(codec, six.string_types):
+        codec = ['-c:v', codec]
+    if isinstance(tstart, six.string_types):
+        tstart = hhmmssd_to_seconds(tstart)
+    requested_start = float(tstart)
+    tstart, tstop = findCutPoints(input_path, tstart, tstop, codec, keyframes)
+    if tstart != requested_start:
+        print('[autoscrub:info] Trimming from the keyframe at %s (requested %s)' % (seconds_to_hhmmssd(tstart), seconds_to_hhmmssd(requested_start)))
+    if codec == 'copy':
+        thread_input, thread_output = [], []
+    else:
+        encoder = codec[codec.index('-c:v') + 1] if '-c:v' in codec else None
+        thread_input, thread_output = _thread_args(threads, 'transcode', encoder)
+    command = ['ffmpeg'] + thread_input
+    if tstart > 0:
+        # Seek slightly past the keyframe so rounding can't select the previous one
+        command += ['-ss', '%.6f' % (tstart + (0.0001 if codec == 'copy' else 0))]
     if tstop is not None:
-        command += ['-to', tstop]
+        command += ['-t', '%.6f' % (tstop - tstart)]
+    command += ['-i', '%s'%input_path]
     if codec == 'copy':
         command += ['-c', 'copy']
     else:
-        command += codec
+        command += codec + thread_output
     if __suppress_output and overwrite is None:
         raise RuntimeError("[autoscrub:error] If ffmpeg output is suppressed, you must specify the overwrite keyword argument or else ffmpeg will hang on user input.")
     if overwrite is not None:
@@ -636,6 +1627,10 @@ def trim(input_path, tstart=0, tstop=None, output_path=None, overwrite=None, cod
             file_extension = output_type
         output_path = filename_prefix + '_trimmed' + file_extension
     command.append(output_path)
+    if codec == 'copy' and (overwrite or not os.path.exists(output_path)):
+        ok, _ = _libav_call('trim', input_path, output_path, tstart, tstop)
+        if ok:
+            return output_path
     try:
         p = _agnostic_Popen(command)
         stdout, stderr = _agnostic_communicate(p)
@@ -645,6 +1640,226 @@ def trim(input_path, tstart=0, tstop=None, output_path=None, overwrite=None, cod
         return None 
 
 
+# ffmpeg encoders that can produce a stream compatible with a stream of 
+# each codec (used to re-encode the boundaries of a smart cut)
+_smart_cut_encoders = {'h264': 'libx264', 'hevc': 'libx265', 'mpeg4': 'mpeg4', 'mpeg2video': 'mpeg2video'}
+
+# the encoder profiles matching the profiles reported by ffprobe
+_smart_cut_profiles = {'libx264': {'Constrained Baseline': 'baseline', 'Baseline': 'baseline', 'Main': 'main', 'High': 'high',
+                                   'High 10': 'high10', 'High 4:2:2': 'high422', 'High 4:4:4 Predictive': 'high444'},
+                       'libx265': {'Main': 'main', 'Main 10': 'main10', 'Main Still Picture': 'mainstillpicture'}}
+
+# ffmpeg encoders for the audio of a smart cut (other codecs are re-encoded as AAC)
+_smart_cut_audio_encoders = {'aac': 'aac', 'mp3': 'libmp3lame', 'opus': 'libopus', 'vorbis': 'libvorbis', 'ac3': 'ac3', 
+                             'eac3': 'eac3', 'flac': 'flac', 'alac': 'alac', 'pcm_s16le': 'pcm_s16le', 'pcm_s24le': 'pcm_s24le'}
+
+
+def _probe_video_stream(filename):
+    """Returns a dictionary describing the first video stream of filename 
+    (codec_name, pix_fmt, width, height, profile and level), or None if there
+    isn't one."""
+    ok, probe = _libav_call('probe', filename)
+    if ok:
+        return probe['video']
+    command = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=codec_name,pix_fmt,width,height,profile,level', 
+               '-of', 'json', '%s' % filename]
+    streams = json.loads(_agnostic_check_output(command)).get('streams', [])
+    return streams[0] if streams else None
+    
+    
+def _probe_audio_stream(filename):
+    """Returns a dictionary describing the first audio stream of filename 
+    (codec_name and bit_rate), or None if there isn't one."""
+    ok, probe = _libav_call('probe', filename)
+    if ok:
+        return probe['audio']
+    command = ['ffprobe', '-v', 'error', '-select_streams', 'a:0', '-show_entries', 'stream=codec_name,bit_rate', 
+               '-of', 'json', '%s' % filename]
+    streams = json.loads(_agnostic_check_output(command)).get('streams', [])
+    return streams[0] if streams else None
+    
+    
+def _smart_cut_video_args(encoder, stream):
+    """Returns the ffmpeg output arguments that re-encode the video of a smart
+    cut with the pixel format, profile and level of stream"""
+    args = ['-c:v', encoder, '-pix_fmt', stream['pix_fmt']]
+    if encoder in ['libx264', 'libx265']:
+        args += ['-crf', '16']
+    profile = _smart_cut_profiles.get(encoder, {}).get(stream.get('profile'))
+    if profile is not None:
+        args += ['-profile:v', profile]
+    level = stream.get('level')
+    if level is not None and int(level) > 0:
+        # ffprobe reports 10 times the H.264 level and 30 times the HEVC level
+        if encoder == 'libx264':
+            args += ['-level', '%.1f' % (int(level)/10.0)]
+        elif encoder == 'libx265':
+            args += ['-x265-params', 'level-idc=%.1f' % (int(level)/30.0)]
+    return args
+    
+    
+def _smart_cut_audio_args(stream):
+    """Returns the ffmpeg output arguments that re-encode the audio of a smart
+    cut with the codec and bit rate of stream"""
+    encoder = _smart_cut_audio_encoders.get(stream.get('codec_name'), 'aac')
+    args = ['-c:a', encoder]
+    if stream.get('bit_rate') and not (encoder in ['flac', 'alac'] or encoder.startswith('pcm_')):
+        args += ['-b:a', '%s' % stream['bit_rate']]
+    return args
+    
+    
+def _mux(video_path, audio_path, output_path, overwrite=None):
+    """Copies the video of video_path and the audio of audio_path into 
+    output_path. Returns output_path if successful or None."""
+    command = ['ffmpeg', '-i', '%s' % video_path, '-i', '%s' % audio_path, '-map', '0:v', '-map', '1:a', '-c', 'copy']
+    if __suppress_output and overwrite is None:
+        raise RuntimeError("[autoscrub:error] If ffmpeg output is suppressed, you must specify the overwrite keyword argument or else ffmpeg will hang on user input.")
+    if overwrite is not None:
+        command += ['-y'] if overwrite==True else ['-n']
+    command += ['%s' % output_path]
+    print('[autoscrub] Running ffmpeg command:')
+    print(list2cmdline(command))
+    try:
+        p = _agnostic_Popen(command)
+        stdout, stderr = _agnostic_communicate(p)
+        return output_path
+    except Exception as e:
+        print(e)
+        return None
+    
+    
+def hasVideo(filename):
+    """Returns :code:`True` if filename contains a video stream.
+    
+    Arguments:
+        filename: The path to the media file to probe.
+    """
+    media = _indexed_media(filename)
+    if media is not None:
+        return media['has_video']
+    return _probe_video_stream(filename) is not None
+    
+    
+def smartTrim(input_path, tstart=0, tstop=None, output_path=None, overwrite=None, output_type=None, keyframes=None):
+    """Extract contents of input_path between tstart and tstop with frame 
+    accurate cut points, while only re-encoding the video at the cut points.
+    
+    The video from :code:`tstart` to the next keyframe, and from the last 
+    keyframe before :code:`tstop` to :code:`tstop`, is re-encoded (with an 
+    encoder compatible with the input's video codec, and the same pixel 
+    format, profile and level). The video in between is copied. The pieces 
+    are joined with the concat demuxer. The audio is re-encoded (with the 
+    same codec and bit rate) in one piece from :code:`tstart` to 
+    :code:`tstop`, so that it has no gaps at the joins, and is muxed with the
+    joined video. If the input video codec is not supported, or there is no 
+    keyframe between :code:`tstart` and :code:`tstop`, the whole range is 
+    re-encoded instead.
+    
+    The re-encoded pieces carry their own codec parameters (such as the 
+    H.264 SPS/PPS) in-band, which may differ from those of the copied 
+    video. Containers that store the parameters in-band (such as MPEG-TS 
+    and Matroska) play the result everywhere. An MP4 only stores the 
+    parameters of the first piece in its header, so players that ignore 
+    in-band parameters may show errors after the joins.
+    
+    Arguments:
+        input_path: The path to the media file to process
+    
+    Keyword Arguments:
+        tstart: A integer/float in seconds, or a '[hh:]mm:ss[.d]' string    
+                (default 0)
+        
+        tstop: A integer/float in seconds, or a '[hh:]mm:ss[.d]' string 
+               (default None)
+               
+        output_path: Defaults to appending '_trimmed' to input_path
+        
+        overwrite: If :code:`True`, overwrites the :code:`output_path` with no
+                   prompt. If :code:`False`, the function will fail if the
+                   :code:`output_path` exists. Defaults to :code:`None` 
+                   (prompts user for input). You must specify a value if you 
+                   have suppressed terminal output with 
+                   :func:`autoscrub.suppress_ffmpeg_output`
+                   
+        output_type: Determines the output file type. Specify as a string 
+                     containing the required file extension. This is ignored if
+                     :code:`output_path` is specified.
+                     
+        keyframes: The keyframe timestamps of :code:`input_path`. Defaults to 
+                   :code:`None` (determined with 
+                   :func:`autoscrub.getKeyframes`).
+                     
+    Returns:
+        The :code:`output_path` where the output of ffmpeg was written, or 
+        :code:`None` if ffmpeg failed.
+    """
+    if isinstance(tstart, six.string_types):
+        tstart = hhmmssd_to_seconds(tstart)
+    if isinstance(tstop, six.string_types):
+        tstop = hhmmssd_to_seconds(tstop)
+    tstart = float(tstart)
+    tstop = None if tstop is None else float(tstop)
+    if output_path is None:
+        filename_prefix, file_extension = os.path.splitext(input_path)
+        if output_type is not None:
+            file_extension = output_type
+        output_path = filename_prefix + '_trimmed' + file_extension
+    if __suppress_output and overwrite is None:
+        raise RuntimeError("[autoscrub:error] If ffmpeg output is suppressed, you must specify the overwrite keyword argument or else ffmpeg will hang on user input.")
+    
+    stream = _probe_video_stream(input_path)
+    encoder = _smart_cut_encoders.get(stream['codec_name']) if stream else None
+    audio_stream = _probe_audio_stream(input_path)
+    audio_args = _smart_cut_audio_args(audio_stream) if audio_stream else []
+    if keyframes is None:
+        keyframes = getKeyframes(input_path)
+    # the first keyframe at or after tstart, and the last keyframe before tstop
+    first = bisect.bisect_left(keyframes, tstart)
+    last = len(keyframes) if tstop is None else bisect.bisect_right(keyframes, tstop)
+    if stream and encoder is None:
+        print('[autoscrub:warning] Smart cut does not support %s video. Re-encoding the whole range instead.' % stream['codec_name'])
+    if encoder is None or first >= last:
+        video_args = _smart_cut_video_args(encoder, stream) if encoder else ['-c:v', 'libx264']
+        return trim(input_path, tstart, tstop, output_path, overwrite, codec=video_args + audio_args, keyframes=keyframes)
+    copy_start = keyframes[first]
+    copy_stop = keyframes[last-1] if tstop is not None else None
+    
+    # the pieces keep their (copied) audio so they all have the same streams
+    re_encode = _smart_cut_video_args(encoder, stream) + ['-c:a', 'copy']
+    plan = []
+    if copy_start - tstart > 0.001:
+        plan.append(('head', tstart, copy_start, re_encode))
+    if copy_stop is None or copy_stop > copy_start:
+        plan.append(('middle', copy_start, copy_stop, 'copy'))
+    if copy_stop is not None and tstop - copy_stop > 0.001:
+        plan.append(('tail', copy_stop, tstop, re_encode))
+    for name, a, b, codec in plan:
+        print('[autoscrub:info] Smart cut: %s %s to %s' % ('copying' if codec == 'copy' else 're-encoding', 
+                                                         seconds_to_hhmmssd(a), 'end' if b is None else seconds_to_hhmmssd(b)))
+    
+    # The pieces are written as MPEG-TS so that each piece carries its own 
+    # codec parameters in-band, allowing them to be joined by the concat demuxer.
+    # Only the video of the joined pieces is used if there is audio.
+    temp_folder = tempfile.mkdtemp(prefix='autoscrub_smartcut_')
+    try:
+        pieces = [trim(input_path, a, b, os.path.join(temp_folder, name + '.ts'), True, codec, keyframes=keyframes) for name, a, b, codec in plan]
+        if None in pieces:
+            return None
+        concat_path = os.path.join(temp_folder, 'concat.txt')
+        with open(concat_path, 'w') as f:
+            f.write('\n'.join(["file '%s'" % path for path in pieces]))
+        if audio_stream is None:
+            return concatFileList(concat_path, output_path, overwrite)
+        print('[autoscrub:info] Smart cut: re-encoding the audio from %s to %s' % (seconds_to_hhmmssd(tstart), 'end' if tstop is None else seconds_to_hhmmssd(tstop)))
+        audio_path = trim(input_path, tstart, tstop, os.path.join(temp_folder, 'audio.mka'), True, ['-vn'] + audio_args)
+        video_path = concatFileList(concat_path, os.path.join(temp_folder, 'video.ts'), True)
+        if audio_path is None or video_path is None:
+            return None
+        return _mux(video_path, audio_path, output_path, overwrite)
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+
 def trimSegments(input_path, trimpts, output_path=None, output_type=None, **kwargs):
     """Extract segments of a file using a list of :code:`(tstart, tstop)`
     tuples. Each segment is saved as a file of the same type as the original.
@@ -673,12 +1888,16 @@ def trimSegments(input_path, trimpts, output_path=None, output_type=None, **kwar
     temp_folder = output_path if output_path else os.path.join(folder, 'temp')
     if not os.path.exists(temp_folder):
         os.mkdir(temp_folder)
+    if kwargs.get('codec', 'copy') == 'copy' and 'keyframes' not in kwargs:
+        kwargs['keyframes'] = getKeyframes(input_path)
     segment_paths = []
     for i, (tstart, tstop) in enumerate(trimpts):
         segment_file = filename_prefix + '_%03i' % i + file_extension
         segment_path = os.path.join(temp_folder, segment_file)
+        cut_start, cut_stop = findCutPoints(input_path, tstart, tstop, kwargs.get('codec', 'copy'), kwargs.get('keyframes'))
+        print('Trimming segment %03i of %s (from %s to %s).' % (i, filename, seconds_to_hhmmssd(cut_start), 
+                                                                 'end' if cut_stop is None else seconds_to_hhmmssd(cut_stop)))
         trim(input_path, tstart, tstop, segment_path, **kwargs)
-        print('Trimmed segment %03i of %s (from %s to %s).' % (i, filename, tstart, tstop))
         segment_paths.append(segment_path)
     return segment_paths
 
@@ -771,8 +1990,317 @@ def concatSegments(segment_paths, output_path=None, overwrite=None):
     return concatFileList(concat_path, output_path, overwrite)
 
 
+class SilenceList(object):
+    """A compact list of silent intervals.
+    
+    The start, end and duration of each silence are stored in 
+    :code:`array('d')` buffers rather than as a list of dictionaries. A 
+    trailing silence that has not ended (for example, one that runs until the 
+    end of the file) is stored separately in :code:`open_start`.
+    
+    All functions that accept a list of silence dictionaries also accept a
+    :class:`autoscrub.SilenceList`. Use :meth:`autoscrub.SilenceList.to_dicts`
+    to convert back to a list of silence dictionaries.
+    
+    Keyword Arguments:
+        starts: The timestamps (in seconds) at which each silence starts.
+        
+        ends: The timestamps (in seconds) at which each silence ends.
+        
+        durations: The durations (in seconds) of each silence. Defaults to
+                   :code:`ends - starts`.
+                   
+        open_start: The start of a trailing silence that has no end 
+                    (default None).
+    """
+    __slots__ = ('starts', 'ends', 'durations', 'open_start')
+    
+    def __init__(self, starts=(), ends=(), durations=None, open_start=None):
+        self.starts = array('d', starts)
+        self.ends = array('d', ends)
+        if durations is None:
+            durations = [e - s for s, e in zip(self.starts, self.ends)]
+        self.durations = array('d', durations)
+        if not len(self.starts) == len(self.ends) == len(self.durations):
+            raise ValueError('[autoscrub:error] The starts, ends and durations of a SilenceList must have the same length')
+        self.open_start = open_start
+        
+    @classmethod
+    def from_silences(cls, silences):
+        """Creates a :class:`autoscrub.SilenceList` from a list of silence 
+        dictionaries (as returned by :func:`autoscrub.getSilences`). If 
+        :code:`silences` is already a :class:`autoscrub.SilenceList` it is 
+        returned unchanged.
+        """
+        if isinstance(silences, cls):
+            return silences
+        starts, ends, durations = [], [], []
+        open_start = None
+        for s in silences:
+            if 'silence_end' not in s:
+                open_start = s['silence_start']
+                continue
+            starts.append(s['silence_start'])
+            ends.append(s['silence_end'])
+            durations.append(s['silence_duration'] if 'silence_duration' in s else s['silence_end'] - s['silence_start'])
+        return cls(starts, ends, durations, open_start)
+        
+    def to_dicts(self):
+        """Returns the silences as a list of silence dictionaries"""
+        silences = [{'silence_start': s, 'silence_end': e, 'silence_duration': d} 
+                    for s, e, d in zip(self.starts, self.ends, self.durations)]
+        if self.open_start is not None:
+            silences.append({'silence_start': self.open_start})
+        return silences
+        
+    def __len__(self):
+        return len(self.starts)
+        
+    def __iter__(self):
+        return six.moves.zip(self.starts, self.ends)
+        
+    def __repr__(self):
+        return 'SilenceList(%r, %r, open_start=%r)' % (list(self.starts), list(self.ends), self.open_start)
+        
+    def merge(self, max_gap=0):
+        """Returns a new :class:`autoscrub.SilenceList` in which silences 
+        separated by no more than :code:`max_gap` seconds are joined together.
+        """
+        starts, ends, durations = [], [], []
+        for s, e, d in zip(self.starts, self.ends, self.durations):
+            if ends and s - ends[-1] <= max_gap:
+                if e > ends[-1]:
+                    ends[-1] = e
+                    durations[-1] = e - starts[-1]
+            else:
+                starts.append(s)
+                ends.append(e)
+                durations.append(d)
+        open_start = self.open_start
+        if open_start is not None and ends and open_start - ends[-1] <= max_gap:
+            open_start = starts.pop()
+            ends.pop()
+            durations.pop()
+        return SilenceList(starts, ends, durations, open_start)
+        
+    def take(self, indices):
+        """Returns a new :class:`autoscrub.SilenceList` containing the 
+        silences at :code:`indices` (which should be in ascending order).
+        """
+        return SilenceList([self.starts[i] for i in indices], [self.ends[i] for i in indices], 
+                           [self.durations[i] for i in indices], self.open_start)
+                           
+    def longer_than(self, min_duration):
+        """Returns a new :class:`autoscrub.SilenceList` containing only the 
+        silences whose duration is at least :code:`min_duration` seconds.
+        """
+        return self.take([i for i, d in enumerate(self.durations) if d >= min_duration])
+                           
+    def padded(self, delay):
+        """Returns the parts of each silence that are sped up when 
+        :code:`delay` seconds are omitted from each end of the silence. 
+        Silences shorter than :code:`2*delay` are dropped.
+        """
+        starts, ends = [], []
+        for s, e in zip(self.starts, self.ends):
+            if e - s > 2*delay:
+                starts.append(s + delay)
+                ends.append(e - delay)
+        return SilenceList(starts, ends)
+        
+    def clip(self, tstart=0, tstop=None):
+        """Returns a new :class:`autoscrub.SilenceList` containing the parts of
+        each silence between :code:`tstart` and :code:`tstop` (or the end of
+        the recording if :code:`tstop` is :code:`None`). The open silence is
+        kept if it begins before :code:`tstop`.
+        """
+        starts, ends = [], []
+        lo = bisect.bisect_right(self.ends, tstart)
+        hi = len(self) if tstop is None else bisect.bisect_left(self.starts, tstop)
+        for i in six.moves.xrange(lo, hi):
+            starts.append(max(self.starts[i], tstart))
+            ends.append(self.ends[i] if tstop is None else min(self.ends[i], tstop))
+        open_start = self.open_start
+        if open_start is not None and tstop is not None and open_start >= tstop:
+            open_start = None
+        elif open_start is not None:
+            open_start = max(open_start, tstart)
+        return SilenceList(starts, ends, open_start=open_start)
+        
+    def shift(self, offset):
+        """Returns a new :class:`autoscrub.SilenceList` with :code:`offset` 
+        seconds added to every timestamp.
+        """
+        return SilenceList([s + offset for s in self.starts], [e + offset for e in self.ends], self.durations, 
+                           None if self.open_start is None else self.open_start + offset)
+                           
+    def total_duration(self):
+        """Returns the total duration of the (closed) silences in seconds"""
+        return sum(self.durations)
+        
+    def removed_time(self, factor, delay=0.25):
+        """Returns the number of seconds removed from the recording when the
+        silences are sped up by :code:`factor` (omitting :code:`delay` seconds
+        from each end of each silence).
+        """
+        return sum(max(d - 2*delay, 0) for d in self.durations)*(1 - 1.0/factor)
+        
+    def output_duration(self, duration, factor, delay=0.25):
+        """Returns the duration of a recording of length :code:`duration` 
+        seconds once the silences are sped up by :code:`factor`.
+        """
+        return duration - self.removed_time(factor, delay)
+        
+    def output_time(self, t, factor, delay=0.25):
+        """Maps a timestamp (or list of timestamps) in the input recording to
+        the corresponding timestamp in the output, when the silences are sped
+        up by :code:`factor` (omitting :code:`delay` seconds from each end of
+        each silence).
+        """
+        fast = self.padded(delay)
+        # cumulative time removed by the end of each sped up interval
+        removed = array('d')
+        total = 0.0
+        for s, e in fast:
+            total += (e - s)*(1 - 1.0/factor)
+            removed.append(total)
+            
+        def map_time(t):
+            i = bisect.bisect_right(fast.starts, t) - 1
+            if i < 0:
+                return t
+            before = removed[i - 1] if i > 0 else 0.0
+            if t >= fast.ends[i]:
+                return t - removed[i]
+            return t - before - (t - fast.starts[i])*(1 - 1.0/factor)
+            
+        if isinstance(t, (list, tuple, array)):
+            return [map_time(x) for x in t]
+        return map_time(t)
+        
+        
+def optimizeSilences(silences, factor, delay=0.25, merge_gap=0, min_fast_duration=0.04, max_segments=None, 
+                     duration=None, hasten_audio=None):
+    """Simplifies a list of silences before it is passed to 
+    :func:`autoscrub.generateFilterGraph`.
+    
+    Each silence adds two segments (and around 10 filters) to the 
+    filtergraph, so this function reduces the number of segments by:
+    
+    * merging silences separated by no more than :code:`merge_gap` seconds 
+      (silences that overlap or touch are always merged),
+    * dropping silences whose sped up part (the silence minus 
+      :code:`delay` seconds at each end) is shorter than 
+      :code:`min_fast_duration` seconds, as these would produce empty or 
+      negative length trims, and
+    * if the filtergraph would still contain more than :code:`max_segments` 
+      segments, keeping only the longest silences.
+      
+    Arguments:
+        silences: A list of silence dictionaries generated from 
+                  :func:`autoscrub.getSilences` (or a 
+                  :class:`autoscrub.SilenceList`).
+                  
+        factor: to speed up video during (a subset of) each silent interval.
+        
+    Keyword Arguments:
+        delay: to omit from silent intervals when changing speed (default 0.25s)
+        
+        merge_gap: The maximum length (in seconds) of sound between two 
+                   silences for them to be merged (default 0).
+                   
+        min_fast_duration: The minimum duration (in seconds) of the sped up 
+                           part of a silence (default 0.04).
+                           
+        max_segments: The maximum number of segments in the filtergraph. 
+                      Defaults to :code:`None` (no limit).
+                      
+        duration: The duration of the input in seconds, used to predict the 
+                  output duration. Defaults to :code:`None`.
+                  
+        hasten_audio: The value that will be passed to 
+                      :func:`autoscrub.generateFilterGraph`, used to predict
+                      the number of filters (default None).
+                      
+    Returns:
+        A tuple of the optimised :class:`autoscrub.SilenceList` and a report
+        dictionary, with keys::
+        
+        silences:        the number of silences after optimisation
+        merged:          the number of silences removed by merging
+        pruned:          the number of degenerate silences dropped
+        capped:          the number of silences dropped to meet max_segments
+        segments:        the number of segments in the filtergraph
+        filter_nodes:    the number of filters in the silence filtergraph
+        removed_time:    the number of seconds removed by speeding up silences
+        output_duration: the predicted output duration in seconds (or None)
+    """
+    silences = SilenceList.from_silences(silences)
+    n_input = len(silences)
+    
+    # merge near-adjacent silences
+    silences = silences.merge(merge_gap)
+    n_merged = n_input - len(silences)
+    
+    # drop silences that would be sped up for (almost) no time
+    n_unpruned = len(silences)
+    silences = silences.take([i for i, d in enumerate(silences.durations) if d - 2*delay > 0 and d - 2*delay >= min_fast_duration])
+    n_pruned = n_unpruned - len(silences)
+    
+    # silenceFilterGraph ignores a silence at the start of the input
+    leading = 1 if len(silences) and silences.starts[0] <= 0 else 0
+    
+    # keep only the longest silences if there would be too many segments
+    n_capped = 0
+    if max_segments is not None:
+        max_silences = max((max_segments - 1)//2, 0)
+        if len(silences) - leading > max_silences:
+            longest = sorted(six.moves.xrange(leading, len(silences)), key=lambda i: silences.durations[i], reverse=True)[:max_silences]
+            n_capped = len(silences) - leading - max_silences
+            silences = silences.take(list(range(leading)) + sorted(longest))
+            
+    # predict the size of the filtergraph generated by silenceFilterGraph
+    n_fast = len(silences) - leading
+    if hasten_audio == 'pitch':
+        audio_filters = 5
+    elif hasten_audio == 'tempo':
+        q = math.log(factor, 2)
+        audio_filters = 3 + int(q) + (1 if q != int(q) else 0)
+    elif hasten_audio == 'mute':
+        audio_filters = 2
+    elif hasten_audio == 'noise':
+        audio_filters = 1
+    else:
+        audio_filters = 3
+    filter_nodes = 4*(n_fast + 1) + (2 + audio_filters)*n_fast + 1
+    
+    removed_time = silences.take(six.moves.xrange(leading, len(silences))).removed_time(factor, delay)
+    report = {'silences': len(silences),
+              'merged': n_merged,
+              'pruned': n_pruned,
+              'capped': n_capped,
+              'segments': 2*n_fast + 1,
+              'filter_nodes': filter_nodes,
+              'removed_time': removed_time,
+              'output_duration': None if duration is None else duration - removed_time,
+             }
+    return silences, report
+    
+    
+def _is_stream_pad(pad):
+    """Returns True if pad refers to an input stream (e.g. [0:v]) rather than 
+    the output of a filter"""
+    return re.match(r'^\[\d+(:[^\]]*)?\]$', pad) is not None
+    
+def _segment_pad(template, n):
+    """Returns the input pad for segment n from a pad template (either an 
+    input stream pad, or a pad name containing %i)"""
+    return template % n if '%i' in template else template
+
+
 def silenceFilterGraph(silences, factor, delay=0.25, audio_rate=44100, hasten_audio=None, silent_volume=1.0,
-                       v_in='[0:v]', a_in='[0:a]', v_out='[v]', a_out='[a]'):
+                       v_in='[0:v]', a_in='[0:a]', v_out='[v]', a_out='[a]', keep_leading_silence=False, audio_only=False,
+                       decimate_fast=False, v_fast_in=None):
     """Generate a filtergraph string (for processing with the -filter_complex
     flag of ffmpeg) using the trim and atrim filters to speed up periods in the
     video designated by a list of silence dictionaries, where each silence dictionary contains keys::
@@ -783,6 +2311,7 @@ def silenceFilterGraph(silences, factor, delay=0.25, audio_rate=44100, hasten_au
     
     Arguments:
         silences: A list of silence dictionaries generated from getSilences
+                  (or a :class:`autoscrub.SilenceList`)
         
         factor: to speed up video during (a subset of) each silent interval
 
@@ -792,24 +2321,61 @@ def silenceFilterGraph(silences, factor, delay=0.25, audio_rate=44100, hasten_au
         audio_rate: Sample rate of audio input (in Hz, default 44100) used in 
                     asetrate/aresample filters when hasten_audio=True
                     
-        hasten_audio: None, 'pitch' or 'tempo'. Speed up audio during silent
-                      segment by either increasing pitch (with asetrate and 
-                      aresample filters) or tempo (with atempo filter).
+        hasten_audio: None, 'pitch', 'tempo', 'mute' or 'noise'. Speed up 
+                      audio during silent segment by either increasing pitch 
+                      (with asetrate and aresample filters) or tempo (with 
+                      atempo filter), or replace it with generated silence 
+                      (with the anullsrc filter) or quiet pink noise (with 
+                      the anoisesrc filter) of the sped up duration. The 
+                      generated audio doesn't read (or decode) the input 
+                      audio of the silent segment at all.
                       
         silent_volume: scale the volume during silent segments (default 1.0;
-                       no scaling)
+                       no scaling). For :code:`hasten_audio='noise'`, this 
+                       scales the amplitude of the noise (-60 dBFS by 
+                       default).
                        
         v_in: The named filtergraph video input pad. Defaults to :code:`[0:v]` 
-              (see the `FFmpeg filter documentation`_).
+              (see the `FFmpeg filter documentation`_). If this is the output
+              of another filter (rather than an input stream), it is split 
+              with the split filter so that each segment can be trimmed from
+              it.
         
         a_in: The named filtergraph audio input pad. Defaults to :code:`[0:a]` 
-              (see the `FFmpeg filter documentation`_).
+              (see the `FFmpeg filter documentation`_). Output pads of other
+              filters are split with asplit (as for :code:`v_in`).
         
         v_out: The named filtergraph video output pad. Defaults to :code:`[v]` 
                (see the `FFmpeg filter documentation`_).
         
         a_out: The named filtergraph audio output pad. Defaults to :code:`[a]`  
                (see the `FFmpeg filter documentation`_).
+               
+        keep_leading_silence: If :code:`True`, a silence that begins at (or
+                              before) the start of the input is hastened 
+                              rather than omitted. This is used when 
+                              rendering chunks that begin part way through a
+                              silent interval (default False).
+                              
+        audio_only: If :code:`True`, only the audio half of the filtergraph 
+                    (the atrim filters) is generated, :code:`v_in` and 
+                    :code:`v_out` are ignored, and the concat filter outputs
+                    audio only (default False).
+                    
+        decimate_fast: If :code:`True`, only every :code:`int(factor)`-th 
+                       frame of each sped up segment is kept (with the 
+                       framestep filter), so the sped up segments have the 
+                       frame rate of the input rather than :code:`factor` 
+                       times it, and the encoder doesn't process frames that
+                       would never be displayed (default False).
+                       
+        v_fast_in: The input stream pad (e.g. :code:`[1:v]`) to trim the sped
+                   up segments from, instead of :code:`v_in`. This is used to 
+                   read the sped up segments from a second input that only 
+                   decodes keyframes (see the :code:`keyframes_fast` argument 
+                   of :func:`autoscrub.ffmpegComplexFilter`), in which case 
+                   :code:`decimate_fast` is ignored. Defaults to 
+                   :code:`None` (use :code:`v_in`).
                        
     Returns:
         The generated filtergraph as a string
@@ -817,13 +2383,13 @@ def silenceFilterGraph(silences, factor, delay=0.25, audio_rate=44100, hasten_au
     .. _`FFmpeg filter documentation`: http://ffmpeg.org/ffmpeg-filters.html#Filtergraph-syntax-1
     
     """
-    # Omit silences at the start/end of the file
-    if len(silences) > 0:
-        if 'silence_end' not in silences[-1]:
-            silences = silences[:-1]
-    if len(silences) > 0:
-        if silences[0]['silence_start'] <= 0.:
-            silences = silences[1:]    
+    # Omit silences at the start/end of the file (silences without an end
+    # are not included in the starts/ends of a SilenceList)
+    silences = SilenceList.from_silences(silences)
+    first = 0
+    if len(silences) > 0 and not keep_leading_silence:
+        if silences.starts[0] <= 0.:
+            first = 1
 
     # Timestamp of end of most recently processed segment
     tf_last = 0
@@ -835,60 +2401,103 @@ def silenceFilterGraph(silences, factor, delay=0.25, audio_rate=44100, hasten_au
     # String to call concat filter with
     concat_string = ''
 
-    # Number of silences to process
-    n = len(silences)
-
-    # Number of segments (only because any beginning/end silences are gone)
-    n_segs = 2*n + 1
-    
-    # Generate 4 x filtergraph lines for each silence
-    for i, s in enumerate(silences):
-        # Number segments in filtergraph from 1 to n_segs
-        i += 1
-
+    # Number of segments processed so far (segments are numbered from 1)
+    n_segs = 0
+    
+    # Input stream pads (e.g. [0:v]) can feed any number of filters, but the 
+    # output pad of a filter can only be used once, so it must be split into
+    # one pad per segment. The split filters are added once all the segments
+    # have been counted, and the trims read from the pads it will produce.
+    v_template = v_in if _is_stream_pad(v_in) else '[%s_%%i]' % v_in.strip('[]')
+    a_template = a_in if _is_stream_pad(a_in) else '[%s_%%i]' % a_in.strip('[]')
+    
+    # Sped up segments are read from the keyframe only input (if any), which 
+    # doesn't need splitting as it must be an input stream pad
+    if v_fast_in is not None and not _is_stream_pad(v_fast_in):
+        raise ValueError('[autoscrub:error] v_fast_in must be an input stream pad (such as [1:v]), not %s' % v_fast_in)
+    fast_template = v_template if v_fast_in is None else v_fast_in
+    fast_segs = []
+    
+    # Audio of sped up segments that is generated rather than trimmed from
+    # the input
+    generate_audio = hasten_audio in ['mute', 'noise']
+    
+    # Drop the frames of sped up segments that exceed the input frame rate
+    # (keyframes are already sparse enough)
+    framestep_str = 'framestep=%i,' % int(factor) if decimate_fast and int(factor) > 1 and v_fast_in is None else ''
+    
+    if hasten_audio == 'tempo':
+        # speed up audio with a chain of atempo filters (each is limited to a factor of 2)
+        q = math.log(factor, 2)
+        tempos = ['atempo=2.0']*int(q)
+        if q != int(q):
+            tempos.append('atempo=%.3f/%d'%(factor, 2**int(q)))                
+        tempo_str = ','.join(tempos)
+    
+    # Generate (up to) 4 x filtergraph lines for each silence
+    for silence_start, silence_end, silence_duration in zip(silences.starts[first:], silences.ends[first:], silences.durations[first:]):
         # Cast end of last segment to string
         t0 = '%.4f' % tf_last
 
         # Begin trim (& speedup) delay seconds after silence_start
-        ti = '%.4f' % (s['silence_start'] + delay)
+        ti = '%.4f' % max(silence_start + delay, 0)
 
         # End trim (& speedup) delay seconds before silence_end
-        tf = '%.4f' % (s['silence_end'] - delay)
+        tf = '%.4f' % (silence_end - delay)
 
         # Predicted duration of sped up segment based on above and factor 
-        ta = '%.4f' % (s['silence_start'] + delay + (s['silence_duration'] - 2*delay)/factor)
+        ta = '%.4f' % (silence_start + delay + (silence_duration - 2*delay)/factor)
 
-        # Trim video before this silence (regular speed)
-        vstrings.append('%strim=%s:%s,setpts=PTS-STARTPTS[v%i];' % (v_in, t0, ti, (2*i-1)))
+        # Trim video before this silence (regular speed), unless the silence
+        # is hastened from the very start of the input
+        if float(ti) > 0:
+            n_segs += 1
+            vstrings.append('%strim=%s:%s,setpts=PTS-STARTPTS[v%i];' % (_segment_pad(v_template, n_segs), t0, ti, n_segs))
+            astrings.append('%satrim=%s:%s,asetpts=PTS-STARTPTS[a%i];' % (_segment_pad(a_template, n_segs), t0, ti, n_segs))
+            concat_string += '[v%i][a%i]' % (n_segs, n_segs)
 
         # Trim video during this silence and speed up using setpts
-        vstrings.append('%strim=%s:%s,setpts=(PTS-STARTPTS)/%i[v%i];' % (v_in, ti, tf, factor, (2*i)))
+        n_segs += 1
+        fast_segs.append(n_segs)
+        vstrings.append('%strim=%s:%s,%ssetpts=(PTS-STARTPTS)/%i[v%i];' % (_segment_pad(fast_template, n_segs), ti, tf, framestep_str, factor, n_segs))
 
-        # Trim video before this silence (regular speed)
-        astrings.append('%satrim=%s:%s,asetpts=PTS-STARTPTS[a%i];' % (a_in, t0, ti, (2*i-1)))
         if hasten_audio == 'pitch':
             # Speed up audio during silent segment with asetrate and aresample filters (increases pitch)
-            astrings.append('%satrim=%s:%s,asetpts=PTS-STARTPTS,asetrate=%i,aresample=%i,volume=%.3f[a%i];' % (a_in, ti, tf, (factor*audio_rate), audio_rate, silent_volume, (2*i)))
+            astrings.append('%satrim=%s:%s,asetpts=PTS-STARTPTS,asetrate=%i,aresample=%i,volume=%.3f[a%i];' % (_segment_pad(a_template, n_segs), ti, tf, (factor*audio_rate), audio_rate, silent_volume, n_segs))
         elif hasten_audio == 'tempo':
             # speed up audio during silent segment with atempo (increases tempo)
-            q = math.log(factor, 2)
-            tempos = ['atempo=2.0']*int(q)
-            if q != int(q):
-                tempos.append('atempo=%.3f/%d'%(factor, 2**int(q)))                
-            tempo_str = ','.join(tempos)
-            
-            astrings.append('%satrim=%s:%s,asetpts=PTS-STARTPTS,%s,volume=%.3f[a%i];' % (a_in, ti, tf, tempo_str, silent_volume, (2*i)))
+            astrings.append('%satrim=%s:%s,asetpts=PTS-STARTPTS,%s,volume=%.3f[a%i];' % (_segment_pad(a_template, n_segs), ti, tf, tempo_str, silent_volume, n_segs))
+        elif hasten_audio == 'mute':
+            # generate silence for the duration of the sped up segment
+            astrings.append('anullsrc=r=%i,atrim=duration=%.4f[a%i];' % (audio_rate, float(ta) - float(ti), n_segs))
+        elif hasten_audio == 'noise':
+            # generate a quiet noise bed for the duration of the sped up segment
+            astrings.append('anoisesrc=r=%i:c=pink:a=%.6f:d=%.4f[a%i];' % (audio_rate, 0.001*silent_volume, float(ta) - float(ti), n_segs))
         else:
             # Use first 1/factor samples of silence for audio (no pitch increase)
-            astrings.append('%satrim=%s:%s,asetpts=PTS-STARTPTS,volume=%.3f[a%i];' % (a_in, ti, ta, silent_volume, (2*i)))
+            astrings.append('%satrim=%s:%s,asetpts=PTS-STARTPTS,volume=%.3f[a%i];' % (_segment_pad(a_template, n_segs), ti, ta, silent_volume, n_segs))
 
         # Append these streams to the concat filter input
-        concat_string += '[v%i][a%i][v%i][a%i]' % ((2*i-1), (2*i-1), (2*i), (2*i))
-        tf_last = s['silence_end'] - delay
+        concat_string += '[v%i][a%i]' % (n_segs, n_segs)
+        tf_last = silence_end - delay
     
     # Trim the final segment (regular speed) without specifying the end time
-    vstrings.append('%strim=start=%.4f,setpts=PTS-STARTPTS[v%i];' % (v_in, tf_last, n_segs))
-    astrings.append('%satrim=start=%.4f,asetpts=PTS-STARTPTS[a%i];' % (a_in, tf_last, n_segs))
+    n_segs += 1
+    vstrings.append('%strim=start=%.4f,setpts=PTS-STARTPTS[v%i];' % (_segment_pad(v_template, n_segs), tf_last, n_segs))
+    astrings.append('%satrim=start=%.4f,asetpts=PTS-STARTPTS[a%i];' % (_segment_pad(a_template, n_segs), tf_last, n_segs))
+    
+    # Split filter outputs into one pad per segment
+    if v_template != v_in:
+        pads = [v_template % n for n in range(1, n_segs + 1) if v_fast_in is None or n not in fast_segs]
+        vstrings.insert(0, '%ssplit=%i%s;' % (v_in, len(pads), ''.join(pads)))
+    if a_template != a_in:
+        pads = [a_template % n for n in range(1, n_segs + 1) if not generate_audio or n not in fast_segs]
+        astrings.insert(0, '%sasplit=%i%s;' % (a_in, len(pads), ''.join(pads)))
+    
+    if audio_only:
+        concat_string = ''.join(['[a%i]' % (i + 1) for i in range(n_segs)])
+        concat_string += 'concat=n=%i:v=0:a=1%s;' % (n_segs, a_out)
+        return '\n'.join(astrings + [concat_string])
     
     # Finish the concat filter call
     concat_string += '[v%i][a%i]concat=n=%i:v=1:a=1%s%s;' % (n_segs, n_segs, n_segs, v_out, a_out)
@@ -926,7 +2535,14 @@ def resizeFilterGraph(v_in='[0:v]', width=1920, height=1080, pad=True,
     
     """
     vstrings = []
-    v_scaled = '[scaled]' if pad else v_out
+    # name the intermediate pad after the output pad so that several resized
+    # outputs can share one filtergraph
+    if not pad:
+        v_scaled = v_out
+    elif v_out == '[v]':
+        v_scaled = '[scaled]'
+    else:
+        v_scaled = '[%s_scaled]' % v_out.strip('[]')
     vstrings.append('%sscale=w=%i:h=%i:force_original_aspect_ratio=%s%s;' % (v_in, width, height, mode, v_scaled))
     if pad:
         vstrings.append('%spad=%s:%s:(ow-iw)/2:(oh-ih)/2%s;' % (v_scaled, width, height, v_out))
@@ -974,7 +2590,101 @@ def panGainAudioGraph(a_in='[0:a]', duplicate_ch='left', gain=0, a_out='[a]'):
         return None
 
 
-def generateFilterGraph(silences, factor, delay=0.25, rescale=True, pan_audio='left', gain=0, audio_rate=44100, hasten_audio=None, silent_volume=1.0):
+def dedupFilterGraph(v_in='[vd]', v_out='[v]', max_drop=150):
+    """Generate a filtergraph string (for processing with the -filter_complex
+    flag of ffmpeg) using the mpdecimate filter to drop frames that barely 
+    differ from the previous frame (for example, while a slide is shown in a
+    screen recording). The timestamps of the remaining frames are kept, so 
+    the output has a variable frame rate and must be encoded with 
+    :code:`-vsync vfr` (see the :code:`dedup` argument of 
+    :func:`autoscrub.ffmpegComplexFilter`).
+
+    Keyword arguments:
+        v_in: The named filtergraph video input pad. Defaults to :code:`[vd]`.
+        
+        v_out: The named filtergraph video output pad. Defaults to :code:`[v]`.
+        
+        max_drop: The maximum number of consecutive frames to drop, so that a
+                  frame is still encoded periodically during long static 
+                  periods (default 150). If 0, there is no limit.
+              
+    Returns:
+        The generated filtergraph as a string.
+    """
+    return '%smpdecimate=max=%i%s;' % (v_in, max_drop, v_out)
+    
+    
+def _normalise_rendition(rendition):
+    """Returns a rendition as a dictionary with width, height and pad keys"""
+    if isinstance(rendition, dict):
+        assert 'width' in rendition and 'height' in rendition
+        return {'width': int(rendition['width']), 'height': int(rendition['height']), 'pad': rendition.get('pad', True)}
+    width, height = rendition
+    return {'width': int(width), 'height': int(height), 'pad': True}
+
+
+def renditionsFilterGraph(renditions, v_in='[vn]', a_in='[an]'):
+    """Generate a filtergraph string (for processing with the -filter_complex
+    flag of ffmpeg) that splits a video and audio stream into one copy per 
+    rendition, and scales (and pads) each copy of the video to the size of 
+    the rendition.
+    
+    Rendition :code:`i` is output on the :code:`[v_r<i>]` and 
+    :code:`[a_r<i>]` pads, which are mapped to the output files by 
+    :func:`autoscrub.ffmpegComplexFilter` when given a list of output paths.
+    
+    Arguments:
+        renditions: A list of :code:`(width, height)` tuples, or of 
+                    dictionaries containing :code:`width` and :code:`height`
+                    keys (and optionally a :code:`pad` key, see 
+                    :func:`autoscrub.resizeFilterGraph`).
+    
+    Keyword arguments:
+        v_in: The named filtergraph video input pad. Defaults to :code:`[vn]`.
+        
+        a_in: The named filtergraph audio input pad. Defaults to :code:`[an]`.
+        
+    Returns:
+        The generated filtergraph as a string.
+    """
+    renditions = [_normalise_rendition(r) for r in renditions]
+    n = len(renditions)
+    vstrings = []
+    if n == 1:
+        # split can't have a single output
+        v_splits = [v_in]
+        vstrings.append('%sanull[a_r0];' % a_in)
+    else:
+        v_splits = ['[vs%i]' % i for i in range(n)]
+        vstrings.append('%ssplit=%i%s;' % (v_in, n, ''.join(v_splits)))
+        vstrings.append('%sasplit=%i%s;' % (a_in, n, ''.join(['[a_r%i]' % i for i in range(n)])))
+    for i, rendition in enumerate(renditions):
+        vstrings.append(resizeFilterGraph(v_in=v_splits[i], width=rendition['width'], height=rendition['height'], 
+                                          pad=rendition['pad'], v_out='[v_r%i]' % i))
+    return '\n'.join(vstrings)
+    
+    
+def renditionPaths(output_path, renditions):
+    """Returns an output path for each rendition, formed by appending the 
+    rendition height to :code:`output_path` (for example, 
+    :code:`lecture_720p.mp4`).
+    
+    Arguments:
+        output_path: The path to base the rendition paths on.
+        
+        renditions: A list of renditions (see 
+                    :func:`autoscrub.renditionsFilterGraph`).
+                    
+    Returns:
+        A list of paths.
+    """
+    prefix, extension = os.path.splitext(output_path)
+    return ['%s_%ip%s' % (prefix, _normalise_rendition(r)['height'], extension) for r in renditions]
+
+
+def generateFilterGraph(silences, factor, delay=0.25, rescale=True, pan_audio='left', gain=0, audio_rate=44100, hasten_audio=None, silent_volume=1.0,
+                        keep_leading_silence=False, renditions=None, v_in='[0:v]', a_in='[0:a]', audio_only=False, decimate_fast=False,
+                        dedup=False, keyframes_fast=False):
     """Generate a filtergraph string (for processing with the -filter_complex
     flag of ffmpeg) using the trim and atrim filters to speed up periods in the
     video designated by a list of silence dictionaries. This function calls :func:`autoscrub.silenceFilterGraph`, :func:`autoscrub.resizeFilterGraph` and :func:`panGainAudioGraph` as appropriate.
@@ -998,18 +2708,88 @@ def generateFilterGraph(silences, factor, delay=0.25, rescale=True, pan_audio='l
         audio_rate: Sample rate of audio input (in Hz, default 44100) used in 
                     asetrate/aresample filters when :code:`hasten_audio=True`.
                     
-        hasten_audio: None, 'pitch' or 'tempo'. Speed up audio during silent
-                      segment by either increasing pitch (with asetrate and 
-                      aresample filters) or tempo (with atempo filter).
+        hasten_audio: None, 'pitch', 'tempo', 'mute' or 'noise'. Speed up 
+                      audio during silent segment by either increasing pitch 
+                      (with asetrate and aresample filters) or tempo (with 
+                      atempo filter), or replace it with generated silence or
+                      noise (see :func:`autoscrub.silenceFilterGraph`).
                       
         silent_volume: scale the volume during silent segments (default 1.0; 
                        no scaling).
                        
+        keep_leading_silence: Hasten a silence at the start of the input 
+                              (default False). See 
+                              :func:`autoscrub.silenceFilterGraph`.
+                              
+        renditions: A list of output sizes (see 
+                    :func:`autoscrub.renditionsFilterGraph`). If specified, 
+                    the processed video is split into one scaled copy per 
+                    rendition (on the :code:`[v_r<i>]` and :code:`[a_r<i>]` 
+                    pads)
+                    so all renditions are encoded from a single decode and 
+                    filter pass, and :code:`rescale` is ignored. Defaults to
+                    :code:`None`.
+                    
+        v_in: The named filtergraph video input pad (default :code:`[0:v]`).
+              See :func:`autoscrub.silenceFilterGraph`.
+              
+        a_in: The named filtergraph audio input pad (default :code:`[0:a]`).
+              See :func:`autoscrub.silenceFilterGraph`.
+              
+        audio_only: Generate a filtergraph that only processes (and outputs)
+                    audio, for audio inputs or audio exports of videos. 
+                    :code:`rescale` and :code:`renditions` are ignored 
+                    (default False).
+                    
+        decimate_fast: Drop the frames of sped up segments that exceed the 
+                       input frame rate (default False). See 
+                       :func:`autoscrub.silenceFilterGraph`.
+                       
+        dedup: Drop near-duplicate frames after the segments are joined 
+               (default False). See :func:`autoscrub.dedupFilterGraph`. The
+               filtergraph must then be run by 
+               :func:`autoscrub.ffmpegComplexFilter` with :code:`dedup=True`.
+               
+        keyframes_fast: Trim the sped up segments from the second input 
+                        (:code:`[1:v]`) rather than :code:`v_in` (default 
+                        False). The filtergraph must then be run by 
+                        :func:`autoscrub.ffmpegComplexFilter` with 
+                        :code:`keyframes_fast=True`, which adds a second copy
+                        of the input that only decodes keyframes.
+                       
     Returns:
         The generated filtergraph as a string.
     """
-    filter_graph = silenceFilterGraph(silences, factor, audio_rate=audio_rate, hasten_audio=hasten_audio, silent_volume=silent_volume, delay=delay,
-                        v_out='[vn]' if rescale else '[v]', a_out='[an]' if gain or pan_audio else '[a]')
+    if audio_only:
+        filter_graph = silenceFilterGraph(silences, factor, audio_rate=audio_rate, hasten_audio=hasten_audio, silent_volume=silent_volume, delay=delay,
+                            a_in=a_in, a_out='[an]' if gain or pan_audio else '[a]', keep_leading_silence=keep_leading_silence, audio_only=True)
+        if pan_audio or gain:
+            filter_graph += '\n' + panGainAudioGraph(a_in='[an]', duplicate_ch=pan_audio, gain=gain)
+        if filter_graph.endswith(';'):
+            filter_graph = filter_graph[:-1]
+        return filter_graph
+        
+    v_fast_in = '[1:v]' if keyframes_fast else None
+    if renditions:
+        a_out = '[ap]' if gain or pan_audio else '[an]'
+        filter_graph = silenceFilterGraph(silences, factor, audio_rate=audio_rate, hasten_audio=hasten_audio, silent_volume=silent_volume, delay=delay,
+                            v_in=v_in, a_in=a_in, v_out='[vd]' if dedup else '[vn]', a_out=a_out, keep_leading_silence=keep_leading_silence, 
+                            decimate_fast=decimate_fast, v_fast_in=v_fast_in)
+        if dedup:
+            filter_graph += '\n' + dedupFilterGraph(v_in='[vd]', v_out='[vn]')
+        if pan_audio or gain:
+            filter_graph += '\n' + panGainAudioGraph(a_in='[ap]', duplicate_ch=pan_audio, gain=gain, a_out='[an]')
+        filter_graph += '\n' + renditionsFilterGraph(renditions)
+        if filter_graph.endswith(';'):
+            filter_graph = filter_graph[:-1]
+        return filter_graph
+        
+    v_out = '[vn]' if rescale else '[v]'
+    filter_graph = silenceFilterGraph(silences, factor, audio_rate=audio_rate, hasten_audio=hasten_audio, silent_volume=silent_volume, delay=delay, v_in=v_in, a_in=a_in,
+                        v_out='[vd]' if dedup else v_out, a_out='[an]' if gain or pan_audio else '[a]', keep_leading_silence=keep_leading_silence,
+                        decimate_fast=decimate_fast, v_fast_in=v_fast_in)
+    if dedup:
+        filter_graph += '\n' + dedupFilterGraph(v_in='[vd]', v_out=v_out)
     if rescale is True:
         filter_graph += '\n' + resizeFilterGraph(v_in='[vn]')
     elif isinstance(rescale, list) or isinstance(rescale, tuple) and len(rescale) == 2:
@@ -1047,7 +2827,87 @@ def writeFilterGraph(filter_script_path, silences, factor, **kwargs):
         f.write(filter_graph)
 
 
-def ffmpegComplexFilter(input_path, filter_script_path, output_path=NUL, run_command=True, overwrite=None, stderr_callback=None):
+# Segmented streaming formats that ffmpegComplexFilter can package the 
+# output in, keyed by the extension of the playlist/manifest
+_packaging_formats = {'.m3u8': 'hls', '.mpd': 'dash'}
+
+
+def _packaging_args(output_format, output_path, renditions=0, segment_duration=6):
+    """Returns the ffmpeg muxer arguments and the output path used to write
+    an HLS or DASH package to output_path. The segments are written next to 
+    the playlist/manifest and named after it."""
+    prefix = os.path.splitext(output_path)[0]
+    if output_format == 'hls':
+        args = ['-f', 'hls', '-hls_time', '%g' % segment_duration, '-hls_playlist_type', 'vod', '-hls_flags', 'independent_segments']
+        if renditions:
+            # one media playlist per rendition, listed in a master playlist
+            var_stream_map = ' '.join(['v:%i,a:%i' % (i, i) for i in range(renditions)])
+            args += ['-var_stream_map', var_stream_map, '-master_pl_name', os.path.basename(output_path), 
+                     '-hls_segment_filename', prefix + '_%v_%05d.ts']
+            output_path = prefix + '_%v.m3u8'
+        else:
+            args += ['-hls_segment_filename', prefix + '_%05d.ts']
+    elif output_format == 'dash':
+        name = os.path.basename(prefix)
+        args = ['-f', 'dash', '-seg_duration', '%g' % segment_duration, '-use_template', '1', '-use_timeline', '1',
+                '-adaptation_sets', 'id=0,streams=v id=1,streams=a', 
+                '-init_seg_name', name + '_init_$RepresentationID$.m4s', '-media_seg_name', name + '_$RepresentationID$_$Number%05d$.m4s']
+    else:
+        raise ValueError('[autoscrub:error] Unknown output format "%s". Must be one of: %s' % (output_format, ', '.join(sorted(_packaging_formats.values()))))
+    return args, output_path
+
+
+# Audio file extensions (that select the audio only mode of 
+# ffmpegComplexFilter) and the arguments used to encode them
+_audio_encoders = {'.m4a': ['-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart'],
+                   '.aac': ['-c:a', 'aac', '-b:a', '128k'],
+                   '.opus': ['-c:a', 'libopus', '-b:a', '64k'],
+                   '.ogg': ['-c:a', 'libopus', '-b:a', '64k'],
+                   '.oga': ['-c:a', 'libvorbis', '-q:a', '4'],
+                   '.mp3': ['-c:a', 'libmp3lame', '-b:a', '128k'],
+                   '.flac': ['-c:a', 'flac'],
+                   '.wav': ['-c:a', 'pcm_s16le'],
+                   '.aif': ['-c:a', 'pcm_s16be'],
+                   '.aiff': ['-c:a', 'pcm_s16be'],
+                   '.mka': [],
+                   }
+                   
+def isAudioOutput(output_path):
+    """Returns :code:`True` if :code:`output_path` has the extension of an 
+    audio file (such as :code:`.m4a`, :code:`.mp3` or :code:`.wav`), for 
+    which only the audio is rendered.
+    
+    Arguments:
+        output_path: The path of the output file.
+    """
+    return os.path.splitext(output_path)[1].lower() in _audio_encoders
+    
+
+def _ffmpeg_audio_filter(input_path, filter_script_path, output_path, run_command=True, overwrite=None, stderr_callback=None, input_args=None, threads=None):
+    """Runs the audio only mode of ffmpegComplexFilter"""
+    thread_input, thread_output = _thread_args(threads, 'transcode', None)
+    if threads is not False:
+        # audio filters aren't multithreaded
+        thread_input += ['-filter_complex_threads', '1']
+    # -vn before -i stops the video streams being read from the input
+    command_list = ['ffmpeg'] + thread_input + (list(input_args) if input_args else []) + ['-vn', '-i', '%s' % input_path]
+    command_list += ['-filter_complex_script', '%s' % filter_script_path, '-map', '[a]']
+    # other extensions use the default encoder of the output format
+    command_list += _audio_encoders.get(os.path.splitext(output_path)[1].lower(), [])
+    if __suppress_output and overwrite is None:
+        raise RuntimeError("[autoscrub:error] If ffmpeg output is suppressed, you must specify the overwrite keyword argument or else ffmpeg will hang on user input.")
+    if overwrite is not None:
+        command_list.append('-y' if overwrite else '-n')
+    command_list.append('%s' % output_path)
+    if run_command:
+        p = _agnostic_Popen(command_list)
+        stdout, stderr = _agnostic_communicate(p, new_line_callback=stderr_callback)
+    return command_list
+    
+    
+def ffmpegComplexFilter(input_path, filter_script_path, output_path=NUL, run_command=True, overwrite=None, stderr_callback=None, input_args=None, threads=None,
+                        output_format=None, renditions=None, segment_duration=6, audio_only=None, dedup=False,
+                        keyframes_fast=False):
     """Executes the ffmpeg command and processes a complex filter
     
     Prepare and execute (if run_command) ffmpeg command for processing 
@@ -1064,7 +2924,11 @@ def ffmpegComplexFilter(input_path, filter_script_path, output_path=NUL, run_com
     
     Keyword Arguments:
         output_path: The path to save the processed video (defaults to 
-                     os.devnull).
+                     os.devnull). If a list of paths, output :code:`i` is 
+                     made from the :code:`[v_r<i>]` and :code:`[a_r<i>]` 
+                     pads of the filtergraph (see the :code:`renditions` argument
+                     of :func:`autoscrub.generateFilterGraph`), and all 
+                     outputs are encoded by a single ffmpeg process.
         
         run_command: If False, simply prepare and return the command for 
                      debugging or later use (default: True).
@@ -1080,12 +2944,88 @@ def ffmpegComplexFilter(input_path, filter_script_path, output_path=NUL, run_com
                          new line is printed to stderr by ffmpeg. Useful for 
                          monitoring the progress of ffmpeg in realtime.
                          Defaults to None.
+                         
+        input_args: A list of additional arguments to place before the 
+                    :code:`-i` option of ffmpeg (for example, to seek within
+                    the input with :code:`-ss` and :code:`-t`). Defaults to 
+                    None.
+                    
+        threads: The thread allocation (from 
+                 :func:`autoscrub.threadAllocation`) used for decoding, 
+                 filtering and encoding. Defaults to :code:`None` (calculated
+                 when the command is prepared). If :code:`False`, ffmpeg 
+                 chooses the number of threads.
+                 
+        output_format: :code:`'hls'` or :code:`'dash'` to package the output 
+                       as segmented HLS or DASH, writing the playlist (or 
+                       manifest) to :code:`output_path` and the segments 
+                       alongside it. Keyframes are forced at every segment
+                       boundary so the segments of all renditions align. 
+                       Defaults to :code:`None` (HLS if :code:`output_path`
+                       ends in :code:`.m3u8`, DASH if it ends in 
+                       :code:`.mpd`, otherwise a single file).
+                       
+        renditions: The renditions in the filter script (see 
+                    :func:`autoscrub.generateFilterGraph`), which are 
+                    packaged as variants of a single HLS master playlist or 
+                    DASH manifest. Only used with :code:`output_format`. 
+                    Defaults to :code:`None`.
+                    
+        segment_duration: The target duration (in seconds) of each HLS or 
+                          DASH segment (default 6).
+                          
+        audio_only: If :code:`True`, the video of the input is not read and 
+                    only the :code:`[a]` pad of the filter script (see the 
+                    :code:`audio_only` argument of 
+                    :func:`autoscrub.generateFilterGraph`) is encoded, with 
+                    an encoder suited to the extension of 
+                    :code:`output_path` (such as AAC for :code:`.m4a`, Opus 
+                    for :code:`.opus`/:code:`.ogg` and MP3 for 
+                    :code:`.mp3`), or the default encoder of the output 
+                    format for other extensions. Defaults to :code:`None` 
+                    (audio only if :func:`autoscrub.isAudioOutput` is 
+                    :code:`True` for :code:`output_path`).
+                    
+        dedup: Set to :code:`True` if the filter script drops duplicate 
+               frames (see the :code:`dedup` argument of 
+               :func:`autoscrub.generateFilterGraph`), so that the video is
+               encoded with a variable frame rate and tuned for still 
+               images (default False).
+               
+        keyframes_fast: Set to :code:`True` if the filter script reads the 
+                        sped up segments from :code:`[1:v]` (see the 
+                        :code:`keyframes_fast` argument of 
+                        :func:`autoscrub.generateFilterGraph`). The input is 
+                        then opened a second time with 
+                        :code:`-skip_frame nokey`, so that the decoder skips 
+                        every frame apart from the keyframes within the sped 
+                        up segments (default False).
                    
     Returns:
         the FFmpeg command sequence as a list (to be passed to :code:`subprocess.Popen` or formatted into a string for printing).
     """
-    header = ['ffmpeg', '-i', '%s'% input_path] 
+    output_paths = list(output_path) if isinstance(output_path, (list, tuple)) else None
+    extension = os.path.splitext(output_path)[1].lower() if not output_paths else ''
+    if audio_only is None:
+        audio_only = extension in _audio_encoders
+    if audio_only:
+        return _ffmpeg_audio_filter(input_path, filter_script_path, output_path, run_command, overwrite, stderr_callback, input_args, threads)
+    if output_format is None and not output_paths:
+        output_format = _packaging_formats.get(os.path.splitext(output_path)[1].lower())
+    encoders = len(output_paths) if output_paths else (len(renditions) if output_format and renditions else 1)
+    if encoders > 1 and threads is not False:
+        # the encoders of the outputs share the cores of the job
+        threads = dict(threads or threadAllocation())
+        threads['encode_threads'] = max(1, threads['encode_threads'] // encoders)
+    thread_input, thread_output = _thread_args(threads)
+    header = ['ffmpeg'] + thread_input + (list(input_args) if input_args else []) + ['-i', '%s'% input_path]
+    if keyframes_fast:
+        # the same section of the input, decoding only the keyframes
+        header += thread_input + (list(input_args) if input_args else []) + ['-skip_frame', 'nokey', '-i', '%s'% input_path]
     youtube_video = ['-c:v', 'libx264', '-crf', '20', '-bf', '2', '-flags', '+cgop', '-g', '15', '-pix_fmt', 'yuv420p', '-movflags', '+faststart'] # -tune stillimage
+    if dedup:
+        # keep the timestamps of the frames that remain after mpdecimate
+        youtube_video[2:2] = ['-tune', 'stillimage', '-vsync', 'vfr']
     youtube_audio = ['-c:a', 'aac', '-r:a', '48000', '-b:a', '192k']
     youtube_other = ['-strict', '-2']
     filter_command = ['-filter_complex_script', '%s'%filter_script_path, '-map', '[v]', '-map', '[a]'] 
@@ -1098,7 +3038,33 @@ def ffmpegComplexFilter(input_path, filter_script_path, output_path=NUL, run_com
             tail.insert(0, '-y')
         else:
             tail.insert(0, '-n')
-    command_list = header + youtube_video + youtube_audio + youtube_other + filter_command + tail
+    if output_paths:
+        # encoding options apply to the next output, so repeat them for each
+        # (apart from -filter_complex_threads, which is a global option)
+        global_args = ['-filter_complex_script', '%s'%filter_script_path] + tail[:-1]
+        if '-filter_complex_threads' in thread_output:
+            i = thread_output.index('-filter_complex_threads')
+            global_args += thread_output[i:i+2]
+            thread_output = thread_output[:i] + thread_output[i+2:]
+        outputs = []
+        for i, path in enumerate(output_paths):
+            outputs += ['-map', '[v_r%i]' % i, '-map', '[a_r%i]' % i] + youtube_video + youtube_audio + youtube_other + thread_output + ['%s' % path]
+        command_list = header + global_args + outputs
+    elif output_format:
+        # segmented outputs don't need the index moved to the start of the file
+        video = youtube_video[:youtube_video.index('-movflags')]
+        keyframes = ['-force_key_frames', 'expr:gte(t,n_forced*%g)' % segment_duration]
+        if renditions:
+            maps = []
+            for i in range(len(renditions)):
+                maps += ['-map', '[v_r%i]' % i, '-map', '[a_r%i]' % i]
+        else:
+            maps = ['-map', '[v]', '-map', '[a]']
+        muxer_args, playlist_path = _packaging_args(output_format, output_path, len(renditions) if renditions else 0, segment_duration)
+        command_list = (header + ['-filter_complex_script', '%s'%filter_script_path] + maps + video + keyframes + youtube_audio + 
+                        youtube_other + thread_output + muxer_args + tail[:-1] + [playlist_path])
+    else:
+        command_list = header + youtube_video + youtube_audio + youtube_other + thread_output + filter_command + tail
     
     if run_command:
         # print('Running ffmpeg command:')
@@ -1111,6 +3077,856 @@ def ffmpegComplexFilter(input_path, filter_script_path, output_path=NUL, run_com
     return command_list
 
 
+def renderPreview(input_path, output_path, silences, factor, height=360, video_bitrate=400, overwrite=None, stderr_callback=None, **kwargs):
+    """Renders a fast, low resolution preview of the result of 
+    :func:`autoscrub.ffmpegComplexFilter`.
+    
+    The preview contains the same segments as the full render, so it can be
+    used to review the effect of the silence threshold and speed before 
+    running a full quality encode. The video is scaled down before it is 
+    split into segments (so the trim, setpts and concat filters only handle 
+    small frames), the decoder skips the deblocking filter, and the result
+    is encoded with the ultrafast x264 preset at a low bitrate.
+    
+    Arguments:
+        input_path: The path to the video file to process.
+        
+        output_path: The path to save the preview to.
+        
+        silences: A list of silence dictionaries generated from 
+                  :func:`autoscrub.getSilences` (or a 
+                  :class:`autoscrub.SilenceList`).
+                  
+        factor: to speed up video during (a subset of) each silent interval.
+        
+    Keyword Arguments:
+        height: The height (in pixels) of the preview (default 360).
+        
+        video_bitrate: The maximum video bitrate in kbit/s (default 400).
+        
+        overwrite: If :code:`True`, overwrites the :code:`output_path` with no
+                   prompt. If :code:`False`, the function will fail if the
+                   :code:`output_path` exists. Defaults to :code:`None` 
+                   (prompts user for input). You must specify a value if you 
+                   have suppressed terminal output with 
+                   :func:`autoscrub.suppress_ffmpeg_output`
+                   
+        stderr_callback: See :func:`autoscrub.ffmpegComplexFilter`.
+        
+        kwargs: Accepts keyword arguments of 
+                :func:`autoscrub.generateFilterGraph` (:code:`rescale` and 
+                :code:`renditions` are ignored).
+                
+    Returns:
+        the FFmpeg command sequence as a list.
+    """
+    kwargs.pop('rescale', None)
+    kwargs.pop('renditions', None)
+    filter_graph = '[0:v]scale=w=-2:h=%i[vlow];\n' % height + generateFilterGraph(silences, factor, rescale=False, v_in='[vlow]', **kwargs)
+    
+    thread_input, thread_output = _thread_args(None)
+    command_list = (['ffmpeg'] + thread_input + ['-skip_loop_filter', 'all', '-flags2', '+fast', '-i', '%s' % input_path] + 
+                    ['-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'fastdecode', '-crf', '28', '-maxrate', '%ik' % video_bitrate, 
+                     '-bufsize', '%ik' % (2*video_bitrate), '-pix_fmt', 'yuv420p', '-movflags', '+faststart'] + 
+                    ['-c:a', 'aac', '-b:a', '64k'] + thread_output)
+    if __suppress_output and overwrite is None:
+        raise RuntimeError("[autoscrub:error] If ffmpeg output is suppressed, you must specify the overwrite keyword argument or else ffmpeg will hang on user input.")
+    if overwrite is not None:
+        command_list.append('-y' if overwrite else '-n')
+        
+    handle, filter_script_path = tempfile.mkstemp(suffix='.filter-script')
+    os.close(handle)
+    try:
+        with open(filter_script_path, 'w') as f:
+            f.write(filter_graph)
+        command_list += ['-filter_complex_script', filter_script_path, '-map', '[v]', '-map', '[a]', '%s' % output_path]
+        p = _agnostic_Popen(command_list)
+        stdout, stderr = _agnostic_communicate(p, new_line_callback=stderr_callback)
+    finally:
+        os.remove(filter_script_path)
+    return command_list
+    
+    
+def _clip_silences(silences, tstart=0, tstop=None, delay=0.25):
+    """Restrict a list of silences to the interval [tstart, tstop] and shift 
+    them so that they are relative to tstart.
+    
+    Only silences that would be (at least partially) sped up within the 
+    interval are retained. A silence that begins before tstart keeps its 
+    (negative) relative start time so that it can be rendered with 
+    :code:`keep_leading_silence=True`.
+    
+    Returns:
+        A :class:`autoscrub.SilenceList`
+    """
+    silences = SilenceList.from_silences(silences)
+    starts, ends = [], []
+    for silence_start, silence_end in silences:
+        fast_start = max(silence_start + delay, tstart)
+        fast_stop = silence_end - delay
+        if tstop is not None:
+            fast_stop = min(fast_stop, tstop)
+        if fast_stop <= fast_start:
+            continue
+        starts.append(silence_start - tstart)
+        ends.append((silence_end if tstop is None else min(silence_end, tstop)) - tstart)
+    return SilenceList(starts, ends)
+    
+    
+def renderChunk(input_path, output_path, silences, factor, tstart=0, tstop=None, overwrite=None, stderr_callback=None, **kwargs):
+    """Renders the section of :code:`input_path` between :code:`tstart` and 
+    :code:`tstop` with the silences hastened.
+    
+    The input is seeked with input-side :code:`-ss`/:code:`-t` options so that
+    only the requested section is decoded. Chunks rendered with the same 
+    settings can be joined with :func:`autoscrub.concatSegments` (without
+    re-encoding) to produce the same result as processing the whole file.
+    Chunks should begin exactly :code:`delay` seconds after the start of a
+    silence, or in a non-silent part of the input.
+    
+    Arguments:
+        input_path: The path to the video file to process.
+        
+        output_path: The path to save the rendered chunk.
+        
+        silences: A list of silence dictionaries for the whole input (with
+                  timestamps relative to the start of :code:`input_path`), 
+                  generated from :func:`autoscrub.getSilences`.
+                  
+        factor: to speed up video during (a subset of) each silent interval.
+        
+    Keyword Arguments:
+        tstart: The start of the chunk in seconds (default 0).
+        
+        tstop: The end of the chunk in seconds. Defaults to :code:`None` (the
+               end of the input).
+               
+        overwrite: If :code:`True`, overwrites the :code:`output_path` with no
+                   prompt. If :code:`False`, the function will fail if the
+                   :code:`output_path` exists. Defaults to :code:`None` 
+                   (prompts user for input). You must specify a value if you 
+                   have suppressed terminal output with 
+                   :func:`autoscrub.suppress_ffmpeg_output`
+                   
+        stderr_callback: See :func:`autoscrub.ffmpegComplexFilter`.
+        
+        kwargs: Accepts keyword arguments of :func:`autoscrub.generateFilterGraph`.
+        
+    Returns:
+        the FFmpeg command sequence as a list.
+    """
+    filter_graph = _chunk_filter_graph(silences, factor, tstart, tstop, **kwargs)
+    
+    handle, filter_script_path = tempfile.mkstemp(suffix='.filter-script')
+    os.close(handle)
+    try:
+        with open(filter_script_path, 'w') as f:
+            f.write(filter_graph)
+        return ffmpegComplexFilter(input_path, filter_script_path, output_path, run_command=True, overwrite=overwrite, 
+                                   stderr_callback=stderr_callback, input_args=_chunk_input_args(tstart, tstop), dedup=kwargs.get('dedup', False),
+                                   keyframes_fast=kwargs.get('keyframes_fast', False))
+    finally:
+        os.remove(filter_script_path)
+        
+        
+def _chunk_filter_graph(silences, factor, tstart=0, tstop=None, **kwargs):
+    """Generates the filtergraph used by :func:`autoscrub.renderChunk`"""
+    chunk_silences = _clip_silences(silences, tstart, tstop, kwargs.get('delay', 0.25))
+    return generateFilterGraph(chunk_silences, factor, keep_leading_silence=tstart > 0, **kwargs)
+    
+    
+def _chunk_input_args(tstart=0, tstop=None):
+    """Generates the ffmpeg input options used by :func:`autoscrub.renderChunk`"""
+    input_args = []
+    if tstart > 0:
+        input_args += ['-ss', '%.4f' % tstart]
+    if tstop is not None:
+        input_args += ['-t', '%.4f' % (tstop - tstart)]
+    return input_args
+    
+
+def _find_live_chunk_boundary(silences, earliest, delay):
+    """Returns the first point at which a live recording can be split into
+    chunks, at or after :code:`earliest`, or None if there is no such point.
+    
+    Chunks are split :code:`delay` seconds after the start of a silence, which
+    is exactly where :func:`autoscrub.silenceFilterGraph` begins the speed up.
+    """
+    for s in silences:
+        if 'silence_end' not in s:
+            continue
+        boundary = s['silence_start'] + delay
+        if boundary >= earliest and s['silence_end'] - delay > boundary:
+            return boundary
+    return None
+    
+    
+def liveProcess(input_path, output_path, factor, input_threshold_dB=-18.0, silence_duration=2.0, delay=0.25,
+                chunk_duration=300, poll_interval=15, idle_timeout=60, temp_folder=None, overwrite=None, 
+                chunk_callback=None, **kwargs):
+    """Processes a recording that is still being written.
+    
+    The growing input file is polled every :code:`poll_interval` seconds. 
+    Silences are detected in the part of the recording that was added since
+    the previous poll (plus enough of the part before it to detect silences
+    that span the two), and once a silence has been settled (its end has 
+    been detected) at least :code:`chunk_duration` seconds into the 
+    unrendered part, the recording up to that silence is rendered with 
+    :func:`autoscrub.renderChunk`.
+    When the input file has not grown for :code:`idle_timeout` seconds, the 
+    recording is assumed to be complete, the remainder is rendered and all 
+    chunks are joined (without re-encoding) into :code:`output_path`.
+    
+    .. note::The input must be in a container that can be read while it is 
+             being written (for example Matroska or MPEG-TS). 
+    
+    Arguments:
+        input_path: The path to the (growing) video file to process.
+        
+        output_path: The path to save the processed video.
+        
+        factor: to speed up video during (a subset of) each silent interval.
+        
+    Keyword Arguments:
+        input_threshold_dB: instantaneous level (in dB) to detect silences with 
+                            (default -18).
+                         
+        silence_duration: seconds for which level mustn't exceed threshold to 
+                          declare silence (default 2).
+                          
+        delay: to omit from silent intervals when changing speed (default 0.25s)
+        
+        chunk_duration: The minimum duration (in seconds of input) of each 
+                        rendered chunk (default 300).
+        
+        poll_interval: The number of seconds to wait between checks of the
+                       input file (default 15).
+                       
+        idle_timeout: The number of seconds the input file must remain 
+                      unchanged for the recording to be considered complete
+                      (default 60).
+        
+        temp_folder: The folder in which to store the rendered chunks. 
+                     Defaults to a new temporary folder, which is removed once
+                     the output has been written.
+        
+        overwrite: If :code:`True`, overwrites the :code:`output_path` with no
+                   prompt. If :code:`False`, the function will fail if the
+                   :code:`output_path` exists. Defaults to :code:`None` 
+                   (prompts user for input). You must specify a value if you 
+                   have suppressed terminal output with 
+                   :func:`autoscrub.suppress_ffmpeg_output`
+                   
+        chunk_callback: A reference to a python function to be called with
+                        :code:`(chunk_path, tstart, tstop)` each time a chunk
+                        has been rendered. :code:`tstop` is :code:`None` for
+                        the final chunk. Defaults to None.
+                   
+        kwargs: Accepts keyword arguments of :func:`autoscrub.generateFilterGraph`
+                (except :code:`delay`).
+        
+    Returns:
+        :code:`output_path` if successful or :code:`None`.
+    """
+    if __suppress_output and overwrite is None:
+        raise RuntimeError("[autoscrub:error] If ffmpeg output is suppressed, you must specify the overwrite keyword argument or else ffmpeg will hang on user input.")
+    
+    remove_temp_folder = temp_folder is None
+    if temp_folder is None:
+        temp_folder = tempfile.mkdtemp(prefix='autoscrub_live_')
+    elif not os.path.exists(temp_folder):
+        os.mkdir(temp_folder)
+    
+    filename_prefix, file_extension = os.path.splitext(os.path.basename(output_path))
+    chunk_paths = []
+    chunk_start = 0.0
+    # The settled silences (which won't change as the recording grows), and
+    # the unsettled silences found by the latest analysis
+    silences = []
+    unsettled = []
+    analyse_from = 0.0
+    last_size = None
+    last_growth = time.time()
+    
+    while True:
+        size = os.path.getsize(input_path)
+        if size != last_size:
+            last_size = size
+            last_growth = time.time()
+        finished = time.time() - last_growth >= idle_timeout
+        
+        # Find silences in the part of the recording that hasn't been rendered
+        command = ['ffmpeg'] + _thread_args(None, 'analyse')[0]
+        if analyse_from > 0:
+            command += ['-ss', '%.4f' % analyse_from]
+        command += ['-i', '%s' % input_path, '-vn', '-af', 'silencedetect=n=%.1fdB:d=%s' % (input_threshold_dB, silence_duration), '-f', 'null', '%s' % NUL]
+        found = []
+        analysed_until = None
+        for event in iterLogEvents(command, write_to_terminal=False):
+            if isinstance(event, SilenceEvent):
+                found.append(_silence_event_to_dict(event._replace(start=event.start + analyse_from, 
+                                                                    end=None if event.end is None else event.end + analyse_from)))
+            elif isinstance(event, ProgressEvent):
+                analysed_until = event.time + analyse_from
+        
+        if analysed_until is not None:
+            # A silence is only settled once it has ended and ffmpeg has read 
+            # enough of the recording after it to be sure it wasn't truncated
+            # by the end of the file
+            unsettled = []
+            for s in found:
+                if 'silence_end' in s and s['silence_end'] + silence_duration <= analysed_until and not unsettled:
+                    silences.append(s)
+                else:
+                    unsettled.append(s)
+            # The next analysis starts at the first unsettled silence, so that
+            # it is detected in full, or else early enough to detect a silence
+            # that began too recently to be reported
+            # (rounded down to the precision of the -ss option)
+            if unsettled:
+                analyse_from = math.floor(unsettled[0]['silence_start']*1e4)/1e4
+            else:
+                analyse_from = max(analyse_from, math.floor((analysed_until - silence_duration)*1e4)/1e4)
+        
+        if finished:
+            chunk_stop = None
+        else:
+            chunk_stop = _find_live_chunk_boundary(silences, chunk_start + chunk_duration, delay)
+            if chunk_stop is None:
+                time.sleep(poll_interval)
+                continue
+        
+        chunk_path = os.path.join(temp_folder, filename_prefix + '_%03i' % len(chunk_paths) + file_extension)
+        print('[autoscrub:info] Rendering live chunk %03i (from %s to %s)' % (len(chunk_paths), seconds_to_hhmmssd(chunk_start), 
+                                                                              'end' if chunk_stop is None else seconds_to_hhmmssd(chunk_stop)))
+        renderChunk(input_path, chunk_path, silences + unsettled, factor, chunk_start, chunk_stop, overwrite=True, delay=delay, **kwargs)
+        chunk_paths.append(chunk_path)
+        if chunk_callback is not None:
+            chunk_callback(chunk_path, chunk_start, chunk_stop)
+        
+        if chunk_stop is None:
+            break
+        chunk_start = chunk_stop
+    
+    concat_path = os.path.join(temp_folder, filename_prefix + '_concat.txt')
+    with open(concat_path, 'w') as f:
+        f.write('\n'.join(["file '%s'" % path for path in chunk_paths]))
+    result = concatFileList(concat_path, output_path, overwrite)
+    
+    if remove_temp_folder and result is not None:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+    return result
+    
+
+def chunkBoundaries(silences, chunk_duration=300, delay=0.25):
+    """Splits a recording into chunks for rendering with 
+    :func:`autoscrub.renderChunk`.
+    
+    Chunk boundaries are anchored to a fixed grid (multiples of 
+    :code:`chunk_duration`): each boundary is placed at the first point at 
+    or after a grid line where a silence begins to be sped up. Changes to 
+    the silence list therefore only move the boundaries (and change the 
+    contents of the chunks) near the changed silences.
+    
+    Arguments:
+        silences: A list of silence dictionaries generated from 
+                  :func:`autoscrub.getSilences` (or a 
+                  :class:`autoscrub.SilenceList`).
+                  
+    Keyword Arguments:
+        chunk_duration: The approximate duration (in seconds of input) of 
+                        each chunk (default 300).
+                        
+        delay: to omit from silent intervals when changing speed (default 0.25s)
+        
+    Returns:
+        A list of :code:`(tstart, tstop)` tuples covering the recording. The 
+        :code:`tstop` of the final chunk is :code:`None`.
+    """
+    silences = SilenceList.from_silences(silences)
+    cut_points = [s + delay for s, e in silences if s > 0 and e - s > 2*delay]
+    boundaries = []
+    tstart = 0.0
+    for cut_point in cut_points:
+        if cut_point >= (math.floor(tstart/chunk_duration) + 1)*chunk_duration:
+            boundaries.append((tstart, cut_point))
+            tstart = cut_point
+    boundaries.append((tstart, None))
+    return boundaries
+    
+    
+class ChunkCache(object):
+    """A content-addressed store of rendered chunks.
+    
+    Each chunk is stored under a key derived from everything that affects its
+    contents (see :meth:`autoscrub.ChunkCache.key`), so a chunk is only 
+    rendered again when one of those inputs changes. When the total size of
+    the cache exceeds :code:`max_size`, the least recently used chunks are 
+    removed.
+    
+    Keyword Arguments:
+        cache_dir: The folder in which to store chunks. Defaults to the 
+                   :code:`AUTOSCRUB_CACHE_DIR` environment variable, or 
+                   :code:`~/.cache/autoscrub/chunks` if it is not set.
+                   
+        max_size: The maximum total size of the cache in bytes (default 20 GB).
+    """
+    def __init__(self, cache_dir=None, max_size=20*1024**3):
+        if cache_dir is None:
+            cache_dir = os.environ.get('AUTOSCRUB_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'autoscrub', 'chunks'))
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+            
+    @staticmethod
+    def key(input_fingerprint, tstart, tstop, filter_graph, encoding_args):
+        """Computes the cache key of a chunk.
+        
+        Arguments:
+            input_fingerprint: The fingerprint of the input file, as returned 
+                               by :func:`autoscrub.fileFingerprint`.
+                               
+            tstart: The start of the chunk in seconds.
+            
+            tstop: The end of the chunk in seconds (or :code:`None`).
+            
+            filter_graph: The filtergraph used to render the chunk.
+            
+            encoding_args: A list of the ffmpeg arguments used to encode the
+                           chunk.
+        
+        Returns:
+            The key as a hexadecimal string.
+        """
+        description = json.dumps([input_fingerprint, 
+                                  '%.4f' % tstart, 
+                                  None if tstop is None else '%.4f' % tstop, 
+                                  filter_graph, 
+                                  list(encoding_args)])
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+        
+    def path(self, key, extension='.mp4'):
+        """Returns the path at which the chunk with :code:`key` is stored"""
+        return os.path.join(self.cache_dir, key[:2], key + extension)
+        
+    def get(self, key, extension='.mp4'):
+        """Returns the path of the cached chunk with :code:`key`, or None if
+        the chunk is not in the cache.
+        """
+        path = self.path(key, extension)
+        if not os.path.exists(path):
+            return None
+        # mark the chunk as recently used
+        os.utime(path, None)
+        return path
+        
+    def put(self, key, chunk_path, extension='.mp4'):
+        """Moves a rendered chunk into the cache and returns its new path"""
+        path = self.path(key, extension)
+        folder = os.path.dirname(path)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        shutil.move(chunk_path, path)
+        return path
+        
+    def evict(self, keep=()):
+        """Removes the least recently used chunks until the cache is no larger
+        than :code:`max_size`. Paths in :code:`keep` are never removed.
+        """
+        entries = []
+        for folder, dirnames, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                path = os.path.join(folder, filename)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for mtime, size, path in entries)
+        keep = set(keep)
+        for mtime, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if path in keep:
+                continue
+            os.remove(path)
+            total_size -= size
+            
+
+def _chunk_plan(input_path, silences, factor, chunk_duration=300, **kwargs):
+    """Returns a list of :code:`(tstart, tstop, key)` tuples for the chunks 
+    that renderCached and renderResumable split a render into, where key is 
+    the :meth:`autoscrub.ChunkCache.key` of the chunk"""
+    input_fingerprint = fileFingerprint(input_path)
+    # The encoding arguments are everything in the ffmpeg command except the 
+    # input, filter script and output paths and the thread counts (which 
+    # don't affect the result)
+    encoding_args = ffmpegComplexFilter(input_path, NUL, NUL, run_command=False, overwrite=True, threads=False, dedup=kwargs.get('dedup', False))[3:-1]
+    
+    plan = []
+    for tstart, tstop in chunkBoundaries(silences, chunk_duration, kwargs.get('delay', 0.25)):
+        filter_graph = _chunk_filter_graph(silences, factor, tstart, tstop, **kwargs)
+        plan.append((tstart, tstop, ChunkCache.key(input_fingerprint, tstart, tstop, filter_graph, _chunk_input_args(tstart, tstop) + encoding_args)))
+    return plan
+    
+    
+def renderCached(input_path, output_path, silences, factor, cache=None, chunk_duration=300, overwrite=None, stderr_callback=None, **kwargs):
+    """Processes :code:`input_path` in chunks, reusing chunks that have already
+    been rendered with identical settings.
+    
+    The recording is split with :func:`autoscrub.chunkBoundaries`. Chunks 
+    whose key (see :meth:`autoscrub.ChunkCache.key`) is not in the cache are 
+    rendered with :func:`autoscrub.renderChunk` and added to the cache. All 
+    chunks are then joined (without re-encoding) into :code:`output_path`.
+    
+    Arguments:
+        input_path: The path to the video file to process.
+        
+        output_path: The path to save the processed video.
+        
+        silences: A list of silence dictionaries generated from 
+                  :func:`autoscrub.getSilences`.
+                  
+        factor: to speed up video during (a subset of) each silent interval.
+        
+    Keyword Arguments:
+        cache: The :class:`autoscrub.ChunkCache` to use. Defaults to a 
+               :class:`autoscrub.ChunkCache` with default settings.
+               
+        chunk_duration: The approximate duration (in seconds of input) of each
+                        chunk (default 300).
+                        
+        overwrite: If :code:`True`, overwrites the :code:`output_path` with no
+                   prompt. If :code:`False`, the function will fail if the
+                   :code:`output_path` exists. Defaults to :code:`None` 
+                   (prompts user for input). You must specify a value if you 
+                   have suppressed terminal output with 
+                   :func:`autoscrub.suppress_ffmpeg_output`
+        
+        stderr_callback: Passed to :func:`autoscrub.renderChunk` for each 
+                         chunk that is rendered. See 
+                         :func:`autoscrub.ffmpegComplexFilter`.
+        
+        kwargs: Accepts keyword arguments of :func:`autoscrub.generateFilterGraph`.
+        
+    Returns:
+        :code:`output_path` if successful or :code:`None`.
+    """
+    if cache is None:
+        cache = ChunkCache()
+    extension = os.path.splitext(output_path)[1] or '.mp4'
+    
+    plan = _chunk_plan(input_path, silences, factor, chunk_duration, **kwargs)
+    chunk_paths = []
+    for i, (tstart, tstop, key) in enumerate(plan):
+        chunk_path = cache.get(key, extension)
+        if chunk_path is None:
+            print('[autoscrub:info] Rendering chunk %i of %i' % (i + 1, len(plan)))
+            handle, temp_path = tempfile.mkstemp(suffix=extension)
+            os.close(handle)
+            try:
+                renderChunk(input_path, temp_path, silences, factor, tstart, tstop, overwrite=True, 
+                            stderr_callback=stderr_callback, **kwargs)
+                chunk_path = cache.put(key, temp_path, extension)
+            except AutoscrubException as e:
+                print(e)
+                print('[autoscrub:error] Could not render chunk %i of %i' % (i + 1, len(plan)))
+                return None
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        else:
+            print('[autoscrub:info] Reusing cached chunk %i of %i' % (i + 1, len(plan)))
+        chunk_paths.append(chunk_path)
+        
+    handle, concat_path = tempfile.mkstemp(suffix='_concat.txt')
+    os.close(handle)
+    try:
+        with open(concat_path, 'w') as f:
+            f.write('\n'.join(["file '%s'" % path for path in chunk_paths]))
+        result = concatFileList(concat_path, output_path, overwrite)
+    finally:
+        os.remove(concat_path)
+    cache.evict(keep=chunk_paths)
+    return result
+    
+    
+def _replace_file(src, dst):
+    """Renames src to dst, replacing dst if it exists (atomically, where the
+    platform supports it)"""
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+        
+        
+def _write_json_atomic(path, data):
+    """Writes data to the JSON file at path, so that path either contains the
+    old or the new data if the process is killed part way through"""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    _replace_file(temp_path, path)
+    
+    
+def renderResumable(input_path, output_path, silences, factor, work_dir=None, chunk_duration=300, overwrite=None, stderr_callback=None, **kwargs):
+    """Processes :code:`input_path` in chunks that are checkpointed as they 
+    finish, so that a render that is interrupted (for example, by a crash, 
+    reboot or being terminated) can be resumed by calling this function again
+    with the same arguments.
+    
+    The recording is split with :func:`autoscrub.chunkBoundaries`. Each chunk
+    is rendered with :func:`autoscrub.renderChunk` to a temporary file in 
+    :code:`work_dir`, which is renamed once the chunk is complete and then 
+    recorded (with its fingerprint) in the state file 
+    :code:`work_dir/state.json`. When resuming, a chunk is reused only if it 
+    has the same key (see :meth:`autoscrub.ChunkCache.key`) as in the new 
+    plan and its file still matches the fingerprint recorded in the state 
+    file, so changing the input or any of the settings renders the affected
+    chunks again. Once all chunks are complete they are joined (without 
+    re-encoding) into a temporary file that is renamed to 
+    :code:`output_path`, and :code:`work_dir` is removed.
+    
+    Arguments:
+        input_path: The path to the video file to process.
+        
+        output_path: The path to save the processed video.
+        
+        silences: A list of silence dictionaries generated from 
+                  :func:`autoscrub.getSilences`.
+                  
+        factor: to speed up video during (a subset of) each silent interval.
+        
+    Keyword Arguments:
+        work_dir: The folder in which to store the finished chunks and the 
+                  state file. Defaults to :code:`output_path` with the 
+                  extension replaced by :code:`.autoscrub-resume`.
+                  
+        chunk_duration: The approximate duration (in seconds of input) of each
+                        chunk (default 300).
+                        
+        overwrite: If :code:`True`, replaces :code:`output_path` if it 
+                   exists. Otherwise, nothing is rendered if 
+                   :code:`output_path` exists (default :code:`None`).
+        
+        stderr_callback: Passed to :func:`autoscrub.renderChunk` for each 
+                         chunk that is rendered. See 
+                         :func:`autoscrub.ffmpegComplexFilter`.
+        
+        kwargs: Accepts keyword arguments of :func:`autoscrub.generateFilterGraph`.
+        
+    Returns:
+        :code:`output_path` if successful or :code:`None`.
+    """
+    if not overwrite and os.path.exists(output_path):
+        print('[autoscrub:error] The output file %s already exists' % output_path)
+        return None
+    prefix, extension = os.path.splitext(output_path)
+    extension = extension or '.mp4'
+    if work_dir is None:
+        work_dir = prefix + '.autoscrub-resume'
+    if not os.path.exists(work_dir):
+        os.makedirs(work_dir)
+    state_path = os.path.join(work_dir, 'state.json')
+    
+    # the chunks finished by a previous run, keyed by chunk key
+    finished = {}
+    if os.path.exists(state_path):
+        try:
+            with open(state_path, 'r') as f:
+                finished = json.load(f).get('finished', {})
+        except ValueError:
+            print('[autoscrub:warning] Ignoring the unreadable state file %s' % state_path)
+            
+    plan = _chunk_plan(input_path, silences, factor, chunk_duration, **kwargs)
+    keys = [key for tstart, tstop, key in plan]
+    
+    # forget (and delete) the chunks that are not part of the new plan 
+    for key in list(finished):
+        if key not in keys:
+            chunk_path = os.path.join(work_dir, key + extension)
+            if os.path.exists(chunk_path):
+                os.remove(chunk_path)
+            del finished[key]
+    state = {'input_path': os.path.abspath(input_path), 
+             'output_path': os.path.abspath(output_path), 
+             'plan': [[tstart, tstop, key] for tstart, tstop, key in plan], 
+             'finished': finished}
+    _write_json_atomic(state_path, state)
+    
+    chunk_paths = []
+    for i, (tstart, tstop, key) in enumerate(plan):
+        chunk_path = os.path.join(work_dir, key + extension)
+        if key in finished and os.path.exists(chunk_path) and fileFingerprint(chunk_path) == finished[key]:
+            print('[autoscrub:info] Reusing finished chunk %i of %i' % (i + 1, len(plan)))
+        else:
+            print('[autoscrub:info] Rendering chunk %i of %i' % (i + 1, len(plan)))
+            temp_path = os.path.join(work_dir, key + '.partial' + extension)
+            try:
+                renderChunk(input_path, temp_path, silences, factor, tstart, tstop, overwrite=True, 
+                            stderr_callback=stderr_callback, **kwargs)
+                _replace_file(temp_path, chunk_path)
+            except AutoscrubException as e:
+                print(e)
+                print('[autoscrub:error] Could not render chunk %i of %i' % (i + 1, len(plan)))
+                return None
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            state['finished'][key] = fileFingerprint(chunk_path)
+            _write_json_atomic(state_path, state)
+        chunk_paths.append(chunk_path)
+        
+    # join the chunks next to the output, so the rename doesn't cross devices
+    concat_path = os.path.join(work_dir, 'concat.txt')
+    with open(concat_path, 'w') as f:
+        f.write('\n'.join(["file '%s'" % os.path.abspath(path) for path in chunk_paths]))
+    joined_path = prefix + '.partial' + extension
+    if concatFileList(concat_path, joined_path, overwrite=True) is None:
+        return None
+    _replace_file(joined_path, output_path)
+    shutil.rmtree(work_dir)
+    return output_path
+    
+
+def autoscrubFile(input_path, output_path, factor=8, target_lufs=-18.0, target_threshold=-18.0, silence_duration=2.0, delay=0.25,
+                  hasten_audio='tempo', pan_audio=None, rescale=None, merge_gap=0, max_segments=None, resume=False, chunk_duration=300,
+                  overwrite=None, stderr_callback=None, progress_callback=None, **kwargs):
+    """Processes :code:`input_path` in the same way as 
+    :code:`autoscrub autoprocess`, without prompting.
+    
+    The loudness, sample rate and silences of the input are measured (reading
+    them from the library index, if one is set), the silences are simplified
+    with :func:`autoscrub.optimizeSilences` and the filtergraph is rendered 
+    with :func:`autoscrub.ffmpegComplexFilter` (or 
+    :func:`autoscrub.renderResumable` if :code:`resume` is :code:`True`). An
+    audio only output is produced if :code:`output_path` has an audio file 
+    extension or the input has no video.
+    
+    Arguments:
+        input_path: The path to the media file to process.
+        
+        output_path: The path to save the processed file.
+        
+    Keyword Arguments:
+        factor: to speed up video during (a subset of) each silent interval
+                (default 8).
+                
+        target_lufs: The target loudness of the output in dBLUFS (default -18).
+        
+        target_threshold: The silence threshold in dB, relative to an input at
+                          :code:`target_lufs` (default -18).
+                          
+        silence_duration: seconds for which level mustn't exceed threshold to 
+                          declare silence (default 2).
+                          
+        delay: to omit from silent intervals when changing speed (default 0.25s)
+        
+        hasten_audio: :code:`'trunc'`, :code:`'pitch'`, :code:`'tempo'`, 
+                      :code:`'mute'` or :code:`'noise'` (default 'tempo', see
+                      :func:`autoscrub.silenceFilterGraph`).
+                      
+        pan_audio: :code:`'left'` or :code:`'right'` to copy that channel to 
+                   both channels (which also reduces the gain by 3dB), or 
+                   :code:`None` (default).
+                   
+        rescale: A :code:`(width, height)` tuple to resize the video to, or 
+                 :code:`None` (default).
+                 
+        merge_gap: See :func:`autoscrub.optimizeSilences` (default 0).
+        
+        max_segments: See :func:`autoscrub.optimizeSilences` (default None).
+        
+        resume: If :code:`True`, the video is rendered in checkpointed chunks
+                with :func:`autoscrub.renderResumable`, so that calling this 
+                function again after an interruption only renders the 
+                unfinished chunks (default False). Ignored for audio only 
+                outputs.
+                
+        chunk_duration: The duration of each chunk when :code:`resume` is 
+                        :code:`True` (default 300).
+                        
+        overwrite: See :func:`autoscrub.ffmpegComplexFilter`.
+        
+        stderr_callback: See :func:`autoscrub.ffmpegComplexFilter` (called
+                         for each chunk when :code:`resume` is 
+                         :code:`True`).
+                         
+        progress_callback: A function called with the estimated fraction of 
+                           the output that has been rendered (from 0 to 1) 
+                           as ffmpeg reports its progress (only once the 
+                           output is complete when :code:`resume` is 
+                           :code:`True`). Defaults to None.
+        
+        kwargs: Accepts the other keyword arguments of 
+                :func:`autoscrub.generateFilterGraph` (such as 
+                :code:`silent_volume`, :code:`decimate_fast`, :code:`dedup`
+                and :code:`keyframes_fast`).
+                
+    Returns:
+        :code:`output_path` if successful or :code:`None`.
+    """
+    if not (2*delay < silence_duration):
+        raise AutoscrubException('[autoscrub:error] The delay must be less than half of the silence duration')
+    audio_rate = getSampleRate(input_path)
+    if audio_rate is None:
+        raise AutoscrubException('[autoscrub:error] Could not determine the audio samplerate of {}'.format(input_path))
+    loudness = getLoudness(input_path)
+    input_lufs = loudness.get('I') if loudness is not None else None
+    if input_lufs is None:
+        raise AutoscrubException('[autoscrub:error] Could not determine the loudness of {}'.format(input_path))
+    gain = target_lufs - input_lufs - (3 if pan_audio in ['left', 'right'] else 0)
+    input_threshold_dB = input_lufs + target_threshold - target_lufs
+    print('[autoscrub:info] Measured loudness = %.1f dBLUFS; Silence threshold = %.1f dB; Gain to apply = %.1f dB' % (input_lufs, input_threshold_dB, gain))
+    
+    if hasten_audio == 'trunc':
+        hasten_audio = None
+    silences = getSilences(input_path, input_threshold_dB, silence_duration, False)
+    silences, report = optimizeSilences(silences, factor, delay, merge_gap=merge_gap, max_segments=max_segments, hasten_audio=hasten_audio)
+    
+    audio_only = isAudioOutput(output_path) or not hasVideo(input_path)
+    filter_graph_kwargs = dict(audio_rate=audio_rate, pan_audio=pan_audio, gain=gain, rescale=rescale, hasten_audio=hasten_audio, delay=delay)
+    filter_graph_kwargs.update(kwargs)
+    if audio_only:
+        for key in ['decimate_fast', 'dedup', 'keyframes_fast', 'renditions']:
+            filter_graph_kwargs.pop(key, None)
+        filter_graph_kwargs['audio_only'] = True
+    elif resume:
+        result = renderResumable(input_path, output_path, silences, factor, chunk_duration=chunk_duration, overwrite=overwrite, 
+                                 stderr_callback=stderr_callback, **filter_graph_kwargs)
+        if result is not None and progress_callback is not None:
+            progress_callback(1.0)
+        return result
+    
+    callback = stderr_callback
+    if progress_callback is not None:
+        estimated_duration = SilenceList.from_silences(silences).output_duration(getDuration(input_path), factor, delay)
+        def callback(line):
+            if stderr_callback is not None:
+                stderr_callback(line)
+            if 'time=' in line and estimated_duration:
+                try:
+                    seconds = hhmmssd_to_seconds(line.split('time=')[-1].split(' ')[0])
+                except Exception:
+                    return
+                progress_callback(min(seconds/estimated_duration, 1.0))
+    
+    handle, filter_script_path = tempfile.mkstemp(suffix='.filter-script')
+    os.close(handle)
+    try:
+        writeFilterGraph(filter_script_path, silences, factor, **filter_graph_kwargs)
+        ffmpegComplexFilter(input_path, filter_script_path, output_path, run_command=True, overwrite=overwrite, stderr_callback=callback,
+                            audio_only=audio_only, dedup=filter_graph_kwargs.get('dedup', False), 
+                            keyframes_fast=filter_graph_kwargs.get('keyframes_fast', False))
+    finally:
+        os.remove(filter_script_path)
+    if progress_callback is not None:
+        progress_callback(1.0)
+    return output_path
+    
+
 if __name__ == '__main__':
     # Loudness normalisation
     target_lufs = -18.0
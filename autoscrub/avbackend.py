@@ -0,0 +1,369 @@
+# Copyright 2017 Russell Anderson, Philip Starkey
+#
+# This file is part of autoscrub.
+#
+# autoscrub is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoscrub is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autoscrub.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Probing, audio analysis and stream copy trimming with the libav libraries
+(through PyAV), in the autoscrub process rather than in ffmpeg/ffprobe
+subprocesses.
+
+This avoids starting a process and parsing its log for each operation, which
+dominates when processing many short files, and decodes the audio into numpy
+arrays (without copying the decoded samples) so that several analyses can
+share one decode (see :func:`autoscrub.avbackend.analyseAudio`).
+
+Requires PyAV and numpy (the :code:`libav` extra). Call
+:func:`autoscrub.use_libav` to have :func:`autoscrub.getDuration`,
+:func:`autoscrub.getSampleRate`, :func:`autoscrub.hasVideo`,
+:func:`autoscrub.getKeyframes`, :func:`autoscrub.getSilences` and
+:func:`autoscrub.trim` use this module. They fall back to running
+ffmpeg/ffprobe if it fails (for example, for an input that PyAV can't open).
+Loudness measurement and rendering always use ffmpeg.
+"""
+
+from __future__ import division, print_function
+
+import itertools
+
+try:
+    import av
+except ImportError:
+    av = None
+
+import autoscrub
+
+
+def available():
+    """Returns :code:`True` if PyAV (and numpy) can be imported"""
+    if av is None:
+        return False
+    try:
+        autoscrub._import_numpy()
+    except autoscrub.AutoscrubException:
+        return False
+    return True
+
+
+def _require():
+    if av is None:
+        raise autoscrub.AutoscrubException('[autoscrub:error] The libav backend requires PyAV. Install it with: pip install autoscrub[libav]')
+    return autoscrub._import_numpy()
+
+
+def probe(filename):
+    """Describes the streams of filename.
+
+    Arguments:
+        filename: The path to the media file to probe.
+
+    Returns:
+        A dictionary with the keys :code:`duration` (in seconds, or None),
+        :code:`sample_rate` and :code:`channels` (of the first audio stream,
+        or None), :code:`audio` (a dictionary of the :code:`codec_name` and
+        :code:`bit_rate` of the first audio stream, or None), 
+        :code:`has_video` and :code:`video` (a dictionary of the
+        :code:`codec_name`, :code:`pix_fmt`, :code:`width`, :code:`height`
+        and :code:`profile` of the first video stream, or None).
+    """
+    _require()
+    with av.open(filename) as container:
+        duration = container.duration/av.time_base if container.duration is not None else None
+        audio = container.streams.audio[0] if container.streams.audio else None
+        video = container.streams.video[0] if container.streams.video else None
+        result = {'duration': duration,
+                  'sample_rate': audio.codec_context.sample_rate if audio is not None else None,
+                  'channels': audio.codec_context.channels if audio is not None else None,
+                  'audio': None,
+                  'has_video': video is not None,
+                  'video': None}
+        if audio is not None:
+            result['audio'] = {'codec_name': audio.codec_context.name,
+                               'bit_rate': audio.codec_context.bit_rate or None}
+        if video is not None:
+            result['video'] = {'codec_name': video.codec_context.name,
+                               'pix_fmt': video.codec_context.pix_fmt,
+                               'width': video.codec_context.width,
+                               'height': video.codec_context.height,
+                               'profile': video.codec_context.profile}
+    return result
+
+
+def _start_time(container):
+    """Returns the start time of container in seconds (0 if it is unknown).
+    Without -copyts, ffmpeg subtracts it from every timestamp, so that its
+    filters and seeking count from the start of the container."""
+    if container.start_time is None:
+        return 0.0
+    return container.start_time/av.time_base
+
+
+def getKeyframes(filename):
+    """Returns a sorted list of the timestamps (in seconds, relative to the
+    start of the container) of the keyframes in the first video stream of 
+    filename, found by demuxing (not decoding) the stream."""
+    _require()
+    keyframes = []
+    with av.open(filename) as container:
+        if not container.streams.video:
+            return keyframes
+        stream = container.streams.video[0]
+        start_time = _start_time(container)
+        for packet in container.demux(stream):
+            if packet.is_keyframe and packet.pts is not None:
+                keyframes.append(float(packet.pts*packet.time_base) - start_time)
+    keyframes.sort()
+    return keyframes
+
+
+def _channel_views(frame):
+    """Returns a list of numpy arrays (one per channel) of the samples of a
+    float audio frame, which share memory with the frame"""
+    np = autoscrub._import_numpy()
+    if frame.format.name == 'fltp':
+        # one plane per channel
+        return [np.frombuffer(plane, dtype=np.float32, count=frame.samples) for plane in frame.planes]
+    # interleaved samples in a single plane
+    channels = len(frame.layout.channels)
+    interleaved = np.frombuffer(frame.planes[0], dtype=np.float32, count=frame.samples*channels)
+    return [interleaved[i::channels] for i in range(channels)]
+
+
+def iterAudio(filename):
+    """Decodes the first audio stream of filename.
+
+    Arguments:
+        filename: The path to the media file.
+
+    Returns:
+        A generator of :code:`(time, channels)` tuples, where :code:`time` is
+        the timestamp (in seconds) of the first sample, relative to the start
+        of the container (as ffmpeg counts it), and :code:`channels` 
+        is a list of float32 numpy arrays of the samples of each channel. 
+        The arrays are views of the decoded frame (so are only valid until 
+        the next tuple is generated). Frames that are not decoded as floats 
+        are converted first (and the samples held back by the converter are
+        generated at the end of the stream).
+    """
+    _require()
+    with av.open(filename) as container:
+        if not container.streams.audio:
+            raise autoscrub.AutoscrubException('[autoscrub:error] {} does not contain an audio stream'.format(filename))
+        stream = container.streams.audio[0]
+        resampler = None
+        position = None
+        # None marks the end of the stream
+        for frame in itertools.chain(container.decode(stream), [None]):
+            if frame is None:
+                # flush the resampler
+                frames = resampler.resample(None) if resampler is not None else []
+            elif frame.format.name in ['flt', 'fltp']:
+                frames = [frame]
+            else:
+                if resampler is None:
+                    resampler = av.AudioResampler(format='fltp', layout=frame.layout.name, rate=frame.sample_rate)
+                frames = resampler.resample(frame)
+            if position is None and frame is not None:
+                position = float(frame.time) - _start_time(container) if frame.time is not None else 0.0
+            frames = frames if isinstance(frames, list) else [frames]
+            for converted in frames:
+                if converted is None or not converted.samples:
+                    continue
+                yield position, _channel_views(converted)
+                position += converted.samples/converted.sample_rate
+
+
+class SilenceDetector(object):
+    """Detects silences in blocks of samples in the same way as the ffmpeg
+    silencedetect filter: a silence is a run of at least
+    :code:`silence_duration` seconds in which every sample of every channel
+    is below the threshold.
+
+    Arguments:
+        sample_rate: The sample rate of the audio in Hz.
+
+    Keyword Arguments:
+        input_threshold_dB: The threshold level in dB (default -18).
+
+        silence_duration: The minimum duration of a silence in seconds
+                          (default 2).
+
+        start_time: The timestamp (in seconds) of the first sample, which is
+                    added to the times of the silences (default 0).
+    """
+    def __init__(self, sample_rate, input_threshold_dB=-18.0, silence_duration=2.0, start_time=0.0):
+        self.sample_rate = sample_rate
+        self.start_time = start_time
+        self.threshold = 10**(input_threshold_dB/20)
+        self.min_samples = int(round(silence_duration*sample_rate))
+        self.silences = []
+        self._position = 0
+        self._run_start = None
+
+    def feed(self, samples):
+        """Processes the next block of samples (a list of numpy arrays, one per
+        channel)"""
+        np = autoscrub._import_numpy()
+        silent = np.logical_and.reduce([np.abs(channel) < self.threshold for channel in samples])
+        changes = np.diff(np.concatenate(([self._run_start is not None], silent)).astype(np.int8))
+        starts = np.flatnonzero(changes == 1) + self._position
+        ends = np.flatnonzero(changes == -1) + self._position
+        if self._run_start is not None:
+            starts = np.concatenate(([self._run_start], starts))
+        # a run that continues past the end of the block is finished later
+        if len(starts) > len(ends):
+            self._run_start = int(starts[-1])
+            starts = starts[:-1]
+        else:
+            self._run_start = None
+        long_runs = (ends - starts) >= self.min_samples
+        for start, end in zip(starts[long_runs], ends[long_runs]):
+            self.silences.append({'silence_start': self.start_time + float(start)/self.sample_rate,
+                                  'silence_end': self.start_time + float(end)/self.sample_rate,
+                                  'silence_duration': float(end - start)/self.sample_rate})
+        self._position += len(silent)
+
+    def close(self):
+        """Returns the list of silence dictionaries (see
+        :func:`autoscrub.getSilences`). A silence that lasts until the end of
+        the audio has only the :code:`silence_start` key."""
+        if self._run_start is not None and self._position - self._run_start >= self.min_samples:
+            self.silences.append({'silence_start': self.start_time + self._run_start/self.sample_rate})
+        self._run_start = None
+        return self.silences
+
+
+class LevelEnvelope(object):
+    """Computes the peak level (in dB, of any channel) of consecutive frames
+    of :code:`frame_duration` seconds, as :func:`autoscrub.computeLevelEnvelope`
+    does.
+
+    Arguments:
+        sample_rate: The sample rate of the audio in Hz.
+
+    Keyword Arguments:
+        frame_duration: The duration of each frame in seconds (default 0.01).
+    """
+    def __init__(self, sample_rate, frame_duration=0.01):
+        np = autoscrub._import_numpy()
+        self.frame_samples = max(1, int(round(sample_rate*frame_duration)))
+        self._levels = []
+        self._remainder = np.zeros(0, dtype=np.float32)
+
+    def feed(self, samples):
+        """Processes the next block of samples (a list of numpy arrays, one per
+        channel)"""
+        np = autoscrub._import_numpy()
+        peaks = np.concatenate((self._remainder, np.maximum.reduce([np.abs(channel) for channel in samples])))
+        n_frames = len(peaks)//self.frame_samples
+        if n_frames:
+            self._levels.append(peaks[:n_frames*self.frame_samples].reshape(n_frames, self.frame_samples).max(axis=1))
+        self._remainder = peaks[n_frames*self.frame_samples:]
+
+    def close(self):
+        """Returns the envelope as a float32 numpy array"""
+        np = autoscrub._import_numpy()
+        levels = self._levels + ([self._remainder.max(keepdims=True)] if len(self._remainder) else [])
+        peaks = np.concatenate(levels) if levels else np.zeros(0, dtype='float32')
+        return (20*np.log10(np.maximum(peaks, 1e-10))).astype('float32')
+
+
+def analyseAudio(filename, input_threshold_dB=-18.0, silence_duration=2.0, frame_duration=0.01):
+    """Detects silences and computes the level envelope of the audio of
+    filename from a single decode.
+
+    Arguments:
+        filename: The path to the media file.
+
+    Keyword Arguments:
+        input_threshold_dB: The silence threshold in dB (default -18).
+
+        silence_duration: The minimum duration of a silence in seconds
+                          (default 2).
+
+        frame_duration: The duration of each frame of the envelope in seconds
+                        (default 0.01). If None, the envelope is not computed.
+
+    Returns:
+        A tuple of the list of silence dictionaries (see
+        :func:`autoscrub.getSilences`) and the envelope (see
+        :func:`autoscrub.computeLevelEnvelope`, or None).
+    """
+    sample_rate = probe(filename)['sample_rate']
+    if sample_rate is None:
+        raise autoscrub.AutoscrubException('[autoscrub:error] {} does not contain an audio stream'.format(filename))
+    detector = None
+    envelope = LevelEnvelope(sample_rate, frame_duration) if frame_duration is not None else None
+    for time, samples in iterAudio(filename):
+        if detector is None:
+            # the audio may start after the start of the container
+            detector = SilenceDetector(sample_rate, input_threshold_dB, silence_duration, start_time=time)
+        detector.feed(samples)
+        if envelope is not None:
+            envelope.feed(samples)
+    silences = detector.close() if detector is not None else []
+    return silences, envelope.close() if envelope is not None else None
+
+
+def getSilences(filename, input_threshold_dB=-18.0, silence_duration=2.0):
+    """Returns the list of silence dictionaries of filename (see
+    :func:`autoscrub.getSilences`)"""
+    return analyseAudio(filename, input_threshold_dB, silence_duration, frame_duration=None)[0]
+
+
+def trim(input_path, output_path, tstart=0, tstop=None):
+    """Copies the audio and video packets of input_path from tstart to tstop
+    into output_path (without re-encoding), as :func:`autoscrub.trim` does
+    with :code:`codec='copy'`. The timestamps are shifted so that the output
+    starts at zero.
+
+    Arguments:
+        input_path: The path to the media file to trim.
+
+        output_path: The path to write the trimmed file to (overwritten if it
+                     exists).
+
+    Keyword Arguments:
+        tstart: The start time in seconds (relative to the start of the 
+                container, like ffmpeg's :code:`-ss`), which should be a 
+                keyframe (see :func:`autoscrub.findCutPoints`) (default 0).
+
+        tstop: The end time in seconds, or None for the end of the file.
+    """
+    _require()
+    with av.open(input_path) as source:
+        streams = list(source.streams.video[:1]) + list(source.streams.audio[:1])
+        with av.open(output_path, 'w') as destination:
+            outputs = {}
+            for stream in streams:
+                if hasattr(destination, 'add_stream_from_template'):
+                    outputs[stream.index] = destination.add_stream_from_template(stream)
+                else:
+                    outputs[stream.index] = destination.add_stream(template=stream)
+            # packet timestamps are absolute
+            start_time = _start_time(source)
+            if tstart > 0:
+                source.seek(int((tstart + start_time)*av.time_base), backward=True)
+            for packet in source.demux(streams):
+                if packet.dts is None or packet.pts is None:
+                    continue
+                t = float(packet.pts*packet.time_base) - start_time
+                if t < tstart - 1e-4 or (tstop is not None and t >= tstop):
+                    continue
+                offset = int(round((tstart + start_time)/packet.time_base))
+                packet.pts -= offset
+                packet.dts -= offset
+                packet.stream = outputs[packet.stream.index]
+                destination.mux(packet)
+    return output_path
@@ -0,0 +1,320 @@
+# Copyright 2017 Russell Anderson, Philip Starkey
+#
+# This file is part of autoscrub.
+#
+# autoscrub is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoscrub is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autoscrub.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A stand-in for the ffmpeg and ffprobe executables, for measuring the
+overhead of autoscrub itself (reading and parsing logs, callbacks and
+scheduling processes) without real media or real encodes.
+
+The stand-in is run as::
+
+    python -m autoscrub.fakeffmpeg ffmpeg|ffprobe [arguments...]
+
+and writes the output that ffmpeg/ffprobe would write for the arguments
+autoscrub uses: the input header, progress lines, silencedetect and ebur128
+output, raw audio samples for :code:`-f f32le pipe:1`, and the JSON and CSV
+output of ffprobe. Rather than reading the input file, it describes a
+synthetic recording with a silence every :code:`silence_interval` seconds.
+Alternatively, a recorded log can be replayed. Output files are created (with
+placeholder contents) so that the functions that move or fingerprint them
+still work.
+
+The stand-in is configured with environment variables, which
+:class:`autoscrub.fakeffmpeg.FakeFFmpegBackend` sets from its keyword
+arguments::
+
+    from autoscrub.fakeffmpeg import FakeFFmpegBackend
+    autoscrub.set_backend(FakeFFmpegBackend(duration=3*3600, speed=500))
+"""
+
+from __future__ import division, print_function
+
+import os
+import sys
+import json
+import math
+import time
+from array import array
+
+import autoscrub
+
+# The settings of the stand-in, their environment variables and defaults
+SETTINGS = {
+    'duration': ('AUTOSCRUB_FAKE_DURATION', 3600.0),             # duration of the recording in seconds
+    'silence_interval': ('AUTOSCRUB_FAKE_SILENCE_INTERVAL', 30.0),  # time between the starts of consecutive silences
+    'silence_duration': ('AUTOSCRUB_FAKE_SILENCE_DURATION', 5.0),   # duration of each silence
+    'speed': ('AUTOSCRUB_FAKE_SPEED', 0.0),                       # seconds of media processed per second (0: no delay)
+    'progress_interval': ('AUTOSCRUB_FAKE_PROGRESS_INTERVAL', 0.5), # seconds of media between progress lines
+    'loudness': ('AUTOSCRUB_FAKE_LOUDNESS', -21.0),               # integrated loudness in LUFS
+    'sample_rate': ('AUTOSCRUB_FAKE_SAMPLE_RATE', 48000),
+    'channels': ('AUTOSCRUB_FAKE_CHANNELS', 2),
+    'fps': ('AUTOSCRUB_FAKE_FPS', 25.0),
+    'keyframe_interval': ('AUTOSCRUB_FAKE_KEYFRAME_INTERVAL', 2.0),
+    'video': ('AUTOSCRUB_FAKE_VIDEO', 1),                         # 0 for an audio only recording
+    'exit_code': ('AUTOSCRUB_FAKE_EXIT_CODE', 0),
+    'replay': ('AUTOSCRUB_FAKE_REPLAY', ''),                      # path of a recorded stderr log to replay
+}
+
+
+def settings(environ=None):
+    """Returns the settings of the stand-in, read from the environment
+    variables in :code:`SETTINGS` (or their defaults)"""
+    environ = os.environ if environ is None else environ
+    values = {}
+    for name, (variable, default) in SETTINGS.items():
+        value = environ.get(variable)
+        values[name] = default if value is None else type(default)(value)
+    return values
+
+
+class FakeFFmpegBackend(autoscrub.SubprocessBackend):
+    """A backend (see :func:`autoscrub.set_backend`) that runs the stand-in
+    executables of this module in place of ffmpeg and ffprobe.
+
+    Keyword Arguments:
+        kwargs: The settings of the stand-in (see :code:`SETTINGS`), such as
+                :code:`duration`, :code:`speed` and :code:`replay`. Settings
+                that aren't specified use the values of their environment
+                variables, or the defaults.
+    """
+    def __init__(self, **kwargs):
+        unknown = set(kwargs) - set(SETTINGS)
+        if unknown:
+            raise TypeError('Unknown setting(s): %s' % ', '.join(sorted(unknown)))
+        env = dict((SETTINGS[name][0], '%s' % value) for name, value in kwargs.items())
+        # the stand-in must be able to import autoscrub, even if it isn't installed
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(autoscrub.__file__)))
+        env['PYTHONPATH'] = os.pathsep.join([package_root] + [path for path in [os.environ.get('PYTHONPATH')] if path])
+        executables = dict((program, [sys.executable, '-m', 'autoscrub.fakeffmpeg', program]) for program in ['ffmpeg', 'ffprobe'])
+        super(FakeFFmpegBackend, self).__init__(executables, env)
+
+
+def silences(config, tstart=0, tstop=None):
+    """Returns the (start, end) times of the silences of the synthetic
+    recording that overlap tstart to tstop"""
+    tstop = config['duration'] if tstop is None else tstop
+    interval = config['silence_interval']
+    result = []
+    if interval <= 0:
+        return result
+    # the first silence starts half an interval into the recording
+    i = max(0, int(math.floor((tstart - interval/2)/interval)))
+    while True:
+        start = interval/2 + i*interval
+        if start >= tstop:
+            break
+        end = min(start + config['silence_duration'], config['duration'])
+        if end > tstart:
+            result.append((start, end))
+        i += 1
+    return result
+
+
+def _header(config, filename, out):
+    out.write("Input #0, mov,mp4,m4a,3gp,3g2,mj2, from '%s':\n" % filename)
+    out.write('  Duration: %s, start: 0.000000, bitrate: 2000 kb/s\n' % autoscrub.seconds_to_hhmmssd(config['duration']))
+    if config['video']:
+        out.write('    Stream #0:0(und): Video: h264 (High) (avc1 / 0x31637661), yuv420p, 1920x1080, 1800 kb/s, %g fps, %g tbr (default)\n' % (config['fps'], config['fps']))
+    out.write('    Stream #0:1(und): Audio: aac (LC) (mp4a / 0x6134706D), %i Hz, %s, fltp, 192 kb/s (default)\n' %
+              (config['sample_rate'], 'stereo' if config['channels'] == 2 else 'mono'))
+    out.flush()
+
+
+def _option(args, name, default=None):
+    """Returns the value of the first option called name before the first
+    -i (the input options) or default"""
+    end = args.index('-i') if '-i' in args else len(args)
+    for i in range(end - 1):
+        if args[i] == name:
+            return args[i + 1]
+    return default
+
+
+def _input(args):
+    return args[args.index('-i') + 1] if '-i' in args and args.index('-i') + 1 < len(args) else ''
+
+
+class _Clock(object):
+    """Paces the output to :code:`speed` seconds of media per second"""
+    def __init__(self, speed):
+        self.speed = speed
+        self.start = time.time()
+
+    def wait_until(self, t):
+        if self.speed > 0:
+            delay = self.start + t/self.speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def replay(config, out):
+    """Writes the recorded log to out, pacing the lines by their time=
+    values"""
+    clock = _Clock(config['speed'])
+    with open(config['replay'], 'r') as f:
+        for line in f:
+            if 'time=' in line:
+                try:
+                    clock.wait_until(autoscrub.hhmmssd_to_seconds(line.split('time=')[1].split()[0]))
+                except (ValueError, IndexError):
+                    pass
+            out.write(line)
+            out.flush()
+
+
+def ffprobe(args, config, stdout=sys.stdout, stderr=sys.stderr):
+    """Writes the output of ffprobe for args"""
+    if '-show_entries' in args:
+        entries = args[args.index('-show_entries') + 1]
+        stream = args[args.index('-select_streams') + 1] if '-select_streams' in args else ''
+        if entries.startswith('format='):
+            json.dump({'format': {'start_time': '0.000000'}}, stdout)
+            stdout.write('\n')
+        elif entries.startswith('packet='):
+            # one packet per frame, with a keyframe every keyframe_interval
+            if config['video']:
+                step = max(1, int(round(config['keyframe_interval']*config['fps'])))
+                for n in range(int(config['duration']*config['fps'])):
+                    stdout.write('%.6f,%s\n' % (n/config['fps'], 'K_' if n % step == 0 else '__'))
+        else:
+            streams = []
+            if stream.startswith('a'):
+                streams.append({'codec_name': 'aac', 'bit_rate': '128000', 'channels': config['channels'], 
+                                'sample_rate': '%i' % config['sample_rate']})
+            elif config['video']:
+                streams.append({'codec_name': 'h264', 'pix_fmt': 'yuv420p', 'width': 1920, 'height': 1080, 'profile': 'High', 'level': 40})
+            json.dump({'streams': streams}, stdout)
+            stdout.write('\n')
+        stdout.flush()
+    elif _option(args, '-v') != 'error':
+        _header(config, _input(args), stderr)
+
+
+def _samples(config, tstart, tstop):
+    """Returns the interleaved float samples from tstart to tstop: a -20 dBFS
+    square wave outside the silences and zeros inside them"""
+    rate = config['sample_rate']
+    channels = config['channels']
+    period = array('f', [0.1]*(50*channels) + [-0.1]*(50*channels))
+    n_start = int(round(tstart*rate))
+    n_stop = int(round(tstop*rate))
+    samples = array('f')
+    n = n_start
+    for start, end in silences(config, tstart, tstop) + [(tstop, tstop)]:
+        for a, b, quiet in [(n, int(round(start*rate)), False), (int(round(start*rate)), int(round(end*rate)), True)]:
+            a, b = max(a, n), min(b, n_stop)
+            if b <= a:
+                continue
+            if quiet:
+                samples.extend(array('f', [0.0])*((b - a)*channels))
+            else:
+                phase = a % 100
+                samples.extend((period*((b - a)//100 + 2))[phase*channels:(phase + b - a)*channels])
+            n = b
+    return samples
+
+
+def ffmpeg(args, config, stdout=sys.stdout, stderr=sys.stderr):
+    """Writes the output of ffmpeg for args"""
+    verbose = _option(args, '-v') != 'error'
+    tstart = float(_option(args, '-ss', 0))
+    length = _option(args, '-t')
+    tstop = min(config['duration'], tstart + float(length)) if length is not None else config['duration']
+    command = ' '.join(args)
+    if verbose:
+        _header(config, _input(args), stderr)
+        stderr.write('Press [q] to stop, [?] for help\n')
+
+    # the silences and loudness lines, keyed by the time they are printed
+    events = []
+    if 'silencedetect' in command:
+        for start, end in silences(config, tstart, tstop):
+            events.append((max(start - tstart, 0), '[silencedetect @ 0x55d0c0a0] silence_start: %g\n' % max(start - tstart, 0)))
+            if end < tstop:
+                events.append((end - tstart, '[silencedetect @ 0x55d0c0a0] silence_end: %g | silence_duration: %g\n' %
+                               (end - tstart, end - max(start, tstart))))
+    if 'ebur128' in command:
+        for i in range(int((tstop - tstart)*10)):
+            t = 0.1*(i + 1)
+            events.append((t, '[Parsed_ebur128_0 @ 0x55d0c0a0] t: %-10g TARGET:-23 LUFS    M: %5.1f S: %5.1f     I: %5.1f LUFS       LRA:   5.0 LU\n' %
+                           (t, config['loudness'], config['loudness'], config['loudness'])))
+    events.sort(key=lambda event: event[0])
+
+    raw_audio = 'pipe:1' in args and 'f32le' in args
+    binary_stdout = getattr(stdout, 'buffer', stdout)
+
+    clock = _Clock(config['speed'])
+    interval = config['progress_interval'] if config['progress_interval'] > 0 else (tstop - tstart) or 1
+    t = 0.0
+    i = 0
+    while True:
+        t_last, t = t, min(t + interval, tstop - tstart)
+        clock.wait_until(t)
+        while i < len(events) and events[i][0] <= t:
+            stderr.write(events[i][1])
+            i += 1
+        if raw_audio:
+            samples = _samples(config, tstart + t_last, tstart + t)
+            binary_stdout.write(samples.tobytes() if hasattr(samples, 'tobytes') else samples.tostring())
+            binary_stdout.flush()
+        if verbose:
+            stderr.write('frame=%7i fps=%.0f q=-0.0 size=N/A time=%s bitrate=N/A speed=%.3gx    \r' %
+                         (int(t*config['fps']), config['fps'], autoscrub.seconds_to_hhmmssd(t), config['speed'] or 999))
+        stderr.flush()
+        if t >= tstop - tstart:
+            break
+    while i < len(events):
+        stderr.write(events[i][1])
+        i += 1
+
+    if 'ebur128' in command:
+        stderr.write('\n[Parsed_ebur128_0 @ 0x55d0c0a0] Summary:\n\n'
+                     '  Integrated loudness:\n    I:         %.1f LUFS\n    Threshold: %.1f LUFS\n\n'
+                     '  Loudness range:\n    LRA:         5.0 LU\n    Threshold: %.1f LUFS\n'
+                     '    LRA low:   %.1f LUFS\n    LRA high:  %.1f LUFS\n' %
+                     (config['loudness'], config['loudness'] - 10, config['loudness'] - 20, config['loudness'] - 3, config['loudness'] + 2))
+    stderr.flush()
+
+    # create the output file, so that it can be moved or fingerprinted
+    output = args[-1] if args else ''
+    if output and '-i' in args and args.index('-i') < len(args) - 2 and output not in [os.devnull, '-'] and not output.startswith('pipe:') and '%' not in output:
+        with open(output, 'wb') as f:
+            f.write(('autoscrub fake output of: %s\n' % command).encode('utf-8'))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in ['ffmpeg', 'ffprobe']:
+        sys.stderr.write('usage: python -m autoscrub.fakeffmpeg ffmpeg|ffprobe [arguments...]\n')
+        return 2
+    program, args = argv[0], argv[1:]
+    config = settings()
+    if '-L' in args:
+        print('%s (autoscrub stand-in) is free software; see the autoscrub license.' % program)
+        return 0
+    if config['replay']:
+        replay(config, sys.stderr)
+    elif program == 'ffprobe':
+        ffprobe(args, config)
+    else:
+        ffmpeg(args, config)
+    if config['exit_code']:
+        sys.stderr.write('%s: simulated failure\n' % program)
+    return config['exit_code']
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,329 @@
+# Copyright 2017 Russell Anderson, Philip Starkey
+#
+# This file is part of autoscrub.
+#
+# autoscrub is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoscrub is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autoscrub.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A SQLite index of the analysis results (probe information, loudness and
+silences) of a library of recordings.
+
+Files are identified by their fingerprint (see
+:func:`autoscrub.fileFingerprint`), so renamed or copied files are not
+analysed again, and a file is only fingerprinted again if its size or
+modification time changes. Pass a :class:`autoscrub.index.LibraryIndex` to
+:func:`autoscrub.set_library_index` to have :func:`autoscrub.getDuration`,
+:func:`autoscrub.getSampleRate`, :func:`autoscrub.getLoudness` and
+:func:`autoscrub.getSilences` read their results from the index when
+available.
+"""
+
+from __future__ import print_function
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from multiprocessing.pool import ThreadPool
+
+import autoscrub
+
+# The media file extensions scanned by default
+MEDIA_EXTENSIONS = ['.mp4', '.mkv', '.mov', '.avi', '.trec', '.m4a', '.mp3', '.wav', '.flv', '.webm']
+
+_schema = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_fingerprint ON files (fingerprint);
+CREATE TABLE IF NOT EXISTS media (
+    fingerprint TEXT PRIMARY KEY,
+    duration REAL,
+    sample_rate INTEGER,
+    has_video INTEGER,
+    loudness REAL,
+    loudness_json TEXT,
+    analysed_at REAL
+);
+CREATE TABLE IF NOT EXISTS silence_runs (
+    fingerprint TEXT NOT NULL,
+    threshold REAL NOT NULL,
+    min_duration REAL NOT NULL,
+    PRIMARY KEY (fingerprint, threshold, min_duration)
+);
+CREATE TABLE IF NOT EXISTS silences (
+    fingerprint TEXT NOT NULL,
+    threshold REAL NOT NULL,
+    min_duration REAL NOT NULL,
+    start REAL NOT NULL,
+    end REAL,
+    duration REAL
+);
+CREATE INDEX IF NOT EXISTS silences_run ON silences (fingerprint, threshold, min_duration);
+"""
+
+
+def _default_index_path():
+    return os.environ.get('AUTOSCRUB_INDEX', os.path.join(os.path.expanduser('~'), '.cache', 'autoscrub', 'library.sqlite'))
+
+
+def _run_key(threshold, min_duration):
+    # silencedetect is run with the threshold formatted to 0.1 dB
+    return round(float(threshold), 1), float(min_duration)
+
+
+class LibraryIndex(object):
+    """A SQLite database of analysis results.
+
+    Keyword Arguments:
+        path: The path to the database. Defaults to :code:`None` (the
+              :code:`AUTOSCRUB_INDEX` environment variable if set, otherwise
+              :code:`~/.cache/autoscrub/library.sqlite`).
+    """
+    def __init__(self, path=None):
+        self.path = os.path.abspath(path or _default_index_path())
+        folder = os.path.dirname(self.path)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        # The connection is shared by the threads that look up results, so
+        # access is serialised with a lock
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.RLock()
+        with self._lock:
+            self.connection.executescript(_schema)
+            self.connection.commit()
+
+    def close(self):
+        """Closes the database"""
+        with self._lock:
+            self.connection.close()
+
+    def fingerprint(self, filename, compute=True):
+        """Returns the fingerprint of filename, reusing the indexed
+        fingerprint if the size and modification time of the file are
+        unchanged. If the file isn't indexed and compute is :code:`False`,
+        returns :code:`None`."""
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        with self._lock:
+            row = self.connection.execute('SELECT fingerprint FROM files WHERE path = ? AND size = ? AND mtime = ?',
+                                          (path, stat.st_size, stat.st_mtime)).fetchone()
+        if row is not None:
+            return row[0]
+        if not compute:
+            return None
+        fingerprint = autoscrub.fileFingerprint(path)
+        with self._lock:
+            self.connection.execute('INSERT OR REPLACE INTO files (path, fingerprint, size, mtime) VALUES (?, ?, ?, ?)',
+                                    (path, fingerprint, stat.st_size, stat.st_mtime))
+            self.connection.commit()
+        return fingerprint
+
+    def media(self, filename):
+        """Returns a dictionary of the indexed probe information and loudness
+        of filename (with keys duration, sample_rate, has_video, loudness),
+        or :code:`None` if the file has not been analysed."""
+        fingerprint = self.fingerprint(filename)
+        with self._lock:
+            row = self.connection.execute('SELECT duration, sample_rate, has_video, loudness_json FROM media WHERE fingerprint = ?',
+                                          (fingerprint,)).fetchone()
+        if row is None:
+            return None
+        return {'duration': row[0], 'sample_rate': row[1], 'has_video': bool(row[2]),
+                'loudness': json.loads(row[3]) if row[3] else None}
+
+    def silences(self, filename, threshold, min_duration):
+        """Returns the indexed silences of filename (as a list of silence
+        dictionaries) detected with the threshold (in dB) and min_duration
+        (in seconds), or :code:`None` if they have not been indexed."""
+        fingerprint = self.fingerprint(filename)
+        threshold, min_duration = _run_key(threshold, min_duration)
+        with self._lock:
+            run = self.connection.execute('SELECT 1 FROM silence_runs WHERE fingerprint = ? AND threshold = ? AND min_duration = ?',
+                                          (fingerprint, threshold, min_duration)).fetchone()
+            if run is None:
+                return None
+            rows = self.connection.execute('SELECT start, end, duration FROM silences WHERE fingerprint = ? AND threshold = ? AND min_duration = ? ORDER BY start',
+                                           (fingerprint, threshold, min_duration)).fetchall()
+        silences = []
+        for start, end, duration in rows:
+            silence = {'silence_start': start}
+            if end is not None:
+                silence['silence_end'] = end
+                silence['silence_duration'] = duration
+            silences.append(silence)
+        return silences
+
+    def store_media(self, fingerprint, duration, sample_rate, has_video, loudness):
+        """Stores the probe information and loudness dictionary of a file"""
+        with self._lock:
+            self.connection.execute('INSERT OR REPLACE INTO media (fingerprint, duration, sample_rate, has_video, loudness, loudness_json, analysed_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                    (fingerprint, duration, sample_rate, int(bool(has_video)), (loudness or {}).get('I'),
+                                     json.dumps(loudness) if loudness else None, time.time()))
+            self.connection.commit()
+
+    def store_silences(self, fingerprint, threshold, min_duration, silences):
+        """Stores the silences of a file detected with the threshold (in dB)
+        and min_duration (in seconds)"""
+        threshold, min_duration = _run_key(threshold, min_duration)
+        with self._lock:
+            self.connection.execute('DELETE FROM silences WHERE fingerprint = ? AND threshold = ? AND min_duration = ?',
+                                    (fingerprint, threshold, min_duration))
+            self.connection.executemany('INSERT INTO silences (fingerprint, threshold, min_duration, start, end, duration) VALUES (?, ?, ?, ?, ?, ?)',
+                                        [(fingerprint, threshold, min_duration, s['silence_start'], s.get('silence_end'), s.get('silence_duration'))
+                                         for s in silences])
+            self.connection.execute('INSERT OR REPLACE INTO silence_runs (fingerprint, threshold, min_duration) VALUES (?, ?, ?)',
+                                    (fingerprint, threshold, min_duration))
+            self.connection.commit()
+
+    def scan(self, root, jobs=4, extensions=None, target_lufs=-18.0, target_threshold=-18.0, silence_duration=2.0, callback=None):
+        """Analyses the media files in a directory tree (in parallel) and
+        stores the results. Files whose fingerprint has already been analysed
+        are skipped.
+
+        Silences are detected with the threshold :code:`autoscrub
+        autoprocess` would use for each file (the measured loudness plus
+        :code:`target_threshold - target_lufs`), so the results can be reused
+        when the files are processed.
+
+        Arguments:
+            root: The directory to scan.
+
+        Keyword Arguments:
+            jobs: The number of files to analyse at once (default 4).
+
+            extensions: A list of the file extensions to analyse. Defaults to
+                        :code:`None` (:code:`MEDIA_EXTENSIONS`).
+
+            target_lufs: See :code:`autoscrub autoprocess` (default -18).
+
+            target_threshold: See :code:`autoscrub autoprocess` (default -18).
+
+            silence_duration: The minimum duration of a silence (default 2).
+
+            callback: A function called with the path and status
+                      (:code:`'analysed'`, :code:`'unchanged'` or
+                      :code:`'failed'`) of each file once it is processed.
+
+        Returns:
+            A dictionary containing the number of files with each status.
+        """
+        extensions = [e.lower() for e in (extensions or MEDIA_EXTENSIONS)]
+        paths = []
+        for folder, dirnames, filenames in os.walk(os.path.abspath(root)):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if os.path.splitext(filename)[1].lower() in extensions:
+                    paths.append(os.path.join(folder, filename))
+
+        def analyse(path):
+            try:
+                return path, self.analyse(path, target_lufs, target_threshold, silence_duration, rescan=False)
+            except Exception as e:
+                print('[autoscrub:warning] Could not analyse %s: %s' % (path, e))
+                return path, 'failed'
+
+        counts = {'analysed': 0, 'unchanged': 0, 'failed': 0}
+        pool = ThreadPool(max(1, jobs))
+        try:
+            for path, status in pool.imap_unordered(analyse, paths):
+                counts[status] += 1
+                if callback is not None:
+                    callback(path, status)
+        finally:
+            pool.terminate()
+            pool.join()
+        return counts
+
+    def analyse(self, filename, target_lufs=-18.0, target_threshold=-18.0, silence_duration=2.0, rescan=True):
+        """Analyses a media file and stores the results (see
+        :meth:`autoscrub.index.LibraryIndex.scan`), unless they have already
+        been stored.
+
+        Arguments:
+            filename: The path to the media file.
+
+        Keyword Arguments:
+            target_lufs: See :code:`autoscrub autoprocess` (default -18).
+
+            target_threshold: See :code:`autoscrub autoprocess` (default -18).
+
+            silence_duration: The minimum duration of a silence (default 2).
+
+            rescan: Whether to detect silences with these settings if the
+                    file has been analysed, but not with these settings
+                    (default True). Otherwise files that have been analysed
+                    are skipped.
+
+        Returns:
+            :code:`'analysed'` or :code:`'unchanged'`.
+        """
+        fingerprint = self.fingerprint(filename)
+        media = self.media(filename)
+        if media is None:
+            ffprobe_log = autoscrub.ffprobe(filename)
+            loudness = autoscrub.getLoudness(filename)
+        elif not rescan or media['loudness'] is None or media['loudness'].get('I') is None:
+            return 'unchanged'
+        else:
+            loudness = media['loudness']
+        status = 'unchanged'
+        # files without audio have no loudness (and no silences), but are 
+        # still stored, so they aren't analysed again by every scan
+        if loudness is not None and loudness.get('I') is not None:
+            threshold = loudness['I'] + target_threshold - target_lufs
+            if media is None or self.silences(filename, threshold, silence_duration) is None:
+                silences = list(autoscrub.iterSilences(filename, threshold, silence_duration))
+                self.store_silences(fingerprint, threshold, silence_duration, silences)
+                status = 'analysed'
+        if media is None:
+            self.store_media(fingerprint, autoscrub.findDuration(ffprobe_log), autoscrub.findSampleRate(ffprobe_log),
+                             autoscrub.hasVideo(filename), loudness)
+            status = 'analysed'
+        return status
+
+    def silence_totals(self, prefix=''):
+        """Returns the total duration and total silence of the indexed files
+        in each folder under prefix, as a dictionary mapping each folder to a
+        :code:`(files, duration, silence)` tuple. The silences found by the
+        most recent scan of each file are used."""
+        prefix = os.path.abspath(prefix) if prefix else ''
+        with self._lock:
+            rows = self.connection.execute(
+                'SELECT f.path, m.duration, COALESCE(SUM(s.duration), 0) FROM files f '
+                'JOIN media m ON m.fingerprint = f.fingerprint '
+                'LEFT JOIN silence_runs r ON r.rowid = (SELECT MAX(rowid) FROM silence_runs WHERE fingerprint = f.fingerprint) '
+                'LEFT JOIN silences s ON s.fingerprint = r.fingerprint AND s.threshold = r.threshold '
+                '    AND s.min_duration = r.min_duration AND s.end IS NOT NULL '
+                'WHERE substr(f.path, 1, ?) = ? GROUP BY f.path', (len(prefix), prefix)).fetchall()
+        totals = {}
+        for path, duration, silence in rows:
+            folder = os.path.dirname(path)
+            files, total_duration, total_silence = totals.get(folder, (0, 0., 0.))
+            totals[folder] = (files + 1, total_duration + (duration or 0.), total_silence + silence)
+        return totals
+
+    def loudness_outliers(self, target_lufs=-18.0, tolerance=2.0, prefix=''):
+        """Returns a list of :code:`(path, integrated loudness)` tuples for the
+        indexed files whose integrated loudness differs from target_lufs by
+        more than tolerance (in dB)."""
+        prefix = os.path.abspath(prefix) if prefix else ''
+        with self._lock:
+            return self.connection.execute(
+                'SELECT f.path, m.loudness FROM files f JOIN media m ON m.fingerprint = f.fingerprint '
+                'WHERE substr(f.path, 1, ?) = ? AND m.loudness IS NOT NULL AND ABS(m.loudness - ?) > ? ORDER BY f.path',
+                (len(prefix), prefix, target_lufs, tolerance)).fetchall()
@@ -21,20 +21,24 @@ import subprocess
 import time
 
 import autoscrub
+from autoscrub.index import LibraryIndex
+from autoscrub.workqueue import WorkQueue
+from autoscrub import server
+from autoscrub.fakeffmpeg import FakeFFmpegBackend
 import click
 import requests
 
 def check_ffmpeg():
     # check ffmpeg exists
     try:
-        subprocess.check_output(["ffmpeg", "-L"], stderr=subprocess.STDOUT)
+        subprocess.check_output(autoscrub.get_backend().command(["ffmpeg", "-L"]), stderr=subprocess.STDOUT)
     except (subprocess.CalledProcessError, OSError):
         click.echo("[autoscub:error]: Could not find ffmpeg executable. Check that ffmpeg is in the local folder or your system PATH and that you can run 'ffmpeg -L' from the command line.")
         raise click.Abort()
         
     # check ffprobe exists
     try:
-        subprocess.check_output(["ffprobe", "-L"], stderr=subprocess.STDOUT)
+        subprocess.check_output(autoscrub.get_backend().command(["ffprobe", "-L"]), stderr=subprocess.STDOUT)
     except (subprocess.CalledProcessError, OSError):
         click.echo("[autoscub:error] Could not find ffprobe executable. Check that ffprobe is in the local folder or your system PATH and that you can run 'ffprobe -L' from the command line.")
         raise click.Abort()
@@ -77,11 +81,11 @@ class NewLineCallback(object):
         self.start_time = time.time()
         self.duration = duration
         self.last_percentage = 0
+        # output already written by earlier ffmpeg runs (when rendering in chunks)
+        self.offset = 0
+        self.last_seconds = 0
         
     def new_line_callback(self, line):
-        # Only update every N seconds
-        if time.time() - self.time_since_last_print < self.update_every_n_seconds:
-            return
         # ignore (for speed since this interrupts reading the output from the subprocess) if the line doesn't contain what we want
         if 'time=' not in line:
             return
@@ -94,6 +98,16 @@ class NewLineCallback(object):
             
             # format it into seconds
             seconds = autoscrub.hhmmssd_to_seconds(time_text)
+            # chunked renders run ffmpeg once per chunk, so when the time goes
+            # backwards, continue from where the previous chunk finished
+            if seconds < self.last_seconds:
+                self.offset += self.last_seconds
+            self.last_seconds = seconds
+            seconds += self.offset
+            
+            # Only update every N seconds
+            if time.time() - self.time_since_last_print < self.update_every_n_seconds:
+                return
             # hack because the bar.update method takes the number of steps to increase, not the current position
             percentage = min(float(seconds)/self.duration, 1)*100
             
@@ -113,10 +127,16 @@ def make_click_dict(*args, **kwargs):
     return (args, kwargs)
 
 _option__silence_duration = make_click_dict('--silence-duration', '-d', default=2.0, type=float, help='The minimum duration of continuous silence (in seconds) required to trigger speed up of that segment.', show_default=True)
-_option__hasten_audio = make_click_dict('--hasten-audio', '-h', default='tempo', type=click.Choice(['trunc', 'pitch', 'tempo']), help="The method of handling audio during the speed up of silent segments.", show_default=True)
+_option__hasten_audio = make_click_dict('--hasten-audio', '-h', default='tempo', type=click.Choice(['trunc', 'pitch', 'tempo', 'mute', 'noise']), help="The method of handling audio during the speed up of silent segments ('mute' and 'noise' replace it with generated silence or a quiet noise bed).", show_default=True)
 _option__target_lufs = make_click_dict('--target-lufs', '-l', default=-18.0, type=float, help='The target loudness in dBLUFS for the output audio', show_default=True)
 _option__pan_audio = make_click_dict('--pan-audio', '-p', type=click.Choice(['left', 'right']), help="Copies the specified audio channel (left|right) to both audio channels.", show_default=True)
 _option__rescale = make_click_dict('--rescale', '-r', nargs=2, type=int, metavar="WIDTH HEIGHT", help='rescale the input video file to the resolution specified  [usage: -r 1920 1080]')
+_option__rendition = make_click_dict('--rendition', nargs=2, type=int, multiple=True, metavar="WIDTH HEIGHT", help='Produce a rendition at this resolution. Can be given several times; each rendition is written to the output path with the height appended (e.g. lecture_720p.mp4), or as a variant of the HLS/DASH output, by a single ffmpeg process, and --rescale is ignored  [usage: --rendition 1280 720 --rendition 854 480]')
+_option__segment_duration = make_click_dict('--segment-duration', default=6.0, type=float, help='The target duration (in seconds) of each segment when the output path ends in .m3u8 (HLS) or .mpd (DASH)', show_default=True)
+_option__dedup = make_click_dict('--dedup', is_flag=True, help='Drop near-duplicate frames (e.g. static slides in a screen recording) and encode with a variable frame rate')
+_option__keyframes_fast = make_click_dict('--keyframes-fast', is_flag=True, help='Build the sped up segments from the keyframes of the input only, so the rest of their frames are never decoded (best for speeds of 8 or more)')
+_option__resume = make_click_dict('--resume', is_flag=True, help='Render in checkpointed chunks (kept next to the output until it is complete), so that rerunning an interrupted command only renders the unfinished chunks')
+_option__decimate = make_click_dict('--decimate/--no-decimate', default=True, help='Drop the frames of sped up segments that exceed the input frame rate, so they are not encoded', show_default=True)
 _option__speed = make_click_dict('--speed', '-s', default=8, type=float, help='The factor by which to speed up the video during silent segments', show_default=True)
 _option__target_threshold = make_click_dict('--target-threshold', '-t', default=-18.0, type=float, help='The audio threshold for detecting silent segments in dB', show_default=True)
 _option__silent_volume = make_click_dict('--silent-volume', '-v', default=1.0, type=float, help='The factor to scale the audio volume during silent segments', show_default=True)
@@ -126,8 +146,14 @@ _option__stop = make_click_dict('--stop', type=float, help='Content after this t
 _option__codec = make_click_dict('--re-encode', nargs=1, type=str, metavar='CODEC', help='Re-encode the file with the codec specified', show_default=True)
 _option__show_ff_output = make_click_dict('--show-ffmpeg-output', help="Prints the raw FFmpeg and FFprobe output to the terminal", is_flag=True)
 _option__no_prompt = make_click_dict('--suppress-prompts', help="Suppresses confirmation prompts to overwrite output file(s) and proceeds even if no silences are detected in input file.", is_flag=True)
+_option__chunk_duration = make_click_dict('--chunk-duration', default=300.0, type=float, help='The minimum length of input (in seconds) rendered in each chunk', show_default=True)
+_option__poll_interval = make_click_dict('--poll-interval', default=15.0, type=float, help='The time (in seconds) to wait between checks of the input file for new content', show_default=True)
+_option__cache_dir = make_click_dict('--cache-dir', type=click.Path(file_okay=False), help='Render the video in chunks and store them in this folder, so that later runs only re-render the chunks affected by changed settings or silences')
+_option__merge_gap = make_click_dict('--merge-gap', default=0.0, type=float, help='Merge silent segments separated by no more than this length of sound (in seconds), reducing the size of the filtergraph', show_default=True)
+_option__max_segments = make_click_dict('--max-segments', type=int, help='The maximum number of segments in the filtergraph. If there are too many silent segments, only the longest are sped up')
+_option__idle_timeout = make_click_dict('--idle-timeout', default=60.0, type=float, help='The time (in seconds) for which the input file must stop growing before the recording is considered complete', show_default=True)
 
-def create_filtergraph(input, filter_graph_path, speed, rescale, target_lufs, target_threshold, pan_audio, hasten_audio, silence_duration, delay, silent_volume, suppress_prompts):    
+def create_filtergraph(input, filter_graph_path, speed, rescale, target_lufs, target_threshold, pan_audio, hasten_audio, silence_duration, delay, silent_volume, suppress_prompts, merge_gap=0, max_segments=None, renditions=None, audio_only=False, decimate=False, dedup=False, keyframes_fast=False):    
     folder, filename = os.path.split(input)
     click.echo('[autoscrub:info] Processing %s' % filename)
     
@@ -171,15 +197,41 @@ def create_filtergraph(input, filter_graph_path, speed, rescale, target_lufs, ta
         click.echo('[autoscrub:info] Found %i silences of average duration %.1f seconds.' % (len(silences), mean_duration))
     elif not suppress_prompts:
         click.confirm("[autoscrub:warning] No silences found. Do you wish to continue?", abort=True)
+        
+    # Simplify the silences to reduce the size of the filtergraph
+    silences, report = autoscrub.optimizeSilences(silences, speed, delay, merge_gap=merge_gap, max_segments=max_segments, hasten_audio=hasten_audio)
+    click.echo('[autoscrub:info] Filtergraph has %i segments (%i filters); merged %i, dropped %i too short and %i over the segment limit' % 
+               (report['segments'], report['filter_nodes'], report['merged'], report['pruned'], report['capped']))
 
     # Generate the filtergraph
     click.echo('[autoscrub:info] Generating ffmpeg filter_complex script...')
-    autoscrub.writeFilterGraph(filter_graph_path, silences, factor=speed, audio_rate=input_sample_rate, pan_audio=pan_audio, gain=gain, rescale=rescale, hasten_audio=hasten_audio, delay=delay, silent_volume=silent_volume)
-    
-    return silences
+    filter_graph_kwargs = dict(audio_rate=input_sample_rate, pan_audio=pan_audio, gain=gain, rescale=rescale, hasten_audio=hasten_audio, delay=delay, silent_volume=silent_volume)
+    if renditions:
+        filter_graph_kwargs['renditions'] = renditions
+    if audio_only:
+        filter_graph_kwargs['audio_only'] = True
+    else:
+        if decimate:
+            filter_graph_kwargs['decimate_fast'] = True
+        if dedup:
+            filter_graph_kwargs['dedup'] = True
+        if keyframes_fast:
+            filter_graph_kwargs['keyframes_fast'] = True
+    autoscrub.writeFilterGraph(filter_graph_path, silences, factor=speed, **filter_graph_kwargs)
+    
+    return silences, filter_graph_kwargs
 
 @click.group()
-def cli():
+@click.option('--max-processes', type=int, default=None, help="The maximum number of ffmpeg/ffprobe processes to run at once. Defaults to no limit.")
+@click.option('--timeout', type=float, default=None, help="Terminates any ffmpeg/ffprobe process that runs for longer than this many seconds. Defaults to no limit.")
+@click.option('--nice', type=int, default=None, help="Increases the niceness of ffmpeg/ffprobe processes by this amount, lowering their CPU priority (POSIX only).")
+@click.option('--ionice', type=click.Choice(['idle', 'best-effort']), default=None, help="Sets the IO scheduling class of ffmpeg/ffprobe processes (requires the ionice command).")
+@click.option('--cpus', type=str, default=None, help="Comma separated list of the CPUs ffmpeg/ffprobe may run on, e.g. 0,1,2 (Linux only).")
+@click.option('--jobs', type=int, default=None, help="The number of autoscrub jobs sharing this machine. ffmpeg threads are divided between them. Defaults to one more than the number of ffmpeg processes this autoscrub command is already running when it starts another (--max-processes is only an upper limit and is not used). Other autoscrub commands are not detected, so pass the same --jobs to each command when running several at once.")
+@click.option('--library-index', type=click.Path(dir_okay=False), default=None, help="Reads analysis results from this library index database (created by autoscrub index) when available.")
+@click.option('--fake-ffmpeg', is_flag=True, help="Runs a stand-in for ffmpeg/ffprobe that writes synthetic output (configured by the AUTOSCRUB_FAKE_* environment variables) instead of processing media. For testing the performance of autoscrub itself.")
+@click.option('--libav', is_flag=True, help="Probes files, detects silences and trims (with stream copy) using the libav libraries in the autoscrub process instead of running ffprobe/ffmpeg. Requires PyAV (pip install autoscrub[libav]).")
+def cli(max_processes, timeout, nice, ionice, cpus, jobs, library_index, fake_ffmpeg, libav):
     """Welcome to autoscrub!
     
     \b
@@ -193,7 +245,22 @@ def cli():
         autoscrub COMMAND --help
     where the available commands are listed below.
     """
-    pass
+    ionice = {'idle': 3, 'best-effort': 2}.get(ionice)
+    if cpus is not None:
+        try:
+            cpus = [int(cpu) for cpu in cpus.split(',')]
+        except ValueError:
+            raise click.BadParameter('must be a comma separated list of integers', param_hint='--cpus')
+    autoscrub.set_executor(autoscrub.ProcessExecutor(max_concurrency=max_processes, timeout=timeout, nice=nice, ionice=ionice, cpu_affinity=cpus, jobs=jobs))
+    if library_index is not None:
+        autoscrub.set_library_index(LibraryIndex(library_index))
+    if fake_ffmpeg:
+        autoscrub.set_backend(FakeFFmpegBackend())
+    if libav:
+        try:
+            autoscrub.use_libav()
+        except autoscrub.AutoscrubException as e:
+            click.echo('{}. Running ffmpeg/ffprobe instead.'.format(e))
 
 @cli.command()
 def version():
@@ -216,11 +283,25 @@ def version():
 @click.option(*_option__delay[0],            **_option__delay[1])
 @click.option(*_option__show_ff_output[0],   **_option__show_ff_output[1])
 @click.option(*_option__no_prompt[0],        **_option__no_prompt[1])
+@click.option(*_option__merge_gap[0],        **_option__merge_gap[1])
+@click.option(*_option__decimate[0],         **_option__decimate[1])
+@click.option(*_option__dedup[0],            **_option__dedup[1])
+@click.option(*_option__keyframes_fast[0],   **_option__keyframes_fast[1])
+@click.option(*_option__max_segments[0],     **_option__max_segments[1])
+@click.option(*_option__cache_dir[0],        **_option__cache_dir[1])
+@click.option(*_option__chunk_duration[0],   **_option__chunk_duration[1])
+@click.option(*_option__resume[0],           **_option__resume[1])
+@click.option(*_option__rendition[0],        **_option__rendition[1])
+@click.option(*_option__segment_duration[0], **_option__segment_duration[1])
 @click.option('--debug', help="Retains the generated filtergraph file for inspection", is_flag=True)
 @click.argument('input', type=click.Path(exists=True), metavar="input_filepath")
 @click.argument('output', type=click.Path(exists=False), metavar="output_filepath")
-def autoprocess(input, output, speed, rescale, target_lufs, target_threshold, pan_audio, hasten_audio, silence_duration, delay, silent_volume, show_ffmpeg_output, suppress_prompts, debug):
-    """automatically process the input video and write to the specified output file"""
+def autoprocess(input, output, speed, rescale, target_lufs, target_threshold, pan_audio, hasten_audio, silence_duration, delay, silent_volume, show_ffmpeg_output, suppress_prompts, merge_gap, decimate, dedup, keyframes_fast, max_segments, cache_dir, chunk_duration, resume, rendition, segment_duration, debug):
+    """automatically process the input video and write to the specified output file
+    
+    \b
+    If the output file ends in .m3u8 or .mpd, the video is packaged as HLS or 
+    DASH (with the segments written alongside the playlist/manifest)."""
     
     if show_ffmpeg_output:
         autoscrub.suppress_ffmpeg_output(False)
@@ -242,9 +323,30 @@ def autoprocess(input, output, speed, rescale, target_lufs, target_threshold, pa
         click.echo("[autoscrub:error] The value for delay must be less than half of the silence_duration specified")
         return
     
+    # each rendition is written to a separate output file
+    renditions = list(rendition)
+    packaged = os.path.splitext(output)[1].lower() in ['.m3u8', '.mpd']
+    
+    # audio only outputs (or inputs) skip the video entirely
+    audio_only = autoscrub.isAudioOutput(output) or not autoscrub.hasVideo(input)
+    if audio_only:
+        if renditions or packaged:
+            click.echo("[autoscrub:error] --rendition and HLS/DASH output require a video input and output")
+            return
+        click.echo("[autoscrub:info] Producing an audio only output")
+    
+    if (renditions or packaged or audio_only) and (cache_dir is not None or resume):
+        click.echo("[autoscrub:error] --cache-dir and --resume cannot be used with --rendition, HLS/DASH or audio only output")
+        return
+    if cache_dir is not None and resume:
+        click.echo("[autoscrub:error] --cache-dir and --resume cannot be used together")
+        return
+    outputs = autoscrub.renditionPaths(output, renditions) if renditions and not packaged else [output]
+    
     # check if output file exists and prompt
-    if os.path.exists(output) and not suppress_prompts:
-        click.confirm('[autoscrub:warning] The specified output file [{output}] already exists. Do you want to overwrite it?'.format(output=output), abort=True)
+    for path in outputs:
+        if os.path.exists(path) and not suppress_prompts:
+            click.confirm('[autoscrub:warning] The specified output file [{output}] already exists. Do you want to overwrite it?'.format(output=path), abort=True)
     
     # adjust hasten_audio if 'trunc'
     if hasten_audio == 'trunc':
@@ -255,12 +357,9 @@ def autoprocess(input, output, speed, rescale, target_lufs, target_threshold, pa
     # Python returns an open handle which we don't want, so close it
     os.close(handle)
 
-    silences = create_filtergraph(input, filter_graph_path, speed, rescale, target_lufs, target_threshold, pan_audio, hasten_audio, silence_duration, delay, silent_volume, suppress_prompts)
+    silences, filter_graph_kwargs = create_filtergraph(input, filter_graph_path, speed, rescale, target_lufs, target_threshold, pan_audio, hasten_audio, silence_duration, delay, silent_volume, suppress_prompts, merge_gap, max_segments, renditions, audio_only, decimate, dedup, keyframes_fast)
     
-    estimated_duration = autoscrub.getDuration(input)
-    for silence in silences:
-        if 'silence_duration' in silence:
-            estimated_duration -= (silence['silence_duration']-2*delay)*(1-1.0/speed)
+    estimated_duration = autoscrub.SilenceList.from_silences(silences).output_duration(autoscrub.getDuration(input), speed, delay)
             
     click.echo("[autoscrub:info] autoscrubbing video")
     # commented out because it's a bit confusing and could be incorrectly interpretted as the estimated conversion time, not video duration
@@ -272,22 +371,418 @@ def autoprocess(input, output, speed, rescale, target_lufs, target_threshold, pa
     else:
         callback = None
     
-    # Process the video file using ffmpeg and the filtergraph
-    result = autoscrub.ffmpegComplexFilter(input, filter_graph_path, output, run_command=True, overwrite=True, stderr_callback=callback)
-    start_time = callback.__self__.start_time if autoscrub.six.PY3 else callback.im_self.start_time
-    seconds_taken = time.time() - start_time
+    try:
+        if cache_dir is not None:
+            # Process the video file in chunks, reusing previously rendered chunks
+            cache = autoscrub.ChunkCache(os.path.abspath(cache_dir))
+            result = autoscrub.renderCached(input, output, silences, speed, cache=cache, chunk_duration=chunk_duration, overwrite=True, 
+                                            stderr_callback=callback, **filter_graph_kwargs)
+        elif resume:
+            # Process the video file in checkpointed chunks, resuming an interrupted render
+            result = autoscrub.renderResumable(input, output, silences, speed, chunk_duration=chunk_duration, overwrite=True, 
+                                               stderr_callback=callback, **filter_graph_kwargs)
+        else:
+            # Process the video file using ffmpeg and the filtergraph
+            result = autoscrub.ffmpegComplexFilter(input, filter_graph_path, outputs if renditions and not packaged else output, run_command=True, overwrite=True, stderr_callback=callback,
+                                                   renditions=renditions or None, segment_duration=segment_duration, audio_only=audio_only,
+                                                   dedup=filter_graph_kwargs.get('dedup', False), keyframes_fast=filter_graph_kwargs.get('keyframes_fast', False))
+    except autoscrub.AutoscrubException as e:
+        click.echo(str(e))
+        result = None
+    finally:
+        # delete the filtergraph temporary file unless we are debugging
+        if not debug:
+            # delete the temporary file
+            os.remove(filter_graph_path)
+        else:
+            click.echo('[autoscrub:debug] The filter script is located at: {filter_graph_path}'.format(filter_graph_path=filter_graph_path))
+    seconds_taken = time.time() - nlc.start_time
+        
+    if result is None:
+        click.echo("[autoscrub:error] Could not render the output file")
+        raise click.Abort()
     time_taken = autoscrub.seconds_to_hhmmssd(seconds_taken, decimal=False)
     click.echo("[ffmpeg:filter_complex_script] Completed in {} ({:.1f}x speed)   ".format(time_taken, estimated_duration/seconds_taken))
     click.echo("[autoscrub:info] Done!")
-    click.echo("[autoscrub:info] FFmpeg command run was: ")
-    click.echo("   " + subprocess.list2cmdline(result))
+    if cache_dir is None and not resume:
+        click.echo("[autoscrub:info] FFmpeg command run was: ")
+        click.echo("   " + subprocess.list2cmdline(result))
+
+@cli.command()
+@click.option(*_option__silence_duration[0], **_option__silence_duration[1])
+@click.option(*_option__hasten_audio[0],     **_option__hasten_audio[1])
+@click.option(*_option__pan_audio[0],        **_option__pan_audio[1])
+@click.option(*_option__rescale[0],          **_option__rescale[1])
+@click.option(*_option__speed[0],            **_option__speed[1])
+@click.option(*_option__target_threshold[0], **_option__target_threshold[1])
+@click.option(*_option__silent_volume[0],    **_option__silent_volume[1])
+@click.option(*_option__delay[0],            **_option__delay[1])
+@click.option(*_option__decimate[0],         **_option__decimate[1])
+@click.option(*_option__keyframes_fast[0],   **_option__keyframes_fast[1])
+@click.option(*_option__chunk_duration[0],   **_option__chunk_duration[1])
+@click.option(*_option__poll_interval[0],    **_option__poll_interval[1])
+@click.option(*_option__idle_timeout[0],     **_option__idle_timeout[1])
+@click.option(*_option__show_ff_output[0],   **_option__show_ff_output[1])
+@click.option(*_option__no_prompt[0],        **_option__no_prompt[1])
+@click.argument('input', type=click.Path(exists=True), metavar="input_filepath")
+@click.argument('output', type=click.Path(exists=False), metavar="output_filepath")
+def live(input, output, speed, rescale, target_threshold, pan_audio, hasten_audio, silence_duration, delay, silent_volume, decimate, keyframes_fast, chunk_duration, poll_interval, idle_timeout, show_ffmpeg_output, suppress_prompts):
+    """processes a recording while it is still being written
+    
+    \b
+    The input file is rendered in chunks as the recording grows, and the 
+    chunks are joined into the output file once the input file stops growing.
+    As the loudness of the complete recording is unknown, the target threshold
+    is used directly as the silence detection threshold and no gain is applied."""
+    
+    if show_ffmpeg_output:
+        autoscrub.suppress_ffmpeg_output(False)
+    else:
+        autoscrub.suppress_ffmpeg_output(True)
+    
+    # check executables exist
+    check_ffmpeg()
+    
+    # check autoscrub version
+    check_for_new_autoscrub_version()
+    
+    # convert input/output paths to absolute paths
+    input = os.path.abspath(input)
+    output = os.path.abspath(output)
+    
+    # ensure that there will always be some part of a silent segment that experiences a speedup
+    if not (2*delay < silence_duration):
+        click.echo("[autoscrub:error] The value for delay must be less than half of the silence_duration specified")
+        return
+    
+    # check if output file exists and prompt
+    if os.path.exists(output) and not suppress_prompts:
+        click.confirm('[autoscrub:warning] The specified output file [{output}] already exists. Do you want to overwrite it?'.format(output=output), abort=True)
+    
+    # adjust hasten_audio if 'trunc'
+    if hasten_audio == 'trunc':
+        hasten_audio = None
+        
+    click.echo('[ffprobe] Getting audio sample rate...')
+    input_sample_rate = autoscrub.getSampleRate(input)
+    if input_sample_rate is None:
+        click.echo("[autoscrub:error] Could not determine the audio samplerate of your file")
+        raise click.Abort()
+        
+    click.echo("[autoscrub:info] Waiting for the recording to grow by {} before rendering the first chunk".format(autoscrub.seconds_to_hhmmssd(chunk_duration, decimal=False)))
+    def chunk_callback(chunk_path, tstart, tstop):
+        click.echo("[autoscrub:info] Rendered input from {} to {}".format(autoscrub.seconds_to_hhmmssd(tstart), 'end' if tstop is None else autoscrub.seconds_to_hhmmssd(tstop)))
+    
+    result = autoscrub.liveProcess(input, output, speed, target_threshold, silence_duration, delay, chunk_duration=chunk_duration, 
+                                   poll_interval=poll_interval, idle_timeout=idle_timeout, overwrite=True, chunk_callback=chunk_callback,
+                                   audio_rate=input_sample_rate, pan_audio=pan_audio, rescale=rescale, hasten_audio=hasten_audio, 
+                                   silent_volume=silent_volume, decimate_fast=decimate, keyframes_fast=keyframes_fast)
+    if result is None:
+        click.echo("[autoscrub:error] Could not join the rendered chunks into the output file")
+        raise click.Abort()
+    click.echo("[autoscrub:info] Done!")
+
+@cli.command()
+@click.option(*_option__silence_duration[0], **_option__silence_duration[1])
+@click.option(*_option__hasten_audio[0],     **_option__hasten_audio[1])
+@click.option(*_option__target_lufs[0],      **_option__target_lufs[1])
+@click.option(*_option__pan_audio[0],        **_option__pan_audio[1])
+@click.option(*_option__speed[0],            **_option__speed[1])
+@click.option(*_option__target_threshold[0], **_option__target_threshold[1])
+@click.option(*_option__silent_volume[0],    **_option__silent_volume[1])
+@click.option(*_option__delay[0],            **_option__delay[1])
+@click.option(*_option__show_ff_output[0],   **_option__show_ff_output[1])
+@click.option(*_option__no_prompt[0],        **_option__no_prompt[1])
+@click.option(*_option__merge_gap[0],        **_option__merge_gap[1])
+@click.option(*_option__decimate[0],         **_option__decimate[1])
+@click.option(*_option__max_segments[0],     **_option__max_segments[1])
+@click.option('--height', default=360, type=int, help='The height (in pixels) of the preview', show_default=True)
+@click.option('--video-bitrate', default=400, type=int, help='The maximum video bitrate (in kbit/s) of the preview', show_default=True)
+@click.argument('input', type=click.Path(exists=True), metavar="input_filepath")
+@click.argument('output', type=click.Path(exists=False), metavar="output_filepath")
+def preview(input, output, speed, target_lufs, target_threshold, pan_audio, hasten_audio, silence_duration, delay, silent_volume, show_ffmpeg_output, suppress_prompts, merge_gap, decimate, max_segments, height, video_bitrate):
+    """renders a fast, low resolution preview of the autoprocess result
+    
+    \b
+    The preview uses the same silences and speed as autoprocess, so it can be 
+    used to check the effect of the options before running a full quality 
+    encode."""
+    
+    if show_ffmpeg_output:
+        autoscrub.suppress_ffmpeg_output(False)
+    else:
+        autoscrub.suppress_ffmpeg_output(True)
+    
+    # check executables exist
+    check_ffmpeg()
+    
+    # convert input/output paths to absolute paths
+    input = os.path.abspath(input)
+    output = os.path.abspath(output)
+    
+    # ensure that there will always be some part of a silent segment that experiences a speedup
+    if not (2*delay < silence_duration):
+        click.echo("[autoscrub:error] The value for delay must be less than half of the silence_duration specified")
+        return
+    
+    # check if output file exists and prompt
+    if os.path.exists(output) and not suppress_prompts:
+        click.confirm('[autoscrub:warning] The specified output file [{output}] already exists. Do you want to overwrite it?'.format(output=output), abort=True)
+    
+    # adjust hasten_audio if 'trunc'
+    if hasten_audio == 'trunc':
+        hasten_audio = None
         
-    # delete the filtergraph temporary file unless we are debugging
-    if not debug:
-        # delete the temporary file
+    # Make a temporary file for the filterscript
+    handle, filter_graph_path = tempfile.mkstemp()
+    os.close(handle)
+    try:
+        silences, filter_graph_kwargs = create_filtergraph(input, filter_graph_path, speed, None, target_lufs, target_threshold, pan_audio, hasten_audio, silence_duration, delay, silent_volume, suppress_prompts, merge_gap, max_segments, decimate=decimate)
+    finally:
         os.remove(filter_graph_path)
+    
+    estimated_duration = autoscrub.SilenceList.from_silences(silences).output_duration(autoscrub.getDuration(input), speed, delay)
+    
+    click.echo("[autoscrub:info] rendering preview")
+    nlc = NewLineCallback(estimated_duration)
+    result = autoscrub.renderPreview(input, output, silences, speed, height=height, video_bitrate=video_bitrate, overwrite=True, 
+                                     stderr_callback=None if show_ffmpeg_output else nlc.new_line_callback, **filter_graph_kwargs)
+    seconds_taken = time.time() - nlc.start_time
+    click.echo("[ffmpeg:filter_complex_script] Completed in {} ({:.1f}x speed)   ".format(autoscrub.seconds_to_hhmmssd(seconds_taken, decimal=False), estimated_duration/seconds_taken))
+    click.echo("[autoscrub:info] Done!")
+
+@cli.command(name='index')
+@click.option(*_option__target_lufs[0],      **_option__target_lufs[1])
+@click.option(*_option__target_threshold[0], **_option__target_threshold[1])
+@click.option(*_option__silence_duration[0], **_option__silence_duration[1])
+@click.option('--database', type=click.Path(dir_okay=False), default=None, help="The library index database. Defaults to the AUTOSCRUB_INDEX environment variable, or ~/.cache/autoscrub/library.sqlite")
+@click.option('--parallel', default=4, type=int, help='The number of files to analyse at once', show_default=True)
+@click.option('--extension', multiple=True, help='A file extension to index (can be given several times). Defaults to common audio and video extensions')
+@click.option('--report', is_flag=True, help='Prints the total silence in each folder and the files whose loudness differs from --target-lufs by more than 2 dB')
+@click.argument('root', type=click.Path(exists=True, file_okay=False), metavar="folder")
+def index(root, target_lufs, target_threshold, silence_duration, database, parallel, extension, report):
+    """stores the analysis of every recording in a folder in a library index
+    
+    \b
+    Probe information, loudness and silences (detected as autoprocess would 
+    detect them) are stored in a SQLite database. Files that were already
+    analysed are skipped, even if they have been renamed or moved. Use 
+    autoscrub --library-index <database> COMMAND to reuse the results."""
+    
+    autoscrub.suppress_ffmpeg_output(True)
+    
+    # check executables exist
+    check_ffmpeg()
+    
+    library = LibraryIndex(database)
+    click.echo('[autoscrub:info] Indexing {} into {}'.format(os.path.abspath(root), library.path))
+    def callback(path, status):
+        click.echo('[autoscrub:info] {:>9}: {}'.format(status, path))
+    counts = library.scan(root, jobs=parallel, extensions=list(extension) or None, target_lufs=target_lufs, 
+                          target_threshold=target_threshold, silence_duration=silence_duration, callback=callback)
+    click.echo('[autoscrub:info] Analysed {analysed} files ({unchanged} unchanged, {failed} failed)'.format(**counts))
+    
+    if report:
+        click.echo('[autoscrub:info] Silence per folder:')
+        for folder, (files, duration, silence) in sorted(library.silence_totals(root).items()):
+            click.echo('   {} ({} files): {} of silence in {}'.format(folder, files, autoscrub.seconds_to_hhmmssd(silence, decimal=False), 
+                                                                     autoscrub.seconds_to_hhmmssd(duration, decimal=False)))
+        click.echo('[autoscrub:info] Files with loudness more than 2 dB from {} LUFS:'.format(target_lufs))
+        for path, loudness in library.loudness_outliers(target_lufs, 2.0, root):
+            click.echo('   {} ({:.1f} LUFS)'.format(path, loudness))
+    library.close()
+
+@cli.group()
+def queue():
+    """processes recordings with workers on several machines, using a queue directory on shared storage
+    
+    \b
+    Submit recordings with:
+        autoscrub queue submit <queue folder> <input video path> ...
+    and start any number of workers (on any machine that can read the queue
+    folder and the recordings) with:
+        autoscrub queue work <queue folder>
+    Outputs are written next to the inputs."""
+
+@queue.command(name='submit')
+@click.option(*_option__silence_duration[0], **_option__silence_duration[1])
+@click.option(*_option__hasten_audio[0],     **_option__hasten_audio[1])
+@click.option(*_option__target_lufs[0],      **_option__target_lufs[1])
+@click.option(*_option__pan_audio[0],        **_option__pan_audio[1])
+@click.option(*_option__rescale[0],          **_option__rescale[1])
+@click.option(*_option__speed[0],            **_option__speed[1])
+@click.option(*_option__target_threshold[0], **_option__target_threshold[1])
+@click.option(*_option__silent_volume[0],    **_option__silent_volume[1])
+@click.option(*_option__delay[0],            **_option__delay[1])
+@click.option(*_option__merge_gap[0],        **_option__merge_gap[1])
+@click.option(*_option__decimate[0],         **_option__decimate[1])
+@click.option(*_option__dedup[0],            **_option__dedup[1])
+@click.option(*_option__keyframes_fast[0],   **_option__keyframes_fast[1])
+@click.option(*_option__max_segments[0],     **_option__max_segments[1])
+@click.option(*_option__chunk_duration[0],   **_option__chunk_duration[1])
+@click.option('--suffix', default='_scrubbed', help='Appended to the filename of each input to name its output', show_default=True)
+@click.argument('queue_dir', type=click.Path(file_okay=False), metavar="queue_folder")
+@click.argument('inputs', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False), metavar="input_filepath...")
+def queue_submit(queue_dir, inputs, speed, rescale, target_lufs, target_threshold, pan_audio, hasten_audio, silence_duration, delay, silent_volume, merge_gap, decimate, dedup, keyframes_fast, max_segments, chunk_duration, suffix):
+    """adds recordings to a queue"""
+    
+    # ensure that there will always be some part of a silent segment that experiences a speedup
+    if not (2*delay < silence_duration):
+        click.echo("[autoscrub:error] The value for delay must be less than half of the silence_duration specified")
+        return
+    
+    options = dict(factor=speed, target_lufs=target_lufs, target_threshold=target_threshold, silence_duration=silence_duration, delay=delay,
+                   hasten_audio=hasten_audio, silent_volume=silent_volume, pan_audio=pan_audio, rescale=list(rescale) if rescale else None, 
+                   merge_gap=merge_gap, max_segments=max_segments, chunk_duration=chunk_duration, decimate_fast=decimate, dedup=dedup, 
+                   keyframes_fast=keyframes_fast)
+    work_queue = WorkQueue(queue_dir)
+    for input in inputs:
+        output = autoscrub.workqueue.default_output_path(os.path.abspath(input), suffix)
+        job_id = work_queue.submit(input, output, **options)
+        click.echo('[autoscrub:info] Submitted job {}: {} -> {}'.format(job_id, input, output))
+
+@queue.command(name='work')
+@click.option('--worker-id', default=None, help='The name of this worker recorded in the jobs it claims. Defaults to the hostname and process ID')
+@click.option('--poll-interval', default=10.0, type=float, help='The time (in seconds) to wait before checking for new jobs when the queue is empty', show_default=True)
+@click.option('--heartbeat-interval', default=30.0, type=float, help='The time (in seconds) between heartbeats while processing a job', show_default=True)
+@click.option('--stale-timeout', default=300.0, type=float, help='The time (in seconds) without a heartbeat after which a job claimed by another worker is reclaimed', show_default=True)
+@click.option('--max-attempts', default=3, type=int, help='The number of times a job may be claimed before it is failed', show_default=True)
+@click.option('--max-jobs', default=None, type=int, help='Exit after processing this many jobs')
+@click.option('--exit-when-empty', is_flag=True, help='Exit when no jobs are pending or being processed, rather than waiting for new jobs')
+@click.option(*_option__show_ff_output[0],   **_option__show_ff_output[1])
+@click.argument('queue_dir', type=click.Path(exists=True, file_okay=False), metavar="queue_folder")
+def queue_work(queue_dir, worker_id, poll_interval, heartbeat_interval, stale_timeout, max_attempts, max_jobs, exit_when_empty, show_ffmpeg_output):
+    """claims and processes the jobs of a queue"""
+    
+    if show_ffmpeg_output:
+        autoscrub.suppress_ffmpeg_output(False)
     else:
-        click.echo('[autoscrub:debug] The filter script is located at: {filter_graph_path}'.format(filter_graph_path=filter_graph_path))
+        autoscrub.suppress_ffmpeg_output(True)
+    
+    # check executables exist
+    check_ffmpeg()
+    
+    if stale_timeout <= 2*heartbeat_interval:
+        click.echo("[autoscrub:error] --stale-timeout must be more than twice --heartbeat-interval")
+        return
+    
+    work_queue = WorkQueue(queue_dir)
+    counts = work_queue.work(worker_id, poll_interval, heartbeat_interval, stale_timeout, max_attempts, exit_when_empty, max_jobs)
+    click.echo('[autoscrub:info] Processed {} jobs ({} failed)'.format(counts['done'] + counts['failed'], counts['failed']))
+
+@queue.command(name='status')
+@click.option('--verbose', is_flag=True, help='Lists the jobs in each state')
+@click.argument('queue_dir', type=click.Path(exists=True, file_okay=False), metavar="queue_folder")
+def queue_status(queue_dir, verbose):
+    """displays the number of jobs in each state"""
+    
+    work_queue = WorkQueue(queue_dir)
+    counts = work_queue.counts()
+    click.echo('[autoscrub:info] {pending} pending, {claimed} claimed, {done} done, {failed} failed'.format(**counts))
+    if verbose:
+        for state in autoscrub.workqueue.STATES:
+            for job in work_queue.jobs(state):
+                details = job.get('worker', '') if state == 'claimed' else job.get('error', '')
+                click.echo('   {:>7} {} {} {}'.format(state, job['id'], work_queue.resolve(job['input_path']), details))
+
+@cli.command()
+@click.option('--host', default='127.0.0.1', help='The address to listen on', show_default=True)
+@click.option('--port', default=8765, type=int, help='The port to listen on', show_default=True)
+@click.option('--workers', default=2, type=int, help='The number of jobs to process at once', show_default=True)
+@click.option('--max-queued', default=16, type=int, help='The maximum number of jobs waiting for a worker. Further jobs are refused until there is space', show_default=True)
+@click.option('--token-file', type=click.Path(dir_okay=False), default=None, help="The file the server's token is written to. Defaults to the AUTOSCRUB_SERVER_TOKEN environment variable, or ~/.cache/autoscrub/server-token")
+@click.option('--verbose', is_flag=True, help='Prints each request')
+@click.option(*_option__show_ff_output[0],   **_option__show_ff_output[1])
+def serve(host, port, workers, max_queued, token_file, verbose, show_ffmpeg_output):
+    """runs a local HTTP/JSON API for submitting, monitoring and cancelling jobs
+    
+    \b
+    Jobs are processed by a pool of workers that stays running, and the 
+    analysis of each input is stored in the library index (see 
+    autoscrub --library-index), so resubmitting a file only renders it.
+    \b
+    Every request must carry the token that the server writes to the token
+    file when it starts. Submit a job with:
+        curl -H "Authorization: Bearer $(cat ~/.cache/autoscrub/server-token)" -H "Content-Type: application/json" -d '{"input_path": "/path/to/lecture.mp4", "options": {"factor": 4}}' http://127.0.0.1:8765/jobs
+    and check on it with:
+        curl -H "Authorization: Bearer $(cat ~/.cache/autoscrub/server-token)" http://127.0.0.1:8765/jobs/<id>
+    See the documentation of autoscrub.server for the full API."""
+    
+    if show_ffmpeg_output:
+        autoscrub.suppress_ffmpeg_output(False)
+    else:
+        autoscrub.suppress_ffmpeg_output(True)
+    
+    # check executables exist
+    check_ffmpeg()
+    
+    # check autoscrub version
+    check_for_new_autoscrub_version()
+    
+    try:
+        server.serve(host, port, workers, max_queued, token_path=token_file, verbose=verbose)
+    except KeyboardInterrupt:
+        click.echo('[autoscrub:info] Stopped the server')
+
+@cli.command()
+@click.option(*_option__target_lufs[0],      **_option__target_lufs[1])
+@click.option(*_option__speed[0],            **_option__speed[1])
+@click.option(*_option__delay[0],            **_option__delay[1])
+@click.option('--min-threshold', default=-40.0, type=float, help='The lowest target threshold (in dB) to evaluate', show_default=True)
+@click.option('--max-threshold', default=-10.0, type=float, help='The highest target threshold (in dB) to evaluate', show_default=True)
+@click.option('--threshold-step', default=2.0, type=float, help='The step (in dB) between evaluated target thresholds', show_default=True)
+@click.option('--durations', default='1,1.5,2,3,5', help='Comma separated list of the silence durations (in seconds) to evaluate', show_default=True)
+@click.option(*_option__show_ff_output[0],   **_option__show_ff_output[1])
+@click.argument('input', type=click.Path(exists=True), metavar="input_filepath")
+def tune(input, target_lufs, speed, delay, min_threshold, max_threshold, threshold_step, durations, show_ffmpeg_output):
+    """evaluates many silence detection settings at once
+    
+    \b
+    The level envelope of the audio is computed once (and cached alongside the 
+    input file), then the silences found by each combination of target 
+    threshold and silence duration are predicted from it, along with the 
+    duration of the autoprocess output. Requires numpy."""
+    
+    if show_ffmpeg_output:
+        autoscrub.suppress_ffmpeg_output(False)
+    else:
+        autoscrub.suppress_ffmpeg_output(True)
+    
+    # check executables exist
+    check_ffmpeg()
+    
+    input = os.path.abspath(input)
+    try:
+        silence_durations = [float(d) for d in durations.split(',')]
+    except ValueError:
+        raise click.BadParameter('must be a comma separated list of numbers', param_hint='--durations')
+    
+    click.echo('[autoscrub:info] Computing the level envelope...')
+    try:
+        envelope, frame_duration, loudness = autoscrub.computeLevelEnvelope(input)
+    except autoscrub.AutoscrubException as e:
+        click.echo(str(e))
+        raise click.Abort()
+    
+    # convert target thresholds to silencedetect thresholds as autoprocess does
+    target_thresholds = []
+    t = min_threshold
+    while t <= max_threshold + 1e-9:
+        target_thresholds.append(round(t, 3))
+        t += threshold_step
+    if not loudness or loudness.get('I') is None:
+        click.echo("[autoscrub:warning] Could not determine the loudness of your file, so thresholds are shown relative to full scale")
+        offset = 0
+    else:
+        offset = loudness['I'] - target_lufs
+        click.echo('[autoscrub:info] Measured loudness = %.1f dBLUFS' % loudness['I'])
+    results = autoscrub.sweepSilences(envelope, [t + offset for t in target_thresholds], silence_durations, frame_duration, speed, delay)
+    
+    click.echo('{:>17} {:>16} {:>9} {:>12} {:>16}'.format('target-threshold', 'silence-duration', 'silences', 'silent time', 'output duration'))
+    for target_threshold, result in zip([t for t in target_thresholds for d in silence_durations], results):
+        click.echo('{:>17.1f} {:>16.1f} {:>9d} {:>12} {:>16}'.format(target_threshold, result['silence_duration'], result['silences'], 
+                                                                  autoscrub.seconds_to_hhmmssd(result['silent_time'], decimal=False), 
+                                                                  autoscrub.seconds_to_hhmmssd(result['output_duration'], decimal=False)))
 
 @cli.command(name='loudness-adjust')
 @click.option(*_option__target_lufs[0],     **_option__target_lufs[1])
@@ -396,11 +891,12 @@ def get_silences(input, silence_duration, target_threshold, show_ffmpeg_output):
 @click.option(*_option__start[0], **_option__start[1])
 @click.option(*_option__stop[0],  **_option__stop[1])
 @click.option(*_option__codec[0], **_option__codec[1])
+@click.option('--smart-cut', help="Cut at exactly the specified times, re-encoding only the video between each cut and the nearest keyframe", is_flag=True)
 @click.option(*_option__show_ff_output[0],  **_option__show_ff_output[1])
 @click.option(*_option__no_prompt[0],       **_option__no_prompt[1])
 @click.argument('input', type=click.Path(exists=True), metavar="input_filepath")
 @click.argument('output', type=click.Path(exists=False), metavar="output_filepath")
-def trim(input, output, start, stop, re_encode, show_ffmpeg_output, suppress_prompts):
+def trim(input, output, start, stop, re_encode, smart_cut, show_ffmpeg_output, suppress_prompts):
     """removes unwanted content from the start and end of the input file"""
     
     if show_ffmpeg_output:
@@ -422,8 +918,17 @@ def trim(input, output, start, stop, re_encode, show_ffmpeg_output, suppress_pro
     if os.path.exists(output) and not suppress_prompts:
         click.confirm('[autoscrub:warning] The specified output file [{output}] already exists. Do you want to overwrite?'.format(output=output), abort=True)
         
+    if smart_cut:
+        if re_encode is not None:
+            click.echo("[autoscrub:error] --smart-cut cannot be combined with --re-encode")
+            raise click.Abort()
+        autoscrub.smartTrim(input, start, stop, output, True)
+        return
+        
     if re_encode is None:
         re_encode = 'copy'
+    else:
+        re_encode = ['-c:v', re_encode]
         
     autoscrub.trim(input, start, stop, output, True, re_encode)
     
@@ -442,8 +947,11 @@ def trim(input, output, start, stop, re_encode, show_ffmpeg_output, suppress_pro
 @click.option(*_option__delay[0],            **_option__delay[1])
 @click.option(*_option__show_ff_output[0],   **_option__show_ff_output[1])
 @click.option(*_option__no_prompt[0],        **_option__no_prompt[1])
+@click.option(*_option__merge_gap[0],        **_option__merge_gap[1])
+@click.option(*_option__decimate[0],         **_option__decimate[1])
+@click.option(*_option__max_segments[0],     **_option__max_segments[1])
 @click.argument('input', type=click.Path(exists=True), metavar="input_filepath")
-def make_filtergraph(input, speed, rescale, target_lufs, target_threshold, pan_audio, hasten_audio, silence_duration, delay, silent_volume, show_ffmpeg_output, suppress_prompts):
+def make_filtergraph(input, speed, rescale, target_lufs, target_threshold, pan_audio, hasten_audio, silence_duration, delay, silent_volume, show_ffmpeg_output, suppress_prompts, merge_gap, decimate, max_segments):
     """Generates a filter-graph file for use with ffmpeg. 
     
     \b
@@ -480,7 +988,7 @@ def make_filtergraph(input, speed, rescale, target_lufs, target_threshold, pan_a
     if hasten_audio == 'trunc':
         hasten_audio = None
     
-    create_filtergraph(input, filter_graph_path, speed, rescale, target_lufs, target_threshold, pan_audio, hasten_audio, silence_duration, delay, silent_volume, suppress_prompts)
+    create_filtergraph(input, filter_graph_path, speed, rescale, target_lufs, target_threshold, pan_audio, hasten_audio, silence_duration, delay, silent_volume, suppress_prompts, merge_gap, max_segments, decimate=decimate)
     
 @cli.command(name='process-filtergraph')
 @click.option(*_option__show_ff_output[0],  **_option__show_ff_output[1])
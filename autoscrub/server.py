@@ -0,0 +1,484 @@
+# Copyright 2017 Russell Anderson, Philip Starkey
+#
+# This file is part of autoscrub.
+#
+# autoscrub is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoscrub is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autoscrub.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A local HTTP server that processes autoscrub jobs with a long running
+pool of worker threads (started with :code:`autoscrub serve`).
+
+Jobs are processed with :func:`autoscrub.autoscrubFile`. The analysis of
+each input (probe information, loudness and silences) is stored in a
+:class:`autoscrub.index.LibraryIndex`, so submitting a file again (for
+example, with a different speed) only renders it. Submitted jobs wait in a
+bounded queue; when it is full, new jobs are refused.
+
+Every request must carry the server's token in an
+``Authorization: Bearer <token>`` header. The token is generated when the
+server starts and written to a file only the user can read (by default
+:code:`~/.cache/autoscrub/server-token`), so only programs run by the same
+user can submit jobs. Requests whose ``Host`` or ``Origin`` is not the
+server's own address are refused, as are ``POST`` requests that are not
+``Content-Type: application/json``, so web pages cannot submit jobs through
+the user's browser.
+
+The API accepts and returns JSON:
+
+=========================  ====================================================
+``GET /status``            The number of workers and of queued and running jobs
+``GET /jobs``              All jobs, as ``{"jobs": [...]}``
+``POST /jobs``             Submits a job: ``{"input_path": ..., "output_path":
+                           ..., "options": {...}}``, where ``output_path``
+                           (default: next to the input) and ``options``
+                           (keyword arguments of :func:`autoscrub.autoscrubFile`)
+                           are optional. Returns the job (202), or 503 if the
+                           queue is full
+``GET /jobs/<id>``         The job, with its ``state`` (``queued``,
+                           ``running``, ``done``, ``failed`` or
+                           ``cancelled``) and ``progress`` (0 to 1)
+``POST /jobs/<id>/cancel`` Cancels a queued or running job (also
+                           ``DELETE /jobs/<id>``)
+=========================  ====================================================
+"""
+
+from __future__ import division, print_function
+
+import os
+import hmac
+import json
+import time
+import uuid
+import binascii
+import threading
+
+from six.moves import BaseHTTPServer, socketserver, queue
+
+import autoscrub
+from autoscrub.index import LibraryIndex
+from autoscrub.workqueue import default_output_path
+
+# options that are set by the server rather than by the client
+_reserved_options = ['overwrite', 'stderr_callback', 'progress_callback']
+
+# the host names of the local machine accepted in Host and Origin headers
+_local_hosts = ['localhost', '127.0.0.1', '::1']
+
+
+def default_token_path():
+    """Returns the path the token of the server is written to (the
+    :code:`AUTOSCRUB_SERVER_TOKEN` environment variable if set, otherwise
+    :code:`~/.cache/autoscrub/server-token`)"""
+    return os.environ.get('AUTOSCRUB_SERVER_TOKEN', os.path.join(os.path.expanduser('~'), '.cache', 'autoscrub', 'server-token'))
+
+
+def write_token(path=None):
+    """Generates a random token and writes it to path (which only the
+    current user can read), replacing any previous token.
+
+    Keyword Arguments:
+        path: Defaults to :code:`None`
+              (:func:`autoscrub.server.default_token_path`).
+
+    Returns:
+        The token.
+    """
+    path = path or default_token_path()
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    token = binascii.hexlify(os.urandom(24)).decode('ascii')
+    if os.path.exists(path):
+        os.remove(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(token + '\n')
+    return token
+
+
+def _hostname(value):
+    """Returns the host name of a Host header or Origin URL (without the
+    scheme and port)"""
+    value = value.strip().lower()
+    if '://' in value:
+        value = value.split('://', 1)[1].split('/', 1)[0]
+    if value.startswith('['):
+        return value[1:].split(']', 1)[0]
+    return value.rsplit(':', 1)[0] if value.count(':') == 1 else value
+
+
+class Job(object):
+    """A job submitted to a :class:`autoscrub.server.JobManager`"""
+    def __init__(self, input_path, output_path, options):
+        self.id = uuid.uuid4().hex[:12]
+        self.input_path = input_path
+        self.output_path = output_path
+        self.options = options
+        self.state = 'queued'
+        self.stage = None
+        self.progress = 0.0
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancelled = threading.Event()
+        self._processes = []
+        self._lock = threading.Lock()
+
+    def add_process(self, p):
+        """Records a process launched for this job, so it can be
+        terminated if the job is cancelled"""
+        with self._lock:
+            self._processes = [process for process in self._processes if process.poll() is None] + [p]
+        if self.cancelled.is_set():
+            p.autoscrub_executor.terminate(p)
+
+    def terminate(self):
+        """Terminates the running processes of this job"""
+        with self._lock:
+            processes = list(self._processes)
+        for p in processes:
+            if p.poll() is None:
+                p.autoscrub_executor.terminate(p)
+
+    def to_dict(self):
+        return {'id': self.id, 'input_path': self.input_path, 'output_path': self.output_path, 'options': self.options,
+                'state': self.state, 'stage': self.stage, 'progress': self.progress, 'error': self.error,
+                'submitted_at': self.submitted_at, 'started_at': self.started_at, 'finished_at': self.finished_at}
+
+
+class _JobBackend(object):
+    """Wraps a backend (see :class:`autoscrub.SubprocessBackend`) to record
+    the processes launched by each worker thread against its current job"""
+    def __init__(self, backend):
+        self.backend = backend
+        self.local = threading.local()
+
+    def command(self, command):
+        return self.backend.command(command)
+
+    def popen(self, executor, command, *args, **kwargs):
+        job = getattr(self.local, 'job', None)
+        if job is not None and job.cancelled.is_set():
+            raise autoscrub.AutoscrubException('[autoscrub:error] The job was cancelled')
+        p = self.backend.popen(executor, command, *args, **kwargs)
+        if job is not None:
+            job.add_process(p)
+        return p
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobManager(object):
+    """Processes jobs with a pool of worker threads.
+
+    Keyword Arguments:
+        workers: The number of jobs to process at once (default 2).
+
+        max_queued: The maximum number of jobs waiting for a worker
+                    (default 16). Further submissions raise
+                    :class:`autoscrub.server.QueueFull`.
+
+        index: The :class:`autoscrub.index.LibraryIndex` that analysis
+               results are stored in and read from. Defaults to
+               :code:`None` (no caching).
+
+        max_history: The number of finished jobs to remember (default 1000).
+    """
+    def __init__(self, workers=2, max_queued=16, index=None, max_history=1000):
+        self.index = index
+        self.max_history = max_history
+        self.jobs = {}
+        self._order = []
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(max_queued)
+        self._backend = _JobBackend(autoscrub.get_backend())
+        autoscrub.set_backend(self._backend)
+        self._threads = []
+        for i in range(max(1, workers)):
+            thread = threading.Thread(target=self._work, name='autoscrub-worker-%i' % i)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, input_path, output_path=None, options=None):
+        """Queues a job and returns it. Raises
+        :class:`autoscrub.server.QueueFull` if the queue is full."""
+        input_path = os.path.abspath(input_path)
+        output_path = os.path.abspath(output_path or default_output_path(input_path))
+        job = Job(input_path, output_path, dict(options or {}))
+        with self._lock:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFull('[autoscrub:error] The queue is full')
+            self.jobs[job.id] = job
+            self._order.append(job.id)
+            self._prune()
+        return job
+
+    def _prune(self):
+        finished = [job_id for job_id in self._order if self.jobs[job_id].state in ['done', 'failed', 'cancelled']]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            self._order.remove(job_id)
+            del self.jobs[job_id]
+
+    def list(self):
+        """Returns the jobs in the order they were submitted"""
+        with self._lock:
+            return [self.jobs[job_id] for job_id in self._order]
+
+    def cancel(self, job_id):
+        """Cancels a job (terminating its processes if it is running).
+        Returns the job, or :code:`None` if there is no such job."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        job.cancelled.set()
+        with self._lock:
+            if job.state == 'queued':
+                job.state = 'cancelled'
+                job.finished_at = time.time()
+        job.terminate()
+        return job
+
+    def status(self):
+        """Returns a dictionary of the number of workers and of jobs in each
+        state"""
+        counts = {'workers': len(self._threads), 'max_queued': self._queue.maxsize}
+        for state in ['queued', 'running', 'done', 'failed', 'cancelled']:
+            counts[state] = 0
+        for job in self.list():
+            counts[job.state] += 1
+        return counts
+
+    def stop(self):
+        """Cancels the running jobs and stops the workers once the queued
+        jobs have been cancelled"""
+        for job in self.list():
+            if job.state in ['queued', 'running']:
+                self.cancel(job.id)
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                if job.cancelled.is_set():
+                    continue
+                job.state = 'running'
+                job.started_at = time.time()
+            self._backend.local.job = job
+            try:
+                self._process(job)
+            except Exception as e:
+                if job.cancelled.is_set():
+                    job.state = 'cancelled'
+                    print('[autoscrub:server] Job %s cancelled' % job.id)
+                else:
+                    job.state = 'failed'
+                    job.error = str(e)
+                    print('[autoscrub:server] Job %s failed: %s' % (job.id, e))
+            else:
+                job.state = 'done'
+                print('[autoscrub:server] Job %s done: %s' % (job.id, job.output_path))
+            finally:
+                self._backend.local.job = None
+                job.finished_at = time.time()
+
+    def _process(self, job):
+        options = job.options
+        if self.index is not None:
+            job.stage = 'analysing'
+            self.index.analyse(job.input_path, options.get('target_lufs', -18.0), options.get('target_threshold', -18.0),
+                               options.get('silence_duration', 2.0))
+        job.stage = 'rendering'
+
+        def progress(fraction):
+            job.progress = fraction
+        result = autoscrub.autoscrubFile(job.input_path, job.output_path, overwrite=True, progress_callback=progress, **options)
+        if result is None:
+            raise autoscrub.AutoscrubException('[autoscrub:error] No output was produced')
+
+
+class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # the JobManager is set on the server
+    def _send(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, {'error': message})
+
+    def _parts(self):
+        return [part for part in self.path.split('?')[0].split('/') if part]
+
+    def _authorised(self, json_body=False):
+        """Returns :code:`True` if the request may be handled, otherwise
+        sends an error response and returns :code:`False`"""
+        hosts = _local_hosts + [self.server.server_name.lower(), self.server.server_address[0]]
+        host = self.headers.get('Host')
+        origin = self.headers.get('Origin')
+        if host is None or _hostname(host) not in hosts or (origin is not None and _hostname(origin) not in hosts):
+            self._error(403, 'Requests must be sent to this server directly, not from a web page')
+            return False
+        authorization = self.headers.get('Authorization') or ''
+        if not authorization.startswith('Bearer ') or not hmac.compare_digest(authorization[len('Bearer '):].strip(), self.server.token):
+            self._error(401, 'The request must carry the token in %s in an Authorization: Bearer header' % self.server.token_path)
+            return False
+        if json_body and (self.headers.get('Content-Type') or '').split(';')[0].strip().lower() != 'application/json':
+            self._error(415, 'The request body must be sent with Content-Type: application/json')
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._authorised():
+            return
+        manager = self.server.manager
+        parts = self._parts()
+        if parts == ['status']:
+            self._send(200, manager.status())
+        elif parts == ['jobs']:
+            self._send(200, {'jobs': [job.to_dict() for job in manager.list()]})
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            job = manager.jobs.get(parts[1])
+            if job is None:
+                self._error(404, 'No job with ID %s' % parts[1])
+            else:
+                self._send(200, job.to_dict())
+        else:
+            self._error(404, 'Not found')
+
+    def do_POST(self):
+        manager = self.server.manager
+        parts = self._parts()
+        if len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'cancel':
+            if self._authorised():
+                self._cancel(parts[1])
+            return
+        if not self._authorised(json_body=True):
+            return
+        if parts != ['jobs']:
+            return self._error(404, 'Not found')
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError:
+            return self._error(400, 'The request body must be a JSON object')
+        if not isinstance(request, dict) or 'input_path' not in request:
+            return self._error(400, 'The request must contain input_path')
+        if not os.path.isfile(request['input_path']):
+            return self._error(400, 'The input file %s does not exist' % request['input_path'])
+        options = request.get('options') or {}
+        if not isinstance(options, dict) or [key for key in options if key in _reserved_options]:
+            return self._error(400, 'options must be an object of keyword arguments of autoscrubFile (other than %s)' % ', '.join(_reserved_options))
+        try:
+            job = manager.submit(request['input_path'], request.get('output_path'), options)
+        except QueueFull as e:
+            return self._error(503, str(e))
+        self._send(202, job.to_dict())
+
+    def do_DELETE(self):
+        if not self._authorised():
+            return
+        parts = self._parts()
+        if len(parts) == 2 and parts[0] == 'jobs':
+            return self._cancel(parts[1])
+        self._error(404, 'Not found')
+
+    def _cancel(self, job_id):
+        job = self.server.manager.cancel(job_id)
+        if job is None:
+            return self._error(404, 'No job with ID %s' % job_id)
+        self._send(200, job.to_dict())
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            print('[autoscrub:server] %s - %s' % (self.address_string(), format % args))
+
+
+class JobServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """The HTTP server of the API, handling each request in a thread.
+
+    Arguments:
+        address: The :code:`(host, port)` to listen on.
+
+        manager: The :class:`autoscrub.server.JobManager` that processes the
+                 jobs.
+
+        token: The token that requests must carry.
+
+    Keyword Arguments:
+        token_path: The path of the token file, included in error messages
+                    (default None).
+
+        verbose: Whether to print each request (default False).
+    """
+    daemon_threads = True
+
+    def __init__(self, address, manager, token, token_path=None, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, _RequestHandler)
+        self.manager = manager
+        self.token = token
+        self.token_path = token_path
+        self.verbose = verbose
+
+
+def serve(host='127.0.0.1', port=8765, workers=2, max_queued=16, index=None, token_path=None, verbose=False):
+    """Runs the API until interrupted.
+
+    Keyword Arguments:
+        host: The address to listen on (default 127.0.0.1, so only local
+              programs can submit jobs).
+
+        port: The port to listen on (default 8765).
+
+        workers: See :class:`autoscrub.server.JobManager`.
+
+        max_queued: See :class:`autoscrub.server.JobManager`.
+
+        index: The :class:`autoscrub.index.LibraryIndex` to store analysis
+               results in. Defaults to :code:`None` (the library index set
+               with :func:`autoscrub.set_library_index`, or the default
+               index).
+
+        token_path: The file to write the token to. Defaults to 
+                    :code:`None` (:func:`autoscrub.server.default_token_path`).
+
+        verbose: Whether to print each request (default False).
+    """
+    if index is None:
+        index = autoscrub.get_library_index() or LibraryIndex()
+    autoscrub.set_library_index(index)
+    token_path = token_path or default_token_path()
+    token = write_token(token_path)
+    manager = JobManager(workers, max_queued, index)
+    server = JobServer((host, port), manager, token, token_path, verbose)
+    print('[autoscrub:server] Listening on http://%s:%i/ with %i workers' % (host, server.server_address[1], workers))
+    print('[autoscrub:server] Requests must carry the token in %s' % token_path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        manager.stop()
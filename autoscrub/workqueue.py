@@ -0,0 +1,375 @@
+# Copyright 2017 Russell Anderson, Philip Starkey
+#
+# This file is part of autoscrub.
+#
+# autoscrub is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoscrub is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autoscrub.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A queue of autoscrub jobs kept in a directory on shared storage (such as
+an NFS share), so that workers on several machines can process a batch of
+recordings without a central service.
+
+Each job is a JSON file that moves between the :code:`pending`,
+:code:`claimed`, :code:`done` and :code:`failed` subdirectories of the queue
+directory. A worker claims a job by renaming it from :code:`pending` to
+:code:`claimed`, which only one worker can do, and then touches the claimed
+file every :code:`heartbeat_interval` seconds while it processes the job. A
+claim whose file has not been touched for :code:`stale_timeout` seconds (for
+example, because its worker crashed or its machine was rebooted) is renamed
+back to :code:`pending` by any other worker, or to :code:`failed` once the
+job has been claimed :code:`max_attempts` times. Staleness is judged from
+the modification times of the files, so the clocks of the machines should
+be synchronised to well within :code:`stale_timeout`.
+
+Outputs are written next to the inputs (unless the job gives another output
+path). Videos are rendered in checkpointed chunks (see
+:func:`autoscrub.renderResumable`), so a job reclaimed from a failed worker
+continues from the chunks it had finished.
+
+Paths inside the queue directory's parent are stored relative to the queue
+directory, so machines may mount the shared storage at different paths.
+
+To try it on one machine, submit some files and start several workers::
+
+    autoscrub queue submit /mnt/share/queue /mnt/share/lectures/*.mp4
+    autoscrub queue work /mnt/share/queue --exit-when-empty &
+    autoscrub queue work /mnt/share/queue --exit-when-empty &
+"""
+
+from __future__ import print_function
+
+import os
+import json
+import time
+import uuid
+import errno
+import socket
+import threading
+
+import autoscrub
+
+STATES = ['pending', 'claimed', 'done', 'failed']
+
+
+def default_output_path(input_path, suffix='_scrubbed'):
+    """Returns the path next to input_path that a job writes its output to
+    by default (the input path with :code:`suffix` appended to the filename
+    and the extension replaced with :code:`.mp4`, or kept for audio files)"""
+    prefix, extension = os.path.splitext(input_path)
+    if extension.lower() not in ['.m4a', '.aac', '.opus', '.ogg']:
+        extension = '.mp4'
+    return prefix + suffix + extension
+
+
+def default_worker_id():
+    """Returns an identifier for a worker process (its hostname and process
+    ID)"""
+    return '%s-%i' % (socket.gethostname(), os.getpid())
+
+
+class WorkQueue(object):
+    """A queue of jobs for :func:`autoscrub.autoscrubFile` in a directory
+    shared between workers.
+
+    Arguments:
+        path: The queue directory (created if it does not exist).
+    """
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        for state in STATES:
+            folder = os.path.join(self.path, state)
+            if not os.path.isdir(folder):
+                try:
+                    os.makedirs(folder)
+                except OSError as e:
+                    # another worker may have created it at the same time
+                    if e.errno != errno.EEXIST:
+                        raise
+
+    def _job_path(self, state, job_id):
+        return os.path.join(self.path, state, job_id + '.json')
+
+    def _store_path(self, path):
+        """Returns path relative to the queue directory if it is inside the
+        queue directory's parent, otherwise the absolute path"""
+        path = os.path.abspath(path)
+        try:
+            relative = os.path.relpath(path, self.path)
+        except ValueError:
+            # on a different drive (Windows)
+            return path
+        if relative.startswith(os.path.join(os.pardir, os.pardir)):
+            return path
+        return relative
+
+    def resolve(self, path):
+        """Returns the absolute path of a path stored in a job"""
+        return os.path.normpath(os.path.join(self.path, path))
+
+    def _read(self, path):
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def submit(self, input_path, output_path=None, **options):
+        """Adds a job to the queue.
+
+        Arguments:
+            input_path: The path to the media file to process.
+
+        Keyword Arguments:
+            output_path: The path to write the output to. Defaults to
+                         :code:`None` (see
+                         :func:`autoscrub.workqueue.default_output_path`).
+
+            options: Keyword arguments for :func:`autoscrub.autoscrubFile`
+                     (which must be JSON serialisable).
+
+        Returns:
+            The ID of the job.
+        """
+        if output_path is None:
+            output_path = default_output_path(input_path)
+        # IDs sort in the order the jobs were submitted
+        job_id = '%015.4f-%s' % (time.time(), uuid.uuid4().hex[:8])
+        job = {'id': job_id,
+               'input_path': self._store_path(input_path),
+               'output_path': self._store_path(output_path),
+               'options': options,
+               'submitted_at': time.time(),
+               'attempts': 0}
+        # written under a hidden name so workers never see a partial job
+        temp_path = os.path.join(self.path, 'pending', '.' + job_id + '.tmp')
+        autoscrub._write_json_atomic(temp_path, job)
+        autoscrub._replace_file(temp_path, self._job_path('pending', job_id))
+        return job_id
+
+    def jobs(self, state):
+        """Returns the list of the jobs (as dictionaries) in state
+        (:code:`'pending'`, :code:`'claimed'`, :code:`'done'` or
+        :code:`'failed'`), in the order they were submitted"""
+        jobs = []
+        folder = os.path.join(self.path, state)
+        for filename in sorted(os.listdir(folder)):
+            if filename.startswith('.') or not filename.endswith('.json'):
+                continue
+            try:
+                jobs.append(self._read(os.path.join(folder, filename)))
+            except (IOError, OSError, ValueError):
+                # moved by a worker while we were listing them
+                pass
+        return jobs
+
+    def counts(self):
+        """Returns a dictionary of the number of jobs in each state"""
+        counts = {}
+        for state in STATES:
+            folder = os.path.join(self.path, state)
+            counts[state] = len([f for f in os.listdir(folder) if f.endswith('.json') and not f.startswith('.')])
+        return counts
+
+    def claim(self, worker_id=None):
+        """Claims the oldest pending job.
+
+        Keyword Arguments:
+            worker_id: The identifier of the worker recorded in the job.
+                       Defaults to :code:`None`
+                       (:func:`autoscrub.workqueue.default_worker_id`).
+
+        Returns:
+            The job dictionary, or :code:`None` if there are no pending jobs.
+        """
+        folder = os.path.join(self.path, 'pending')
+        for filename in sorted(os.listdir(folder)):
+            if filename.startswith('.') or not filename.endswith('.json'):
+                continue
+            job_id = filename[:-len('.json')]
+            claimed_path = self._job_path('claimed', job_id)
+            try:
+                # atomic, so only one worker can claim each job
+                os.rename(os.path.join(folder, filename), claimed_path)
+            except OSError:
+                continue
+            try:
+                # the rename keeps the time the job was submitted, which would
+                # make the job look stale to reclaim_stale straight away
+                os.utime(claimed_path, None)
+                job = self._read(claimed_path)
+            except (IOError, OSError, ValueError):
+                # reclaimed by another worker
+                continue
+            job['attempts'] = job.get('attempts', 0) + 1
+            job['worker'] = worker_id or default_worker_id()
+            job['claimed_at'] = time.time()
+            if not self._update(job):
+                continue
+            return job
+        return None
+
+    def _update(self, job):
+        """Rewrites a claimed job. Returns :code:`False` if the claim has been
+        lost (the job was reclaimed by another worker)."""
+        claimed_path = self._job_path('claimed', job['id'])
+        temp_path = os.path.join(self.path, 'claimed', '.%s.%s.tmp' % (job['id'], uuid.uuid4().hex[:8]))
+        autoscrub._write_json_atomic(temp_path, job)
+        if not os.path.exists(claimed_path):
+            os.remove(temp_path)
+            return False
+        autoscrub._replace_file(temp_path, claimed_path)
+        return True
+
+    def heartbeat(self, job):
+        """Marks a claimed job as still being processed. Returns
+        :code:`False` if the claim has been lost."""
+        try:
+            os.utime(self._job_path('claimed', job['id']), None)
+        except OSError:
+            return False
+        return True
+
+    def _finish(self, job, state):
+        job['finished_at'] = time.time()
+        if not self._update(job):
+            print('[autoscrub:warning] Job %s was reclaimed by another worker before it finished' % job['id'])
+            return False
+        try:
+            os.rename(self._job_path('claimed', job['id']), self._job_path(state, job['id']))
+        except OSError:
+            print('[autoscrub:warning] Job %s was reclaimed by another worker before it finished' % job['id'])
+            return False
+        return True
+
+    def complete(self, job, output_path):
+        """Moves a claimed job to :code:`done`, recording its output path"""
+        job['result'] = self._store_path(output_path)
+        return self._finish(job, 'done')
+
+    def fail(self, job, error):
+        """Moves a claimed job to :code:`failed`, recording the error"""
+        job['error'] = str(error)
+        return self._finish(job, 'failed')
+
+    def reclaim_stale(self, stale_timeout=300, max_attempts=3):
+        """Returns claimed jobs that have not had a heartbeat for
+        :code:`stale_timeout` seconds to :code:`pending` (or moves them to
+        :code:`failed` if they have been claimed :code:`max_attempts`
+        times).
+
+        Returns:
+            The list of the IDs of the reclaimed jobs.
+        """
+        reclaimed = []
+        folder = os.path.join(self.path, 'claimed')
+        now = time.time()
+        for filename in sorted(os.listdir(folder)):
+            if filename.startswith('.') or not filename.endswith('.json'):
+                continue
+            path = os.path.join(folder, filename)
+            try:
+                if now - os.path.getmtime(path) < stale_timeout:
+                    continue
+                job = self._read(path)
+            except (IOError, OSError, ValueError):
+                continue
+            state = 'failed' if job.get('attempts', 0) >= max_attempts else 'pending'
+            try:
+                os.rename(path, self._job_path(state, job['id']))
+            except OSError:
+                # reclaimed by another worker
+                continue
+            print('[autoscrub:info] Reclaimed stale job %s from %s (moved to %s)' % (job['id'], job.get('worker'), state))
+            reclaimed.append(job['id'])
+        return reclaimed
+
+    def process(self, job, heartbeat_interval=30):
+        """Processes a claimed job with :func:`autoscrub.autoscrubFile`,
+        sending heartbeats from a background thread, and moves it to
+        :code:`done` or :code:`failed`.
+
+        Returns:
+            :code:`True` if the job succeeded.
+        """
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(heartbeat_interval):
+                if not self.heartbeat(job):
+                    print('[autoscrub:warning] Lost the claim on job %s' % job['id'])
+                    return
+        thread = threading.Thread(target=beat)
+        thread.daemon = True
+        thread.start()
+        input_path = self.resolve(job['input_path'])
+        output_path = self.resolve(job['output_path'])
+        print('[autoscrub:info] Processing job %s: %s' % (job['id'], input_path))
+        try:
+            options = dict(job.get('options', {}))
+            options.setdefault('resume', True)
+            result = autoscrub.autoscrubFile(input_path, output_path, overwrite=True, **options)
+            if result is None:
+                raise autoscrub.AutoscrubException('[autoscrub:error] No output was produced')
+        except Exception as e:
+            print('[autoscrub:error] Job %s failed: %s' % (job['id'], e))
+            self.fail(job, e)
+            return False
+        finally:
+            stop.set()
+            thread.join()
+        print('[autoscrub:info] Finished job %s: %s' % (job['id'], output_path))
+        return self.complete(job, output_path)
+
+    def work(self, worker_id=None, poll_interval=10, heartbeat_interval=30, stale_timeout=300, max_attempts=3,
+             exit_when_empty=False, max_jobs=None):
+        """Claims and processes jobs until there are none left (if
+        :code:`exit_when_empty`) or :code:`max_jobs` have been processed,
+        reclaiming stale jobs as it goes.
+
+        Keyword Arguments:
+            worker_id: See :meth:`autoscrub.workqueue.WorkQueue.claim`.
+
+            poll_interval: The number of seconds to wait before checking for
+                           new jobs when the queue is empty (default 10).
+
+            heartbeat_interval: The number of seconds between heartbeats
+                                while processing a job (default 30).
+
+            stale_timeout: The number of seconds without a heartbeat after
+                           which another worker's claim is reclaimed
+                           (default 300). Must be comfortably longer than
+                           :code:`heartbeat_interval`.
+
+            max_attempts: The number of times a job may be claimed before
+                          it is failed, rather than reclaimed (default 3).
+
+            exit_when_empty: Whether to return when there are no pending or
+                             claimed jobs, rather than waiting for more
+                             (default False).
+
+            max_jobs: The maximum number of jobs to process. Defaults to
+                      :code:`None` (no limit).
+
+        Returns:
+            A dictionary of the number of jobs that this worker completed
+            (:code:`'done'`) and that failed (:code:`'failed'`).
+        """
+        worker_id = worker_id or default_worker_id()
+        counts = {'done': 0, 'failed': 0}
+        while max_jobs is None or counts['done'] + counts['failed'] < max_jobs:
+            self.reclaim_stale(stale_timeout, max_attempts)
+            job = self.claim(worker_id)
+            if job is None:
+                if exit_when_empty and not self.counts()['claimed']:
+                    break
+                time.sleep(poll_interval)
+                continue
+            counts['done' if self.process(job, heartbeat_interval) else 'failed'] += 1
+        return counts
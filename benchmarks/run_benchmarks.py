@@ -0,0 +1,238 @@
+# Copyright 2017 Russell Anderson, Philip Starkey
+#
+# This file is part of autoscrub.
+#
+# autoscrub is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoscrub is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autoscrub.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Microbenchmarks for the pure Python parts of autoscrub whose inputs grow
+with the length of a recording (log parsing and filtergraph generation).
+
+Each benchmark is run on generated fixtures at several sizes. Timings are
+divided by the time taken by a fixed calibration workload (timed alternately
+with the benchmark, so both see the same load on the machine), and by the
+size of the fixture, so the results (the normalised cost per item) can be
+compared between machines. The run fails if the cost per item at the largest
+size is more than the scaling limit times the cost per item at the smallest
+size (which catches code that has become quadratic).
+
+Timings from different runs still vary with the machine and its load, so
+the comparison with the stored baseline is only made with
+:code:`--check-baseline`, and fails if the normalised cost of any benchmark
+exceeds the baseline by more than the tolerance.
+
+Usage::
+
+    python benchmarks/run_benchmarks.py                   # check the scaling
+    python benchmarks/run_benchmarks.py --check-baseline  # also compare with the baseline
+    python benchmarks/run_benchmarks.py --save-baseline   # record a new baseline
+    python benchmarks/run_benchmarks.py --large           # also run 10x larger fixtures
+"""
+from __future__ import division, print_function
+
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import autoscrub
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Number of items in the fixtures (the number of silences, log lines or
+# timestamps, depending on the benchmark)
+SIZES = [1000, 10000, 100000]
+
+
+def _progress_line(t):
+    return 'frame=%7i fps=250 q=-0.0 size=N/A time=%s bitrate=N/A speed=83.3x\r' % (int(t*25), autoscrub.seconds_to_hhmmssd(t))
+
+
+def silence_times(n, seed=0):
+    """Returns a list of n (start, end) tuples of silences, 2-30 seconds long,
+    separated by 1-60 seconds of sound"""
+    rng = random.Random(seed)
+    t = 0.0
+    times = []
+    for i in range(n):
+        start = t + rng.uniform(1, 60)
+        end = start + rng.uniform(2, 30)
+        times.append((round(start, 6), round(end, 6)))
+        t = end
+    return times
+
+
+def silencedetect_log(n):
+    """The stderr of ffmpeg running silencedetect on a recording with n
+    silences (with a progress line between each silencedetect line)"""
+    lines = ['Input #0, matroska,webm, from \'lecture.mkv\':',
+             '  Duration: 99:00:00.00, start: 0.000000, bitrate: 2000 kb/s',
+             '    Stream #0:1: Audio: aac (LC), 48000 Hz, stereo, fltp (default)']
+    for start, end in silence_times(n):
+        lines.append(_progress_line(start) + '[silencedetect @ 0x55d0c0a0] silence_start: %g' % start)
+        lines.append(_progress_line(end) + '[silencedetect @ 0x55d0c0a0] silence_end: %g | silence_duration: %g' % (end, end - start))
+    return '\n'.join(lines) + '\n'
+
+
+def ebur128_log(n):
+    """The stderr of ffmpeg running ebur128 with n momentary loudness lines
+    (one every 100 ms) followed by the summary"""
+    rng = random.Random(1)
+    lines = ['  Duration: 99:00:00.00, start: 0.000000, bitrate: 2000 kb/s']
+    for i in range(n):
+        lines.append('[Parsed_ebur128_0 @ 0x55d0c0a0] t: %-10g TARGET:-23 LUFS    M: %5.1f S: %5.1f     I: %5.1f LUFS       LRA: %5.1f LU' %
+                     (0.1*(i + 1), rng.uniform(-40, -15), rng.uniform(-35, -18), -21.3, 5.2))
+    lines += ['[Parsed_ebur128_0 @ 0x55d0c0a0] Summary:', '',
+              '  Integrated loudness:', '    I:         -21.3 LUFS', '    Threshold: -31.9 LUFS', '',
+              '  Loudness range:', '    LRA:         5.2 LU', '    Threshold: -41.9 LUFS',
+              '    LRA low:   -24.8 LUFS', '    LRA high:  -19.6 LUFS']
+    return '\n'.join(lines) + '\n'
+
+
+def ffprobe_log(n):
+    """The stderr of ffprobe for a file with n lines of metadata before the
+    duration"""
+    lines = ["Input #0, mov,mp4,m4a,3gp,3g2,mj2, from 'lecture.mp4':", '  Metadata:']
+    lines += ['    chapter_%i      : Chapter %i' % (i, i) for i in range(n)]
+    lines += ['  Duration: 01:23:45.67, start: 0.000000, bitrate: 2000 kb/s',
+              '    Stream #0:0(und): Video: h264 (High), yuv420p, 1920x1080, 25 fps',
+              '    Stream #0:1(und): Audio: aac (LC), 48000 Hz, stereo, fltp, 192 kb/s']
+    return '\n'.join(lines) + '\n'
+
+
+def silence_list(n):
+    """A SilenceList of n silences"""
+    times = silence_times(n)
+    return autoscrub.SilenceList([s for s, e in times], [e for s, e in times])
+
+
+def calibrate(repeat=5):
+    """Returns the (best) time taken by a fixed workload of string splitting,
+    float parsing and formatting (the operations that dominate the 
+    benchmarks)"""
+    def workload():
+        total = 0.0
+        for i in range(20000):
+            fields = ('%i:%02i:%06.3f' % (i // 3600, (i // 60) % 60, i % 60 + 0.25)).split(':')
+            total += float(fields[-1])
+        return total
+    return min(timeit.repeat(workload, number=1, repeat=repeat))
+
+
+# The benchmarks, as name: (setup, function), where setup(n) generates the
+# fixture of size n and function(fixture) is timed
+BENCHMARKS = {
+    'findSilences': (silencedetect_log, autoscrub.findSilences),
+    'findLoudness': (ebur128_log, autoscrub.findLoudness),
+    'findDuration': (ffprobe_log, autoscrub.findDuration),
+    'hhmmssd_to_seconds': (lambda n: [autoscrub.seconds_to_hhmmssd(0.37*i) for i in range(n)],
+                           lambda strings: [autoscrub.hhmmssd_to_seconds(s) for s in strings]),
+    'silenceFilterGraph': (silence_list, lambda silences: autoscrub.silenceFilterGraph(silences, 8, hasten_audio='tempo')),
+    'generateFilterGraph': (silence_list, lambda silences: autoscrub.generateFilterGraph(silences, 8, hasten_audio='tempo')),
+}
+
+
+def measure(function, fixture, repeat=3):
+    """Returns the best times taken by function(fixture) and by the 
+    calibration workload, timing them alternately so that a change in the
+    load on the machine affects both"""
+    elapsed = []
+    calibration = []
+    for i in range(repeat):
+        calibration.append(calibrate(repeat=1))
+        elapsed.append(timeit.timeit(lambda: function(fixture), number=1))
+    calibration.append(calibrate(repeat=1))
+    return min(elapsed), min(calibration)
+
+
+def run(names, sizes, repeat=3):
+    """Runs the benchmarks and returns the normalised cost per item as a
+    dictionary of {name: {size: cost}}"""
+    results = {}
+    for name in names:
+        setup, function = BENCHMARKS[name]
+        results[name] = {}
+        for n in sizes:
+            fixture = setup(n)
+            elapsed, calibration = measure(function, fixture, repeat)
+            results[name][str(n)] = elapsed/calibration/n
+            print('%-20s %7i items: %9.2f ms (%.3g per item, calibration %.2f ms)' % 
+                  (name, n, elapsed*1000, results[name][str(n)], calibration*1000))
+    return results
+
+
+def check(results, baseline, tolerance, scaling_limit):
+    """Returns a list of failure messages (pass an empty baseline to only 
+    check the scaling)"""
+    failures = []
+    for name, costs in sorted(results.items()):
+        sizes = sorted(costs, key=int)
+        scaling = costs[sizes[-1]]/costs[sizes[0]]
+        if len(sizes) > 1 and scaling > scaling_limit:
+            failures.append('%s: the cost per item grows %.1fx from %s to %s items (limit %.1fx)' %
+                            (name, scaling, sizes[0], sizes[-1], scaling_limit))
+        for size in sizes:
+            expected = baseline.get(name, {}).get(size)
+            if expected is not None and costs[size] > expected*(1 + tolerance):
+                failures.append('%s: %s items are %.0f%% slower than the baseline (tolerance %.0f%%)' %
+                                (name, size, 100*(costs[size]/expected - 1), 100*tolerance))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('names', nargs='*', metavar='benchmark', help='The benchmarks to run (default all): %s' % ', '.join(sorted(BENCHMARKS)))
+    parser.add_argument('--check-baseline', action='store_true', help='Also fail if the results are slower than the baseline')
+    parser.add_argument('--save-baseline', action='store_true', help='Save the results as the new baseline')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='The baseline file (default %(default)s)')
+    parser.add_argument('--tolerance', type=float, default=1.0, 
+                        help='The allowed slowdown relative to the baseline with --check-baseline, as a fraction (default %(default)s)')
+    parser.add_argument('--scaling-limit', type=float, default=3.0,
+                        help='The allowed growth of the cost per item between the smallest and largest sizes (default %(default)s)')
+    parser.add_argument('--large', action='store_true', help='Also run fixtures 10x larger than the largest default size')
+    parser.add_argument('--repeat', type=int, default=3, help='The number of timings to take the best of (default %(default)s)')
+    args = parser.parse_args(argv)
+
+    names = args.names or sorted(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error('unknown benchmark(s): %s' % ', '.join(unknown))
+    sizes = SIZES + ([10*SIZES[-1]] if args.large else [])
+
+    results = run(names, sizes, args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('Saved the baseline to %s' % args.baseline)
+        return 0
+
+    failures = check(results, baseline if args.check_baseline else {}, args.tolerance, args.scaling_limit)
+    for failure in failures:
+        print('FAIL %s' % failure)
+    if not failures:
+        print('OK')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -104,6 +104,10 @@ setup(
         'requests',
         'subprocess32;python_version<"3.2"',
     ],
+    extras_require={
+        'tune': ['numpy'],
+        'libav': ['av', 'numpy'],
+    },
     entry_points='''
         [console_scripts]
         autoscrub=autoscrub.scripts.cli:cli
@@ -0,0 +1,168 @@
+# Copyright 2017 Russell Anderson, Philip Starkey
+#
+# This file is part of autoscrub.
+#
+# autoscrub is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoscrub is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autoscrub.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the numpy analysis in autoscrub.avbackend (which don't need PyAV).
+
+Run with :code:`python -m pytest tests` or :code:`python -m unittest discover tests`.
+"""
+from __future__ import division, print_function
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from autoscrub import avbackend
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SAMPLE_RATE = 1000
+
+
+def _signal():
+    """Two channels of 20 s at 1 kHz, with silences (below -18 dB) from 3 to
+    4 s (too short), 4.001 to 6.5 s, 10 to 12 s and from 17.5 s to the end
+    (which is only silent in the first channel from 17 s)"""
+    x = np.full((2, 20*SAMPLE_RATE), 0.5, dtype=np.float32)
+    x[:, 3000:6500] = 0.01
+    x[0, 4000] = 0.9
+    x[:, 10000:12000] = 0.0
+    x[0, 17000:] = 0.0
+    x[1, 17500:] = 0.0
+    return x
+
+
+def _feed(analysis, x, seed=0):
+    """Feeds x to analysis in blocks of random sizes"""
+    rng = np.random.RandomState(seed)
+    position = 0
+    while position < x.shape[1]:
+        n = rng.randint(1, 900)
+        analysis.feed([channel[position:position + n] for channel in x])
+        position += n
+    return analysis.close()
+
+
+class SilenceAssertions(object):
+    def assertSilences(self, silences, expected):
+        self.assertEqual(len(silences), len(expected))
+        for silence, (start, end) in zip(silences, expected):
+            self.assertAlmostEqual(silence['silence_start'], start, places=6)
+            if end is None:
+                self.assertNotIn('silence_end', silence)
+            else:
+                self.assertAlmostEqual(silence['silence_end'], end, places=6)
+                self.assertAlmostEqual(silence['silence_duration'], end - start, places=6)
+
+
+@unittest.skipIf(np is None, 'requires numpy')
+class SilenceDetectorTests(SilenceAssertions, unittest.TestCase):
+    def test_known_intervals(self):
+        detector = avbackend.SilenceDetector(SAMPLE_RATE, -18.0, 2.0)
+        self.assertSilences(_feed(detector, _signal()), [(4.001, 6.5), (10.0, 12.0), (17.5, None)])
+
+    def test_independent_of_block_size(self):
+        x = _signal()
+        expected = avbackend.SilenceDetector(SAMPLE_RATE, -18.0, 2.0)
+        expected.feed(list(x))
+        expected = expected.close()
+        for seed in range(5):
+            detector = avbackend.SilenceDetector(SAMPLE_RATE, -18.0, 2.0)
+            self.assertEqual(_feed(detector, x, seed), expected)
+
+    def test_start_time(self):
+        detector = avbackend.SilenceDetector(SAMPLE_RATE, -18.0, 2.0, start_time=1.5)
+        self.assertSilences(_feed(detector, _signal()), [(5.501, 8.0), (11.5, 13.5), (19.0, None)])
+
+    def test_threshold(self):
+        # the 0.01 (-40 dB) section is not silent at -50 dB
+        detector = avbackend.SilenceDetector(SAMPLE_RATE, -50.0, 2.0)
+        self.assertSilences(_feed(detector, _signal()), [(10.0, 12.0), (17.5, None)])
+
+
+class _Namespace(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class _FakeAV(object):
+    """A stand-in for the parts of PyAV used to analyse audio, which decodes
+    x in frames of 1024 samples. The container starts at container_start and
+    the first audio sample is at first_time (both absolute, in seconds)."""
+    time_base = 1000000
+
+    def __init__(self, x, container_start, first_time):
+        self.x = x
+        self.container_start = container_start
+        self.first_time = first_time
+
+    def open(self, filename):
+        codec_context = _Namespace(sample_rate=SAMPLE_RATE, channels=len(self.x), name='pcm_f32le', bit_rate=None)
+        stream = _Namespace(codec_context=codec_context)
+        streams = _Namespace(audio=[stream], video=[])
+        container = _Namespace(streams=streams, duration=None, start_time=int(round(self.container_start*self.time_base)),
+                               decode=lambda stream: self._frames())
+        return _Container(container)
+
+    def _frames(self):
+        for start in range(0, self.x.shape[1], 1024):
+            planes = [np.ascontiguousarray(channel[start:start + 1024]) for channel in self.x]
+            yield _Namespace(format=_Namespace(name='fltp'), planes=planes, samples=len(planes[0]),
+                             sample_rate=SAMPLE_RATE, time=self.first_time + start/SAMPLE_RATE)
+
+
+class _Container(object):
+    def __init__(self, container):
+        self.container = container
+
+    def __enter__(self):
+        return self.container
+
+    def __exit__(self, *args):
+        pass
+
+
+@unittest.skipIf(np is None, 'requires numpy')
+class AnalyseAudioTests(SilenceAssertions, unittest.TestCase):
+    def setUp(self):
+        self.av = avbackend.av
+
+    def tearDown(self):
+        avbackend.av = self.av
+
+    def test_relative_to_container_start(self):
+        # like MPEG-TS, where timestamps start at 1.4 s, with the audio 
+        # starting 0.5 s after the start of the container
+        avbackend.av = _FakeAV(_signal(), container_start=1.4, first_time=1.9)
+        silences, envelope = avbackend.analyseAudio('lecture.ts', -18.0, 2.0, frame_duration=None)
+        self.assertSilences(silences, [(4.501, 7.0), (10.5, 12.5), (18.0, None)])
+
+
+@unittest.skipIf(np is None, 'requires numpy')
+class LevelEnvelopeTests(unittest.TestCase):
+    def test_peak_levels(self):
+        x = _signal()
+        envelope = _feed(avbackend.LevelEnvelope(SAMPLE_RATE, 0.01), x)
+        peaks = np.abs(x).max(axis=0).reshape(-1, 10).max(axis=1)
+        np.testing.assert_allclose(envelope, 20*np.log10(np.maximum(peaks, 1e-10)), rtol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+# Copyright 2017 Russell Anderson, Philip Starkey
+#
+# This file is part of autoscrub.
+#
+# autoscrub is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoscrub is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autoscrub.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the ffmpeg log parser (autoscrub.FFmpegLogParser and the 
+functions built on it), using the logs generated by the benchmarks.
+
+Run with :code:`python -m pytest tests` or :code:`python -m unittest discover tests`.
+"""
+from __future__ import division, print_function
+
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+import autoscrub
+import run_benchmarks
+
+
+def _parse(text, block_size=None):
+    """Feeds text to a new FFmpegLogParser (in blocks of block_size 
+    characters, or all at once) and returns the events"""
+    parser = autoscrub.FFmpegLogParser()
+    events = []
+    if block_size is None:
+        events += parser.feed(text)
+    else:
+        for i in range(0, len(text), block_size):
+            events += parser.feed(text[i:i + block_size])
+    return events + parser.close()
+
+
+def _of_type(events, event_type):
+    return [event for event in events if isinstance(event, event_type)]
+
+
+class FFmpegLogParserTests(unittest.TestCase):
+    def test_silences_interleaved_with_progress(self):
+        # each silencedetect line follows a progress line ending in \r
+        times = run_benchmarks.silence_times(50)
+        events = _parse(run_benchmarks.silencedetect_log(50))
+        silences = _of_type(events, autoscrub.SilenceEvent)
+        self.assertEqual(len(silences), len(times))
+        for silence, (start, end) in zip(silences, times):
+            # the log prints 6 significant figures
+            self.assertEqual(silence.start, float('%g' % start))
+            self.assertEqual(silence.end, float('%g' % end))
+            self.assertEqual(silence.duration, float('%g' % (end - start)))
+        self.assertEqual(len(_of_type(events, autoscrub.SilenceStartEvent)), len(times))
+        self.assertEqual(len(_of_type(events, autoscrub.ProgressEvent)), 2*len(times))
+        self.assertEqual(_of_type(events, autoscrub.DurationEvent), [autoscrub.DurationEvent(99*3600.0)])
+        
+    def test_independent_of_block_size(self):
+        log = run_benchmarks.silencedetect_log(20) + run_benchmarks.ebur128_log(20)
+        expected = _parse(log)
+        for block_size in [1, 7, 100, 4096]:
+            self.assertEqual(_parse(log, block_size), expected)
+            
+    def test_open_trailing_silence(self):
+        log = ('[silencedetect @ 0x1] silence_start: 1.5\n'
+               'size=N/A time=00:00:02.00 bitrate=N/A\r'
+               '[silencedetect @ 0x1] silence_end: 3.5 | silence_duration: 2\n'
+               '[silencedetect @ 0x1] silence_start: 10')
+        parser = autoscrub.FFmpegLogParser()
+        self.assertEqual(parser.feed(log), [autoscrub.SilenceStartEvent(1.5), autoscrub.ProgressEvent(2.0),
+                                            autoscrub.SilenceEvent(1.5, 3.5, 2.0)])
+        # the last line has no newline, so is only parsed by close()
+        self.assertEqual(parser.close(), [autoscrub.SilenceStartEvent(10.0), autoscrub.SilenceEvent(10.0, None, None)])
+        self.assertEqual(autoscrub.findSilences(log), [{'silence_start': 1.5, 'silence_end': 3.5, 'silence_duration': 2.0}, 
+                                                       {'silence_start': 10.0}])
+        
+    def test_silence_end_without_start(self):
+        # the start is worked out from the duration
+        events = _parse('[silencedetect @ 0x1] silence_end: 5 | silence_duration: 1.5\n')
+        self.assertEqual(events, [autoscrub.SilenceEvent(3.5, 5.0, 1.5)])
+        
+    def test_loudness(self):
+        events = _parse(run_benchmarks.ebur128_log(30))
+        frames = _of_type(events, autoscrub.LoudnessFrameEvent)
+        self.assertEqual(len(frames), 30)
+        self.assertAlmostEqual(frames[-1].time, 3.0)
+        self.assertEqual(frames[-1].integrated, -21.3)
+        self.assertEqual(frames[-1].lra, 5.2)
+        summary = _of_type(events, autoscrub.LoudnessSummaryEvent)
+        self.assertEqual(len(summary), 1)
+        self.assertEqual(summary[0].summary['I'], -21.3)
+        self.assertEqual(summary[0].summary['LRA'], 5.2)
+        self.assertEqual(summary[0].summary['LRA high'], -19.6)
+        self.assertEqual(autoscrub.findLoudness(run_benchmarks.ebur128_log(30)), summary[0].summary)
+        
+    def test_duration(self):
+        self.assertAlmostEqual(autoscrub.findDuration(run_benchmarks.ffprobe_log(10)), 5025.67)
+        
+        
+class IterLogEventsTests(unittest.TestCase):
+    def test_events_from_command(self):
+        log = run_benchmarks.silencedetect_log(5)
+        # a stand-in for ffmpeg, which prints the log to stderr
+        command = [sys.executable, '-c', 'import sys; sys.stderr.write(%r)' % log]
+        lines = []
+        events = list(autoscrub.iterLogEvents(command, new_line_callback=lines.append, write_to_terminal=False))
+        self.assertEqual(events, _parse(log))
+        self.assertEqual(''.join(lines).replace('\r\n', '\n'), log)
+        
+        
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+# Copyright 2017 Russell Anderson, Philip Starkey
+#
+# This file is part of autoscrub.
+#
+# autoscrub is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoscrub is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autoscrub.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of autoscrub.SilenceList and autoscrub.optimizeSilences.
+
+Run with :code:`python -m pytest tests` or :code:`python -m unittest discover tests`.
+"""
+from __future__ import division, print_function
+
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+import autoscrub
+import run_benchmarks
+
+
+def _silences(times, open_start=None):
+    return autoscrub.SilenceList([s for s, e in times], [e for s, e in times], open_start=open_start)
+
+
+class SilenceListTests(unittest.TestCase):
+    def assertTimes(self, silences, times, open_start=None):
+        self.assertEqual(list(silences), times)
+        self.assertEqual(list(silences.durations), [e - s for s, e in times])
+        self.assertEqual(silences.open_start, open_start)
+        
+    def test_dicts(self):
+        dicts = [{'silence_start': 1.0, 'silence_end': 4.0, 'silence_duration': 3.0}, {'silence_start': 20.0}]
+        silences = autoscrub.SilenceList.from_silences(dicts)
+        self.assertTimes(silences, [(1.0, 4.0)], 20.0)
+        self.assertEqual(silences.to_dicts(), dicts)
+        self.assertIs(autoscrub.SilenceList.from_silences(silences), silences)
+        
+    def test_iter(self):
+        silences = _silences([(1.0, 4.0), (10.0, 12.0)])
+        iterator = iter(silences)
+        self.assertEqual(next(iterator), (1.0, 4.0))
+        self.assertEqual(list(iterator), [(10.0, 12.0)])
+        
+    def test_mismatched_lengths(self):
+        self.assertRaises(ValueError, autoscrub.SilenceList, [1.0, 2.0], [3.0])
+        
+    def test_merge(self):
+        silences = _silences([(1.0, 2.0), (2.5, 4.0), (10.0, 12.0)], open_start=12.25)
+        self.assertTimes(silences.merge(), [(1.0, 2.0), (2.5, 4.0), (10.0, 12.0)], 12.25)
+        self.assertTimes(silences.merge(0.5), [(1.0, 4.0)], 10.0)
+        # overlapping and contained silences are always merged
+        self.assertTimes(_silences([(1.0, 3.0), (2.0, 4.0), (2.5, 3.5)]).merge(), [(1.0, 4.0)])
+        
+    def test_clip(self):
+        silences = _silences([(1.0, 4.0), (10.0, 12.0)], open_start=20.0)
+        self.assertTimes(silences.clip(3.0, 11.0), [(3.0, 4.0), (10.0, 11.0)])
+        self.assertTimes(silences.clip(11.0), [(11.0, 12.0)], 20.0)
+        self.assertTimes(silences.clip(4.0, 10.0), [])
+        self.assertTimes(silences.clip(25.0), [], 25.0)
+        
+    def test_output_time(self):
+        # 10.5 to 19.5 s is played at double speed, removing 4.5 s
+        silences = _silences([(10.0, 20.0), (30.0, 30.8)])
+        self.assertEqual(silences.removed_time(2, 0.5), 4.5)
+        self.assertEqual(silences.output_duration(40.0, 2, 0.5), 35.5)
+        self.assertEqual(silences.output_time([5.0, 10.5, 15.0, 19.5, 30.4, 40.0], 2, 0.5), 
+                         [5.0, 10.5, 12.75, 15.0, 25.9, 35.5])
+        self.assertEqual(silences.output_time(15.0, 2, 0.5), 12.75)
+        
+    def test_output_time_matches_output_duration(self):
+        silences = run_benchmarks.silence_list(200)
+        duration = silences.ends[-1] + 10
+        times = [0.1*i for i in range(int(10*duration))]
+        output_times = silences.output_time(times, 4)
+        self.assertTrue(all(b > a for a, b in zip(output_times, output_times[1:])))
+        self.assertAlmostEqual(silences.output_time(duration, 4), silences.output_duration(duration, 4), places=6)
+        
+        
+class OptimizeSilencesTests(unittest.TestCase):
+    def test_report(self):
+        # (10, 12) and (12.1, 14) are merged, (20, 20.3) is too short to 
+        # speed up, and only the two longest silences are kept
+        times = [(10.0, 12.0), (12.1, 14.0), (20.0, 20.3), (30.0, 35.0), (40.0, 50.0), (60.0, 62.0)]
+        silences, report = autoscrub.optimizeSilences(_silences(times), 4, delay=0.25, merge_gap=0.2, 
+                                                      max_segments=5, duration=100.0)
+        self.assertEqual(list(silences), [(30.0, 35.0), (40.0, 50.0)])
+        self.assertEqual(report, {'silences': 2, 'merged': 1, 'pruned': 1, 'capped': 2, 'segments': 5,
+                                  'filter_nodes': 23, 'removed_time': 10.5, 'output_duration': 89.5})
+        
+    def test_min_fast_duration(self):
+        times = [(10.0, 10.53), (20.0, 20.55), (30.0, 32.0)]
+        silences, report = autoscrub.optimizeSilences(_silences(times), 4, delay=0.25, min_fast_duration=0.04)
+        self.assertEqual(list(silences), [(20.0, 20.55), (30.0, 32.0)])
+        self.assertEqual(report['pruned'], 1)
+        self.assertIsNone(report['output_duration'])
+        
+    def test_leading_silence_not_capped(self):
+        # the silence at the start of the input does not add a segment
+        times = [(0.0, 5.0), (10.0, 20.0), (30.0, 32.0)]
+        silences, report = autoscrub.optimizeSilences(_silences(times), 4, max_segments=3)
+        self.assertEqual(list(silences), [(0.0, 5.0), (10.0, 20.0)])
+        self.assertEqual((report['capped'], report['segments']), (1, 3))
+        
+    def test_keeps_longest(self):
+        silences = run_benchmarks.silence_list(1000)
+        optimized, report = autoscrub.optimizeSilences(silences, 4, max_segments=201)
+        self.assertEqual((report['merged'], report['pruned'], report['capped']), (0, 0, 900))
+        self.assertEqual((report['silences'], report['segments']), (100, 201))
+        longest = sorted(range(len(silences)), key=lambda i: silences.durations[i], reverse=True)[:100]
+        self.assertEqual(list(optimized), list(silences.take(sorted(longest))))
+        
+    def test_unlimited(self):
+        silences = run_benchmarks.silence_list(1000)
+        optimized, report = autoscrub.optimizeSilences(silences, 4, duration=1e6)
+        self.assertEqual(list(optimized), list(silences))
+        self.assertEqual(report['segments'], 2001)
+        self.assertAlmostEqual(report['output_duration'], silences.output_duration(1e6, 4), places=6)
+        
+        
+if __name__ == '__main__':
+    unittest.main()